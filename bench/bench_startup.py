@@ -0,0 +1,68 @@
+"""CLI起動時間のベンチマーク
+
+`main.py list` と `main.py generate --dry-run` をそれぞれ別プロセスで繰り返し実行し、
+所要時間（最小・中央値・最大）を表示する。重いモジュール（pandas, 各社SDK）を
+起動時に読み込んでいないかの確認に使う。
+
+    uv run python bench/bench_startup.py
+    uv run python bench/bench_startup.py -n 20 --limit 1.0
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+COMMANDS = {
+    "list": ["main.py", "list"],
+    "dry-run": ["main.py", "generate", "--dry-run"],
+}
+
+# 起動時に読み込まれていてはいけないモジュール
+HEAVY_MODULES = ["pandas", "numpy", "openpyxl", "openai", "anthropic", "google.genai"]
+
+
+def measure(args: list[str], repeat: int) -> list[float]:
+    """コマンドをrepeat回実行し、それぞれの所要時間（秒）を返す"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *args], cwd=ROOT, check=True, capture_output=True)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def loaded_heavy_modules(args: list[str]) -> list[str]:
+    """コマンド実行時に読み込まれた重いモジュールを返す（-X importtime の出力から判定）"""
+    result = subprocess.run([sys.executable, "-X", "importtime", *args], cwd=ROOT, check=True, capture_output=True, text=True)
+    imported = {line.rsplit("|", 1)[-1].strip() for line in result.stderr.splitlines() if line.startswith("import time:")}
+    return [name for name in HEAVY_MODULES if name in imported]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--repeat", type=int, default=10, help="各コマンドの実行回数")
+    parser.add_argument("--limit", type=float, default=1.0, help="中央値の上限（秒）。超えたら終了コード1")
+    args = parser.parse_args()
+
+    failed = False
+    for name, command in COMMANDS.items():
+        timings = measure(command, args.repeat)
+        median = statistics.median(timings)
+        heavy = loaded_heavy_modules(command)
+        print(
+            f"{name:8s} min={min(timings):.3f}s median={median:.3f}s max={max(timings):.3f}s"
+            f" heavy_imports={','.join(heavy) or '-'}"
+        )
+        if median > args.limit or heavy:
+            failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+"""ローカルで動くOpenAI互換のスタブサーバー（APIキー・課金なしで生成処理を試す）
+
+/v1/chat/completions だけを実装し、プロンプトから決まる擬似的な回答を返す。
+
+- 通常のリクエスト: プロンプト中の "ChoiceN" ごとに ChoiceN.choice / ChoiceN.reason を持つJSONを返す
+  （出力トークン数は --completion-tokens で指定した値として報告する）
+- 選択スコアリングのリクエスト: 全タスクの回答を "A B B …" の1行で返し、logprobs=True なら回答ごとに A / B の対数確率を返す
+- stream=True のリクエスト: 同じ内容をSSEで分割して返す
+- --fenced を指定すると、Anthropic のように回答を ```json ... ``` で囲んで返す
+
+A を選ぶ確率はプロンプトのハッシュから決まるため、同じプロンプトには常に同じ結果を返す。
+
+    uv run python bench/stub_llm_server.py --port 8900 --latency 0.5
+    uv run python main.py generate -c v1_dce -n 20 --provider openai --base-url http://127.0.0.1:8900/v1
+    uv run python main.py generate -c v1_dce -n 20 --provider openai --base-url http://127.0.0.1:8900/v1 --choice-only
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 選択スコアリングの指示から、対象のタスク番号を読み取る
+SCORE_PATTERN = re.compile(r"((?:Choice\d+、)*Choice\d+) のそれぞれについて")
+CHOICE_PATTERN = re.compile(r'"Choice(\d+)"')
+
+
+def probability_of_a(prompt: str, n: int) -> float:
+    """プロンプトとタスク番号から決まる、A を選ぶ確率（0.05〜0.95）"""
+    digest = hashlib.sha256(f"{n}:{prompt}".encode()).digest()
+    return 0.05 + 0.9 * int.from_bytes(digest[:4], "big") / 2**32
+
+
+def estimate_tokens(text: str) -> int:
+    """トークン数の目安（日本語は1文字あたり約1トークン）"""
+    return max(1, len(text))
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """OpenAI Chat Completions API の最小限の実装"""
+
+    latency = 0.0
+    completion_tokens = 400
+    fenced = False
+
+    def do_POST(self) -> None:
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        time.sleep(self.latency)
+
+        messages = body.get("messages", [])
+        prompt = "\n".join(str(m.get("content", "")) for m in messages)
+        user_prompt = str(messages[-1].get("content", "")) if messages else ""
+
+        score = SCORE_PATTERN.search(user_prompt)
+        if score:
+            tasks = [int(n) for n in re.findall(r"\d+", score.group(1))]
+            content, logprobs, completion_tokens = self._score(prompt, tasks, body.get("top_logprobs", 5))
+            if not body.get("logprobs"):
+                logprobs = None
+        else:
+            content, logprobs, completion_tokens = self._answer(prompt), None, self.completion_tokens
+            if self.fenced:
+                content = f"```json\n{content}\n```"
+
+        usage = {
+            "prompt_tokens": estimate_tokens(prompt),
+            "completion_tokens": completion_tokens,
+            "total_tokens": estimate_tokens(prompt) + completion_tokens,
+        }
+        if body.get("stream"):
+            self._send_stream(body, content, usage)
+        else:
+            self._send_json(
+                {
+                    "id": "stub",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", "stub"),
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": content},
+                            "finish_reason": "stop",
+                            "logprobs": logprobs,
+                        }
+                    ],
+                    "usage": usage,
+                }
+            )
+
+    def _score(self, prompt: str, tasks: list[int], top_logprobs: int) -> tuple[str, dict, int]:
+        """選択スコアリングのリクエストに、タスクごとの回答と、回答ごとの A / B の対数確率を返す"""
+        content = []
+        for i, n in enumerate(tasks):
+            # 2つ目以降の回答は区切りのスペースと1トークンになる
+            prefix = " " if i else ""
+            p = probability_of_a(prompt, n)
+            candidates = [(prefix + "A", math.log(p)), (prefix + "B", math.log(1 - p))]
+            candidates = sorted(candidates, key=lambda c: -c[1])[:top_logprobs]
+            top = [{"token": token, "logprob": logprob, "bytes": None} for token, logprob in candidates]
+            content.append({"token": candidates[0][0], "logprob": candidates[0][1], "bytes": None, "top_logprobs": top})
+        text = "".join(item["token"] for item in content)
+        return text, {"content": content}, len(tasks)
+
+    def _answer(self, prompt: str) -> str:
+        """通常のリクエストに、プロンプト中のタスクごとの選択と理由を返す"""
+        tasks = sorted({int(n) for n in CHOICE_PATTERN.findall(prompt)})
+        result = {}
+        for n in tasks:
+            option = "A" if probability_of_a(prompt, n) >= 0.5 else "B"
+            result[f"Choice{n}.reason"] = f"スタブの回答です（Choice{n}）"
+            result[f"Choice{n}.choice"] = f"{n}{option}"
+        return json.dumps(result, ensure_ascii=False)
+
+    def _send_json(self, payload: dict) -> None:
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, body: dict, content: str, usage: dict) -> None:
+        """SSEで内容を分割して返し、最後のチャンクに usage を付ける"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+
+        def event(choices: list, chunk_usage: dict | None = None) -> None:
+            chunk = {"id": "stub", "object": "chat.completion.chunk", "created": int(time.time())}
+            chunk.update(model=body.get("model", "stub"), choices=choices, usage=chunk_usage)
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+
+        for i in range(0, len(content), 16):
+            event([{"index": 0, "delta": {"content": content[i : i + 16]}, "finish_reason": None}])
+        event([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        event([], usage)
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1", help="待ち受けアドレス")
+    parser.add_argument("--port", type=int, default=8900, help="待ち受けポート")
+    parser.add_argument("--latency", type=float, default=0.0, help="1リクエストあたりの待ち時間（秒）")
+    parser.add_argument("--completion-tokens", type=int, default=400, help="通常のリクエストで報告する出力トークン数")
+    parser.add_argument("--fenced", action="store_true", help="回答を ```json ... ``` で囲んで返す")
+    args = parser.parse_args()
+
+    StubHandler.latency = args.latency
+    StubHandler.completion_tokens = args.completion_tokens
+    StubHandler.fenced = args.fenced
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    print(f"Stub LLM server listening on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,9 +1,22 @@
-"""DCEPersona ライブラリ"""
+"""DCEPersona ライブラリ
 
-from .config import Config, ConfigLoader, create_llm_client
-from .generator import PersonaGenerator
-from .log import logger, setup_logger
-from .output import OutputWriter, can_write
+CLIの起動を速くするため、pandas などの重いモジュールを読み込むサブモジュールは
+属性に初めてアクセスしたときに読み込む。
+"""
+
+from importlib import import_module
+
+# 公開名 -> 定義しているサブモジュール
+_EXPORTS = {
+    "Config": ".config",
+    "ConfigLoader": ".config",
+    "create_llm_client": ".config",
+    "PersonaGenerator": ".generator",
+    "OutputWriter": ".output",
+    "can_write": ".output",
+    "logger": ".log",
+    "setup_logger": ".log",
+}
 
 __all__ = [
     "Config",
@@ -15,3 +28,9 @@ __all__ = [
     "logger",
     "setup_logger",
 ]
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(import_module(_EXPORTS[name], __name__), name)
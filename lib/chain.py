@@ -0,0 +1,332 @@
+"""設定を段としてつなぐ連結パイプライン（ペルソナ生成 → DCE回答を1回の実行で）
+
+v1_nurse の出力Excelを v1_dce の --generate-excel-path で読み直す2回の実行では、Excelの書き込み・読み込みの往復、
+型の欠落（数値が文字列になるなど）があり、1段目がすべて終わるまで2段目を始められない。
+連結パイプラインでは、1段目で生成したペルソナを、そのまま2段目の基本属性としてリクエストに流す。
+
+    [プロデューサー] --q0--> [1段目ワーカー x N] --q1--> [2段目ワーカー x M] ... --result_queue--> [記録（呼び出し元スレッド）]
+
+- 段ごとに PersonaGenerator（設定・LLMクライアント・同時リクエスト数）を持ち、段どうしは時間的に重なって進む
+- 前段で生成エラー・パースエラーになった行は次の段に流さない（次の段の結果にその id は現れない）
+- ペルソナIDは段をまたいで同じ値を使うため、段ごとの出力は id で結合できる
+- 途中の段の結果は列指向の形式（Parquet/Arrow）で保存する（main.py の chain コマンド）
+- 重複プロファイルのまとめ（dedup）とプリフライトは行わない。フェイルファストは段ごとに判定する
+"""
+
+import queue
+import threading
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+import yaml
+
+from lib.log import logger
+from lib.preflight import BatchAbortedError
+
+if TYPE_CHECKING:
+    from lib.generator import PersonaGenerator
+
+# 途中の段の結果を保存できる列指向の形式
+INTERMEDIATE_FORMATS = ("parquet", "arrow")
+
+# 段の終了を知らせる番兵
+_DONE = object()
+
+
+@dataclass
+class StageConfig:
+    """連結パイプラインの1段"""
+
+    config: str  # 設定ディレクトリ（configs/ からの相対パス）
+    workers: int = 4  # この段の同時リクエスト数
+    input_columns: list[str] | None = None  # 前段の出力から基本属性として渡すカラム（Noneは前段の output.columns）
+    # 設定の上書き（provider, model など常駐サーバーのジョブと同じキー）
+    overrides: dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class ChainConfig:
+    """連結パイプラインの定義"""
+
+    name: str
+    stages: list[StageConfig]
+    description: str = ""
+    intermediate_format: str = "parquet"  # 途中の段の結果の保存形式: parquet | arrow
+
+
+def load_chain(path: str | Path) -> ChainConfig:
+    """
+    連結パイプラインの定義（YAML）を読み込む
+
+    Args:
+        path: 定義ファイルのパス
+
+    Returns:
+        ChainConfig: 連結パイプラインの定義
+
+    Raises:
+        FileNotFoundError: 定義ファイルが見つからない場合
+        ValueError: 段がない、または途中の段の保存形式が列指向でない場合
+    """
+    path = Path(path)
+    if not path.exists():
+        raise FileNotFoundError(f"パイプラインの定義が見つかりません: {path}")
+
+    with open(path, encoding="utf-8") as f:
+        raw = yaml.safe_load(f) or {}
+
+    stages = []
+    for stage in raw.get("stages", []):
+        stage = dict(stage)
+        stages.append(
+            StageConfig(
+                config=stage.pop("config"),
+                workers=int(stage.pop("workers", 4)),
+                input_columns=stage.pop("input_columns", None),
+                overrides=stage,
+            )
+        )
+    if not stages:
+        raise ValueError(f"パイプラインに段がありません: {path}")
+
+    chain = ChainConfig(
+        name=raw.get("name", path.stem),
+        stages=stages,
+        description=raw.get("description", ""),
+        intermediate_format=raw.get("intermediate_format", "parquet"),
+    )
+    if chain.intermediate_format not in INTERMEDIATE_FORMATS:
+        raise ValueError(f"未対応の途中結果の形式です: {chain.intermediate_format}（{' | '.join(INTERMEDIATE_FORMATS)}）")
+    return chain
+
+
+def next_base_attributes(
+    persona: dict[str, Any], base_attributes: dict[str, Any], columns: list[str] | None = None
+) -> dict[str, Any]:
+    """
+    前段のペルソナを次の段の基本属性にする
+
+    Args:
+        persona: 前段で生成したペルソナ
+        base_attributes: 前段に渡した基本属性（レスポンスに含まれない属性を補う）
+        columns: 渡すカラム（Noneの場合は id と _ で始まるカラム以外のすべて）
+
+    Returns:
+        dict: 次の段の基本属性（columns の順、前段の出力にないカラムは含めない）
+    """
+    merged = {**base_attributes, **persona}
+    if columns:
+        return {c: merged[c] for c in columns if c != "id" and c in merged}
+    return {k: v for k, v in merged.items() if k != "id" and not k.startswith("_")}
+
+
+@dataclass
+class _StageItem:
+    """段のワーカーに渡す1人分の入力"""
+
+    index: int
+    persona_id: int
+    base_attributes: dict[str, Any]
+
+
+@dataclass
+class _StageResult:
+    """段のワーカーから記録ステージに渡す1人分の結果"""
+
+    stage: int
+    index: int
+    persona: dict[str, Any]
+    error: Exception | None = None
+
+
+class ChainedPipeline:
+    """複数の段の PersonaGenerator をキューでつなぎ、1人ずつ次の段に流して生成するパイプライン"""
+
+    def __init__(
+        self,
+        generators: list["PersonaGenerator"],
+        workers: list[int],
+        input_columns: list[list[str] | None] | None = None,
+        queue_size: int | None = None,
+    ):
+        """
+        ChainedPipelineを初期化
+
+        Args:
+            generators: 段ごとのPersonaGenerator
+            workers: 段ごとのワーカー数（同時リクエスト数）
+            input_columns: 段ごとの、前段の出力から基本属性として渡すカラム（1段目は使わない）
+            queue_size: 各キューの上限（Noneの場合は最大のワーカー数の2倍）
+        """
+        if len(generators) != len(workers):
+            raise ValueError("generators と workers の数が一致しません")
+        self.generators = generators
+        self.workers = workers
+        self.input_columns = input_columns or [None] * len(generators)
+        self.queue_size = queue_size or max(workers) * 2
+        # フェイルファストで中断したら立てる（プロデューサーは先読みを止め、ワーカーはリクエストを送らない）
+        self._stop = threading.Event()
+        # 段ごとの終了したワーカー数（最後のワーカーが次の段に番兵を送る）
+        self._finished = [0] * len(generators)
+        self._lock = threading.Lock()
+
+    def run(
+        self,
+        rows: Iterable[tuple[int, dict[str, Any]]],
+        total: int | None,
+        on_progress: Callable[[int, int, int, dict], None] | None = None,
+    ) -> list[list[dict[str, Any]]]:
+        """
+        1段目の基本属性の行を流し、すべての段で生成する
+
+        Args:
+            rows: (ペルソナID, 基本属性) を返すイテラブル
+            total: 行数（進捗表示用、不明な場合はNone）
+            on_progress: 進捗コールバック (stage, current, total, persona) -> None
+                完了順に呼ばれる（stage は0始まりの段番号）
+
+        Returns:
+            list[list[dict]]: 段ごとのペルソナのリスト（入力の行順）
+
+        Raises:
+            BatchAbortedError: いずれかの段で最初のK件が同じ種類のエラーで失敗した場合
+        """
+        queues: list[queue.Queue] = [queue.Queue(maxsize=self.queue_size) for _ in self.generators]
+        result_queue: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        producer_errors: list[Exception] = []
+
+        threads = [
+            threading.Thread(target=self._produce, args=(rows, queues[0], producer_errors), name="chain-producer", daemon=True)
+        ]
+        for stage, count in enumerate(self.workers):
+            threads += [
+                threading.Thread(
+                    target=self._consume, args=(stage, queues, result_queue), name=f"chain-{stage}-io-{i}", daemon=True
+                )
+                for i in range(count)
+            ]
+        for thread in threads:
+            thread.start()
+
+        logger.info(
+            "Chained pipeline started: stages=%d, workers=%s, queue_size=%d",
+            len(self.generators),
+            self.workers,
+            self.queue_size,
+        )
+
+        results = self._collect(result_queue, total, on_progress)
+
+        for thread in threads:
+            thread.join()
+
+        # 実測した出力トークン数を次回の実行に引き継ぐ
+        for generator in self.generators:
+            if generator.token_budget is not None:
+                generator.token_budget.save()
+
+        if producer_errors:
+            raise producer_errors[0]
+
+        return [[stage_results[i] for i in sorted(stage_results)] for stage_results in results]
+
+    def _produce(
+        self,
+        rows: Iterable[tuple[int, dict[str, Any]]],
+        work_queue: queue.Queue,
+        producer_errors: list[Exception],
+    ) -> None:
+        """1段目の基本属性を読み進めてキューに積む（キューが満杯なら待つ）"""
+        try:
+            for i, (persona_id, base_attrs) in enumerate(rows):
+                if self._stop.is_set():
+                    break
+                work_queue.put(_StageItem(i, persona_id, base_attrs))
+        except Exception as e:
+            logger.error("Chain producer failed: %s", e)
+            producer_errors.append(e)
+        finally:
+            for _ in range(self.workers[0]):
+                work_queue.put(_DONE)
+
+    def _consume(self, stage: int, queues: list[queue.Queue], result_queue: queue.Queue) -> None:
+        """段のキューから取り出して生成し、結果を記録ステージと次の段に渡す"""
+        generator = self.generators[stage]
+        next_queue = queues[stage + 1] if stage + 1 < len(queues) else None
+
+        while True:
+            item = queues[stage].get()
+            if item is _DONE:
+                self._finish(stage, next_queue)
+                result_queue.put(_DONE)
+                return
+
+            if self._stop.is_set():
+                continue
+
+            error = None
+            try:
+                persona = generator.generate_one(item.persona_id, item.base_attributes)
+            except Exception as e:
+                error = e
+                persona = generator._error_persona(item.persona_id, item.base_attributes, e)
+
+            # 次の段の入力が先に進むよう、記録より先に次の段へ渡す
+            if next_queue is not None and error is None and "_parse_error" not in persona:
+                base_attrs = next_base_attributes(persona, item.base_attributes, self.input_columns[stage + 1])
+                next_queue.put(_StageItem(item.index, item.persona_id, base_attrs))
+            result_queue.put(_StageResult(stage, item.index, persona, error))
+
+    def _finish(self, stage: int, next_queue: queue.Queue | None) -> None:
+        """段のワーカーの終了を数え、最後のワーカーなら次の段のワーカーに番兵を送る"""
+        with self._lock:
+            self._finished[stage] += 1
+            last = self._finished[stage] == self.workers[stage]
+        if last and next_queue is not None:
+            for _ in range(self.workers[stage + 1]):
+                next_queue.put(_DONE)
+
+    def _collect(
+        self,
+        result_queue: queue.Queue,
+        total: int | None,
+        on_progress: Callable[[int, int, int, dict], None] | None,
+    ) -> list[dict[int, dict[str, Any]]]:
+        """
+        結果を段ごとに記録する（すべての段のワーカーが終了するまで）
+
+        Raises:
+            BatchAbortedError: いずれかの段で最初のK件が同じ種類のエラーで失敗した場合（残りのキューを捨ててから送出する）
+        """
+        results: list[dict[int, dict[str, Any]]] = [{} for _ in self.generators]
+        finished_workers = 0
+        aborted: BatchAbortedError | None = None
+
+        while finished_workers < sum(self.workers):
+            item = result_queue.get()
+            if item is _DONE:
+                finished_workers += 1
+                continue
+            if aborted is not None:
+                continue
+
+            results[item.stage][item.index] = item.persona
+
+            if on_progress:
+                done = len(results[item.stage])
+                on_progress(item.stage, done, total if total is not None else done, item.persona)
+
+            try:
+                self.generators[item.stage]._check_fail_fast(item.persona, item.error)
+            except BatchAbortedError as e:
+                # すべての段のリクエストを止め、ワーカーが終了するまでキューを読み捨てる
+                logger.error("Aborting chained pipeline at stage %d: %s", item.stage + 1, e)
+                aborted = e
+                self._stop.set()
+
+        if aborted is not None:
+            raise aborted
+
+        return results
@@ -0,0 +1,205 @@
+"""選択だけを確率で求めるモード（理由を生成しない）
+
+大きなDCEパネルで ChoiceN.choice だけが必要な場合に、理由を含むJSON（1人あたり数百トークン）を生成する代わりに、
+すべての選択タスクの回答を "A B B A …" のような短い文字列で1回だけ生成させ、回答の位置ごとのトークンの
+log-probability から、タスクごとに A を選ぶ確率を求める。1人あたり1リクエストで、入力は通常の生成と同じ1回分、
+出力はタスクあたり2トークン程度で済み、サンプリングしたラベルではなく確率が得られる。
+
+- 回答は半角スペースで区切らせ、1つの回答が1トークンになるようにする（"AB" のように複数の回答が
+  1トークンにまとまると、位置ごとの確率を対応付けられない）
+- 回答のトークンの数がタスクの数と合わない場合は、生成された文字列から選択だけを読み取り、確率は空にする
+- log-probability に対応していないクライアント（Anthropic、ヘッジ・フェイルオーバーを挟んだ場合など）では、
+  回答を1回サンプリングし、選んだ方を確率1として記録する
+- 結果は通常の生成と同じ形（JSON文字列のLLMResponse）で返すため、パース・出力・重複まとめの処理はそのまま使える
+"""
+
+import json
+import math
+import re
+from typing import Any
+
+from lib.config import ChoiceScoringConfig
+from lib.llm.base import LLMClient, LLMResponse
+from lib.log import logger
+
+# プロンプトの末尾に付ける回答方法の指示
+SCORE_INSTRUCTION = """
+
+## 回答方法
+今回は理由もJSONも不要です。{tasks} のそれぞれについて、A と B のどちらで働きたいかを順に A か B の1文字で答え、
+半角スペースで区切って1行で出力してください（{count}個、例: {example}）。"""
+
+# 生成された文字列から回答を読み取る
+ANSWER_PATTERN = re.compile(r"[AB]")
+
+# 出力カラムから選択タスクの番号を読み取る（例: Choice3.choice -> 3）
+CHOICE_COLUMN_PATTERN = re.compile(r"^Choice(\d+)\.choice$")
+
+
+def choice_tasks(columns: list[str]) -> list[int]:
+    """
+    出力カラムから選択タスクの番号を求める
+
+    Args:
+        columns: 出力カラム
+
+    Returns:
+        list[int]: タスク番号（出現順）
+    """
+    return [int(m.group(1)) for column in columns if (m := CHOICE_COLUMN_PATTERN.match(column))]
+
+
+def option_of(token: str) -> str | None:
+    """
+    トークンがどちらの選択肢を表すかを返す
+
+    Args:
+        token: 生成された（または候補の）トークン
+
+    Returns:
+        str | None: "A" / "B"（どちらでもなければNone）
+    """
+    text = token.strip().strip("\"'「」").upper()
+    return text if text in ("A", "B") else None
+
+
+def probability_of_a(logprobs: dict[str, float]) -> float | None:
+    """
+    回答の位置の候補トークンの対数確率から、A を選ぶ確率を求める（A と B の2択に正規化する）
+
+    Args:
+        logprobs: 候補トークン -> 対数確率
+
+    Returns:
+        float | None: A を選ぶ確率（候補に A も B もなければNone）
+    """
+    mass = {"A": 0.0, "B": 0.0}
+    for token, logprob in logprobs.items():
+        option = option_of(token)
+        if option:
+            mass[option] += math.exp(logprob)
+    total = mass["A"] + mass["B"]
+    if total == 0:
+        return None
+    return mass["A"] / total
+
+
+def score_instruction(tasks: list[int]) -> str:
+    """
+    すべてのタスクの回答を1行で求める指示を作る
+
+    Args:
+        tasks: タスク番号
+
+    Returns:
+        str: ユーザープロンプトの末尾に付ける指示
+    """
+    example = " ".join("ABBA"[i % 4] for i in range(len(tasks)))
+    return SCORE_INSTRUCTION.format(tasks="、".join(f"Choice{n}" for n in tasks), count=len(tasks), example=example)
+
+
+class ChoiceScorer:
+    """すべての選択タスクの A / B の確率を、1人あたり1回のリクエストで求めるクラス"""
+
+    def __init__(
+        self,
+        llm: LLMClient,
+        system_prompt: str,
+        tasks: list[int],
+        settings: ChoiceScoringConfig,
+        temperature: float = 1.0,
+        extra_params: dict | None = None,
+        fallback_max_tokens: int = 2000,
+    ):
+        """
+        ChoiceScorerを初期化
+
+        Args:
+            llm: LLMクライアント
+            system_prompt: システムプロンプト
+            tasks: 選択タスクの番号
+            settings: 選択スコアリングの設定
+            temperature: サンプリングで回答する場合の temperature
+            extra_params: モデル固有の追加パラメータ
+            fallback_max_tokens: サンプリングで回答する場合の最大トークン数（思考するモデルでは思考の分も含むため大きめにする）
+        """
+        if not tasks:
+            raise ValueError("出力カラムに ChoiceN.choice がないため、選択スコアリングを使えません")
+        self.llm = llm
+        self.system_prompt = system_prompt
+        self.tasks = tasks
+        self.settings = settings
+        self.temperature = temperature
+        self.extra_params = extra_params
+        self.fallback_max_tokens = fallback_max_tokens
+        self._instruction = score_instruction(tasks)
+        self._use_logprobs = True
+
+    def score(self, user_prompt: str) -> LLMResponse:
+        """
+        すべての選択タスクについて A を選ぶ確率を、1回のリクエストで求める
+
+        Args:
+            user_prompt: 構築済みのユーザープロンプト（基本属性と選択肢を含む）
+
+        Returns:
+            LLMResponse: ChoiceN.choice と ChoiceN.prob_A を持つJSON文字列と、そのリクエストの使用量
+                （1回のリクエストの使用量のため、コストレポートのリクエスト数は実際の呼び出し回数と一致する）
+        """
+        prompt = user_prompt + self._instruction
+        probabilities, response = self._score_answers(prompt)
+
+        if probabilities is None:
+            # 回答の位置と確率を対応付けられない場合は、生成された回答から選択だけを記録する
+            answers = ANSWER_PATTERN.findall(response.content.upper())
+            if len(answers) != len(self.tasks):
+                logger.warning("Expected %d answers, got %r", len(self.tasks), response.content[:50])
+            probabilities = [None] * len(self.tasks)
+        else:
+            answers = ["A" if p >= 0.5 else "B" for p in probabilities]
+
+        result: dict[str, Any] = {}
+        for i, n in enumerate(self.tasks):
+            result[f"Choice{n}.choice"] = f"{n}{answers[i]}" if i < len(answers) else None
+            result[f"Choice{n}.prob_A"] = None if probabilities[i] is None else round(probabilities[i], 6)
+
+        return LLMResponse(content=json.dumps(result, ensure_ascii=False), model=response.model, usage=response.usage)
+
+    def _score_answers(self, prompt: str) -> tuple[list[float] | None, LLMResponse]:
+        """
+        全タスクの回答を生成し、タスクごとの A の確率を求める
+
+        log-probability に対応していなければ1回サンプリングし、選んだ方を確率1とする。
+        回答のトークンの数がタスクの数と合わない場合、確率はNoneを返す。
+        """
+        max_tokens = self.settings.max_tokens * len(self.tasks)
+        if self._use_logprobs:
+            try:
+                tokens, response = self.llm.option_logprobs(
+                    system_prompt=self.system_prompt,
+                    user_prompt=prompt,
+                    temperature=self.temperature,
+                    max_tokens=max_tokens,
+                    top_logprobs=self.settings.top_logprobs,
+                    extra_params=self.extra_params,
+                )
+                # 区切りなどの回答でないトークンを除き、回答の位置ごとに確率を求める
+                answers = [probability_of_a(candidates) for token, candidates in tokens if option_of(token)]
+                if len(answers) != len(self.tasks) or None in answers:
+                    return None, response
+                return answers, response
+            except NotImplementedError as e:
+                logger.warning("%s; falling back to sampled answers (prob_A is 0 or 1)", e)
+                self._use_logprobs = False
+
+        response = self.llm.generate(
+            system_prompt=self.system_prompt,
+            user_prompt=prompt,
+            temperature=self.temperature,
+            max_tokens=max(max_tokens, self.fallback_max_tokens),
+            extra_params=self.extra_params,
+        )
+        answers = ANSWER_PATTERN.findall(response.content.upper())
+        if len(answers) != len(self.tasks):
+            return None, response
+        return [1.0 if option == "A" else 0.0 for option in answers], response
@@ -4,10 +4,60 @@ import json
 import os
 from dataclasses import asdict, dataclass, field
 from pathlib import Path
+from typing import Any
 
 import yaml
 
 
+@dataclass
+class AdaptiveTokensConfig:
+    """max_tokens の自動調整設定（lib/token_budget.py参照）"""
+
+    enabled: bool = False
+    percentile: float = 99.0  # 観測した出力トークン数のパーセンタイル
+    margin: float = 0.25  # パーセンタイルに上乗せする割合
+    floor: int = 256  # 自動調整の下限
+    ceiling: int = 32768  # 打ち切り時に引き上げる上限
+    min_samples: int = 10  # この件数が集まるまでは max_tokens をそのまま使う
+    max_retries: int = 2  # 打ち切り時に上限を引き上げて再試行する回数
+
+
+@dataclass
+class HedgeConfig:
+    """ヘッジリクエストの設定（lib/llm/hedged_client.py参照）"""
+
+    enabled: bool = False
+    provider: str = "openai"  # ヘッジ先のプロバイダー
+    model: str = "gpt-4o-mini"  # ヘッジ先のモデル
+    percentile: float = 90.0  # このパーセンタイルのレイテンシを過ぎたらヘッジを送る
+    min_samples: int = 5  # この件数が集まるまでは initial_delay を待つ
+    initial_delay: float = 30.0  # 観測値が少ないうちの待ち時間（秒）
+    thinking_budget: int | None = None  # ヘッジ先の思考トークンの予算（Noneはモデルの既定）
+    reasoning_effort: str | None = None  # ヘッジ先の思考の度合い
+    base_url: str | None = None  # OpenAI互換のAPIサーバーのURL（openaiのみ）
+
+
+@dataclass
+class BackendConfig:
+    """フェイルオーバー先のバックエンド"""
+
+    provider: str = "openai"
+    model: str = "gpt-4o-mini"
+    thinking_budget: int | None = None  # このバックエンドの思考トークンの予算（Noneはモデルの既定）
+    reasoning_effort: str | None = None  # このバックエンドの思考の度合い
+    base_url: str | None = None  # OpenAI互換のAPIサーバーのURL（openaiのみ）
+
+
+@dataclass
+class CircuitBreakerConfig:
+    """フェイルオーバー時のサーキットブレーカー設定（lib/llm/routing_client.py参照）"""
+
+    failure_threshold: int = 3  # この回数連続で失敗したバックエンドを除外する
+    error_rate: float = 0.5  # 直近 window 件のエラー率がこれ以上のバックエンドを除外する
+    window: int = 20  # エラー率を計算する直近のリクエスト数
+    cooldown: float = 30.0  # 除外したバックエンドを再び試すまでの秒数
+
+
 @dataclass
 class LLMConfig:
     """LLM設定"""
@@ -17,6 +67,14 @@ class LLMConfig:
     temperature: float = 1.0
     max_tokens: int = 2000
     extra_params: dict = field(default_factory=dict)
+    stream: bool = False  # レスポンスをストリーミングで受け取り、形式外れを早期に打ち切る
+    thinking_budget: int | None = None  # 思考トークンの予算（0で思考なし、Noneはモデルの既定）
+    reasoning_effort: str | None = None  # 思考の度合い（minimal | low | medium | high）
+    base_url: str | None = None  # OpenAI互換のAPIサーバー（ローカルのスタブなど）のURL（openaiのみ）
+    adaptive_max_tokens: AdaptiveTokensConfig = field(default_factory=AdaptiveTokensConfig)
+    hedge: HedgeConfig = field(default_factory=HedgeConfig)
+    fallbacks: list[BackendConfig] = field(default_factory=list)  # 失敗時に優先順で切り替えるバックエンド
+    circuit_breaker: CircuitBreakerConfig = field(default_factory=CircuitBreakerConfig)
 
 
 @dataclass
@@ -25,6 +83,9 @@ class SamplingConfig:
 
     seed: int = 42
     attributes: list[str] = field(default_factory=list)
+    method: str = "sequential"  # sequential | stratified（構成比を割当どおりに） | per_id（IDごとの乱数列）
+    dedup: bool = False  # 同じ基本属性の行はプロファイルごとにまとめて生成する（lib/dedup.py参照）
+    samples_per_profile: int = 3  # dedup時、プロファイルごとに生成する件数（temperature = 0 なら1件）
 
 
 @dataclass
@@ -35,6 +96,97 @@ class OutputConfig:
     columns: list[str] = field(default_factory=list)
 
 
+@dataclass
+class PromptConfig:
+    """プロンプトへの埋め込み形式（lib/prompt_format.py参照）"""
+
+    profile_format: str = "list"  # {base_attributes} の形式: list | compact | json
+    choice_format: str = "json"  # {choice_sets} の形式: json | json_min | markdown | matrix
+    choices_file: str | None = None  # {choice_sets} に埋め込む選択肢のJSON（設定ディレクトリからの相対パス）
+
+
+@dataclass
+class ValidationConfig:
+    """生成結果の整合性チェックの設定（lib/validation.py参照）"""
+
+    rules_file: str | None = None  # ルールのYAML（設定ディレクトリからの相対パス）
+    max_rounds: int = 2  # 違反した行を作り直す最大回数
+    numeric: list[str] = field(default_factory=list)  # rules_file から読み込んだ、数値として評価するカラム
+    rules: list[dict[str, Any]] = field(default_factory=list)  # rules_file から読み込んだルール
+
+
+@dataclass
+class DiversityConfig:
+    """近似重複の検出の設定（lib/diversity.py参照）"""
+
+    columns: list[str] = field(
+        default_factory=list
+    )  # ペルソナ単位で比べるカラム（空は output.columns のうち id・基本属性以外）
+    text_columns: list[str] = field(default_factory=list)  # 1セルずつ比べる自由記述のカラム（ChoiceN.reason など）
+    threshold: float = 0.8  # 重複とする Jaccard 係数（文字n-gramの集合の重なり）の下限
+    ngram: int = 3  # n-gramの文字数
+    num_perm: int = 128  # MinHash の署名の長さ（2のべき乗）
+    bands: int = 16  # LSH の帯の数（num_perm を割り切る数。多いほど低い類似度の組も候補になる）
+
+
+@dataclass
+class RepairConfig:
+    """欠けた・不正なフィールドだけを補う設定（lib/repair.py参照）"""
+
+    enabled: bool = False
+    max_attempts: int = 1  # 1人あたりの補完リクエストの最大回数
+    max_fields: int = 10  # これより多く欠けている場合は補わない（全体を生成し直す方が確実）
+    max_tokens: int = 1024  # 補完リクエストの出力トークンの上限
+    use_rules: bool = True  # 整合性ルール（validation.rules_file）に違反したフィールドも補う
+
+
+@dataclass
+class ChoiceScoringConfig:
+    """選択だけを確率で求めるモードの設定（lib/choice_scoring.py参照）"""
+
+    enabled: bool = False
+    top_logprobs: int = 5  # 回答の位置ごとに候補として受け取るトークンの数
+    max_tokens: int = 2  # 1タスクあたりの出力トークン数（回答と区切り。リクエストの上限はタスク数倍）
+
+
+@dataclass
+class EstimationConfig:
+    """選好の異質性の推定の設定（lib/estimation.py参照）"""
+
+    covariates: list[str] = field(default_factory=list)  # 共変量（ペルソナの属性のカラム）
+    coding: dict[str, dict[str, float]] = field(default_factory=dict)  # 属性 -> {水準: 数値}（ないものはダミー変数）
+    reference: dict[str, str] = field(default_factory=dict)  # 属性 -> ダミー変数の参照水準
+    random: list[str] | None = None  # 個人差を推定する説明変数（Noneは全説明変数）
+    n_draws: int = 200  # 混合ロジットの1人あたりの Halton ドロー数
+    n_classes: int = 2  # 潜在クラスロジットのクラス数
+    max_iter: int = 500  # 最適化（潜在クラスはEM）の最大反復回数
+
+
+@dataclass
+class ThemesConfig:
+    """理由文のテーマ分類の設定（lib/themes.py参照）"""
+
+    n_themes: int = 12  # テーマ数
+    ngrams: list[int] = field(default_factory=lambda: [2, 3])  # 特徴量にする n-gram の文字数
+    n_features: int = 262144  # n-gram を振り分けるハッシュの次元数
+    batch_size: int = 8192  # TF-IDF を作り、k-means を更新する1ミニバッチの件数
+    epochs: int = 3  # k-means で全件を読む回数
+    keywords: int = 8  # テーマごとのキーワードの数
+
+
+@dataclass
+class SimulationConfig:
+    """政策シナリオのシミュレーションの設定（lib/simulation.py参照）"""
+
+    scenarios_file: str | None = None  # シナリオのYAML（設定ディレクトリからの相対パス）
+    model: str = "mixed"  # 使う推定結果: pooled | mixed | latent_class
+    population_columns: dict[str, str] = field(default_factory=dict)  # 推定に使ったカラム -> 母集団のカラム
+    segments: list[str] = field(default_factory=list)  # 選択率の内訳を求める母集団のカラム
+    baseline: dict[str, str] = field(default_factory=dict)  # scenarios_file から読み込んだ現状の職場の水準
+    grid: dict[str, list[str]] = field(default_factory=dict)  # scenarios_file から読み込んだ属性ごとの水準
+    scenarios: list[dict[str, Any]] = field(default_factory=list)  # scenarios_file から読み込んだ名前付きシナリオ
+
+
 @dataclass
 class Config:
     """設定全体を保持するクラス"""
@@ -48,6 +200,15 @@ class Config:
     user_prompt: str
     config_dir: Path
     generate_excel_path: str | None = None
+    choice_scoring: ChoiceScoringConfig = field(default_factory=ChoiceScoringConfig)
+    prompt: PromptConfig = field(default_factory=PromptConfig)
+    validation: ValidationConfig = field(default_factory=ValidationConfig)
+    repair: RepairConfig = field(default_factory=RepairConfig)
+    diversity: DiversityConfig = field(default_factory=DiversityConfig)
+    estimation: EstimationConfig = field(default_factory=EstimationConfig)
+    simulation: SimulationConfig = field(default_factory=SimulationConfig)
+    themes: ThemesConfig = field(default_factory=ThemesConfig)
+    choice_sets: list[dict[str, Any]] = field(default_factory=list)  # prompt.choices_file から読み込んだ選択肢
 
     def to_json(self, indent: int | None = 2) -> str:
         """設定をJSON文字列として返す"""
@@ -93,6 +254,14 @@ class ConfigLoader:
             temperature=llm_raw.get("temperature", 1.0),
             max_tokens=llm_raw.get("max_tokens", 2000),
             extra_params=llm_raw.get("extra_params", {}),
+            stream=llm_raw.get("stream", False),
+            thinking_budget=llm_raw.get("thinking_budget"),
+            reasoning_effort=llm_raw.get("reasoning_effort"),
+            base_url=llm_raw.get("base_url"),
+            adaptive_max_tokens=AdaptiveTokensConfig(**(llm_raw.get("adaptive_max_tokens") or {})),
+            hedge=HedgeConfig(**(llm_raw.get("hedge") or {})),
+            fallbacks=[BackendConfig(**backend) for backend in llm_raw.get("fallbacks") or []],
+            circuit_breaker=CircuitBreakerConfig(**(llm_raw.get("circuit_breaker") or {})),
         )
 
         # サンプリング設定
@@ -100,6 +269,9 @@ class ConfigLoader:
         sampling_config = SamplingConfig(
             seed=sampling_raw.get("seed", 42),
             attributes=sampling_raw.get("attributes", []),
+            method=sampling_raw.get("method", "sequential"),
+            dedup=sampling_raw.get("dedup", False),
+            samples_per_profile=sampling_raw.get("samples_per_profile", 3),
         )
 
         # 出力設定
@@ -109,6 +281,30 @@ class ConfigLoader:
             columns=output_raw.get("columns", []),
         )
 
+        # プロンプトの埋め込み形式
+        prompt_config = PromptConfig(**(raw_config.get("prompt") or {}))
+        choice_sets = []
+        if prompt_config.choices_file:
+            with open(config_dir / prompt_config.choices_file, encoding="utf-8") as f:
+                choice_sets = json.load(f)
+
+        # 整合性チェックのルール
+        validation_config = ValidationConfig(**(raw_config.get("validation") or {}))
+        if validation_config.rules_file:
+            with open(config_dir / validation_config.rules_file, encoding="utf-8") as f:
+                rules_raw = yaml.safe_load(f) or {}
+            validation_config.numeric = rules_raw.get("numeric", [])
+            validation_config.rules = rules_raw.get("rules", [])
+
+        # 政策シナリオ
+        simulation_config = SimulationConfig(**(raw_config.get("simulation") or {}))
+        if simulation_config.scenarios_file:
+            with open(config_dir / simulation_config.scenarios_file, encoding="utf-8") as f:
+                scenarios_raw = yaml.safe_load(f) or {}
+            simulation_config.baseline = scenarios_raw.get("baseline", {})
+            simulation_config.grid = scenarios_raw.get("grid", {})
+            simulation_config.scenarios = scenarios_raw.get("scenarios", [])
+
         return Config(
             name=raw_config.get("name", "unnamed"),
             description=raw_config.get("description", ""),
@@ -118,6 +314,15 @@ class ConfigLoader:
             system_prompt=system_prompt,
             user_prompt=user_prompt,
             config_dir=config_dir,
+            choice_scoring=ChoiceScoringConfig(**(raw_config.get("choice_scoring") or {})),
+            prompt=prompt_config,
+            choice_sets=choice_sets,
+            validation=validation_config,
+            repair=RepairConfig(**(raw_config.get("repair") or {})),
+            diversity=DiversityConfig(**(raw_config.get("diversity") or {})),
+            estimation=EstimationConfig(**(raw_config.get("estimation") or {})),
+            simulation=simulation_config,
+            themes=ThemesConfig(**(raw_config.get("themes") or {})),
         )
 
     @staticmethod
@@ -146,37 +351,119 @@ class ConfigLoader:
         return [d.name for d in configs_path.iterdir() if d.is_dir() and (d / "config.yaml").exists()]
 
 
+def apply_job_overrides(config: Config, job: dict[str, Any]) -> None:
+    """ジョブ（常駐サーバーのジョブ・パイプラインの段）の指定で設定を上書きする（generate コマンドの apply_overrides に対応）"""
+    _apply_llm_job_overrides(config.llm, job)
+    if job.get("format"):
+        config.output.format = job["format"]
+    if job.get("choice_only"):
+        config.choice_scoring.enabled = True
+    if job.get("repair"):
+        config.repair.enabled = True
+    if job.get("dedup"):
+        config.sampling.dedup = True
+    if job.get("samples_per_profile"):
+        config.sampling.samples_per_profile = int(job["samples_per_profile"])
+    if job.get("sampling_method"):
+        config.sampling.method = job["sampling_method"]
+
+
+def _apply_llm_job_overrides(llm: LLMConfig, job: dict[str, Any]) -> None:
+    """ジョブの指定でLLM設定を上書きする"""
+    if job.get("provider"):
+        llm.provider = job["provider"]
+    if job.get("model"):
+        llm.model = job["model"]
+    if job.get("stream"):
+        llm.stream = True
+    if job.get("thinking_budget") is not None:
+        llm.thinking_budget = int(job["thinking_budget"])
+    if job.get("reasoning_effort"):
+        llm.reasoning_effort = job["reasoning_effort"]
+    if job.get("base_url"):
+        llm.base_url = job["base_url"]
+
+
 def create_llm_client(llm_config: LLMConfig):
     """
     LLM設定からクライアントを作成する（ファクトリ関数）
 
+    フェイルオーバー先が設定されている場合は RoutingClient で束ね、
+    ヘッジが有効な場合はさらにヘッジ先のクライアントと組み合わせた HedgedClient を返す。
+
     Args:
         llm_config: LLM設定
 
     Returns:
         LLMClient: 対応するLLMクライアント
     """
-    from lib.llm import AnthropicClient, GeminiClient, OpenAIClient
+    client = _create_provider_client(llm_config)
+
+    if llm_config.fallbacks:
+        from lib.llm.routing_client import RoutingClient
+
+        breaker = llm_config.circuit_breaker
+        client = RoutingClient(
+            [
+                client,
+                *(_create_provider_client(backend) for backend in llm_config.fallbacks),
+            ],
+            failure_threshold=breaker.failure_threshold,
+            error_rate=breaker.error_rate,
+            window=breaker.window,
+            cooldown=breaker.cooldown,
+        )
+
+    hedge = llm_config.hedge
+    if not hedge.enabled:
+        return client
+
+    from lib.llm.hedged_client import HedgedClient
+
+    return HedgedClient(
+        primary=client,
+        secondary=_create_provider_client(hedge),
+        percentile=hedge.percentile,
+        min_samples=hedge.min_samples,
+        initial_delay=hedge.initial_delay,
+    )
+
+
+def _create_provider_client(backend: LLMConfig | BackendConfig | HedgeConfig):
+    """
+    1つのプロバイダー・モデルのクライアントを作成する
 
-    provider = llm_config.provider.lower()
+    Args:
+        backend: provider, model, thinking_budget, reasoning_effort, base_url を持つ設定
+    """
+    # 使用するプロバイダーのSDKだけを読み込む
+    provider = backend.provider.lower()
+    thinking = {"thinking_budget": backend.thinking_budget, "reasoning_effort": backend.reasoning_effort}
 
     if provider == "openai":
-        api_key = os.getenv("OPENAI_API_KEY")
+        # ローカルのOpenAI互換サーバーはAPIキーを確認しないことが多い
+        api_key = os.getenv("OPENAI_API_KEY") or ("local" if backend.base_url else None)
         if not api_key:
             raise ValueError("OPENAI_API_KEY が設定されていません")
-        return OpenAIClient(api_key=api_key, model=llm_config.model)
+        from lib.llm.openai_client import OpenAIClient
+
+        return OpenAIClient(api_key=api_key, model=backend.model, base_url=backend.base_url, **thinking)
 
     elif provider == "anthropic":
         api_key = os.getenv("ANTHROPIC_API_KEY")
         if not api_key:
             raise ValueError("ANTHROPIC_API_KEY が設定されていません")
-        return AnthropicClient(api_key=api_key, model=llm_config.model)
+        from lib.llm.anthropic_client import AnthropicClient
+
+        return AnthropicClient(api_key=api_key, model=backend.model, **thinking)
 
     elif provider == "gemini":
         api_key = os.getenv("GEMINI_PAY_API_KEY")
         if not api_key:
             raise ValueError("GEMINI_PAY_API_KEY が設定されていません")
-        return GeminiClient(api_key=api_key, model=llm_config.model)
+        from lib.llm.gemini_client import GeminiClient
+
+        return GeminiClient(api_key=api_key, model=backend.model, **thinking)
 
     else:
         raise ValueError(f"未対応のプロバイダー: {provider}")
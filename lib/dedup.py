@@ -0,0 +1,88 @@
+"""同じ基本属性を持つ行の生成をまとめる（重複プロファイルの除去）
+
+サンプリングする基本属性は粗いカテゴリが9つだけのため、大きなサンプルには基本属性がまったく同じ行が多く含まれる。
+基本属性の組み合わせ（プロファイル）ごとに最大k件だけをLLMで生成し、残りの重複行にはその生成結果を割り当てる。
+LLMの呼び出し回数は行数ではなくユニークなプロファイル数に比例し、出力は回答者ごとに1行のまま保たれる。
+
+- temperature > 0 の場合はプロファイルごとにk件生成し、重複行には順番に割り当てる（回答のばらつきを残す）
+- temperature = 0 の場合は生成結果が同じになるため、プロファイルごとに1件だけ生成する
+- 割り当てた行には生成元のIDを _source_id として記録する
+"""
+
+import hashlib
+import json
+from collections.abc import Iterable
+from typing import Any
+
+from lib.log import logger
+
+
+def profile_key(base_attributes: dict[str, Any]) -> str:
+    """
+    基本属性の組み合わせを表すハッシュ値を返す
+
+    Args:
+        base_attributes: 基本属性
+
+    Returns:
+        str: 属性名と値から求めたハッシュ値（キーの順序によらない）
+    """
+    text = json.dumps(base_attributes, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class DedupPlan:
+    """どの行をLLMで生成し、どの行に生成結果を割り当てるかの計画"""
+
+    def __init__(self, rows: Iterable[tuple[int, dict[str, Any]]], samples_per_profile: int):
+        """
+        DedupPlanを作成
+
+        Args:
+            rows: (ペルソナID, 基本属性) のイテラブル
+            samples_per_profile: プロファイルごとにLLMで生成する件数
+        """
+        self.rows = list(rows)
+        self.samples_per_profile = max(1, samples_per_profile)
+
+        # プロファイルごとの行番号（出現順）
+        self._groups: dict[str, list[int]] = {}
+        for index, (_, base_attrs) in enumerate(self.rows):
+            self._groups.setdefault(profile_key(base_attrs), []).append(index)
+
+        generate_indices = sorted(index for group in self._groups.values() for index in group[: self.samples_per_profile])
+        self.requests = [self.rows[index] for index in generate_indices]
+
+        logger.info(
+            "Dedup: %d rows, %d unique profiles, %d requests (samples_per_profile=%d)",
+            len(self.rows),
+            len(self._groups),
+            len(self.requests),
+            self.samples_per_profile,
+        )
+
+    def expand(self, personas: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """
+        生成したペルソナを重複行に割り当て、全行分のペルソナを返す
+
+        Args:
+            personas: self.requests の各行について生成したペルソナ
+
+        Returns:
+            list[dict]: 全行分のペルソナ（元の行順）
+        """
+        by_id = {persona["id"]: persona for persona in personas}
+        results: list[dict[str, Any] | None] = [None] * len(self.rows)
+
+        for group in self._groups.values():
+            samples = [by_id[self.rows[index][0]] for index in group[: self.samples_per_profile]]
+            for index, sample in zip(group, samples, strict=False):
+                results[index] = sample
+
+            # 失敗した生成結果は、成功したものがあれば割り当てない
+            usable = [s for s in samples if "_error" not in s and "_parse_error" not in s] or samples
+            for j, index in enumerate(group[self.samples_per_profile :]):
+                source = usable[j % len(usable)]
+                results[index] = {**source, "id": self.rows[index][0], "_source_id": source["id"]}
+
+        return results
@@ -0,0 +1,383 @@
+"""近似重複の検出（文字n-gramの MinHash と LSH で、ほぼ同じペルソナ・理由文を探す）
+
+temperature 0.7 でも、ほぼ同じペルソナや、ChoiceN.reason のコピー＆ペーストのような理由文がしばしば生成され、
+パネルの多様性が下がる。すべての組み合わせを比べると件数の2乗の時間がかかるため、
+文字n-gramの集合を MinHash の署名にし、LSH（署名の帯ごとのバケット）で候補の組だけを比べる。
+
+- 日本語は単語に分けずに、正規化（NFKC、空白の除去）した文字列の文字n-gram（既定は3文字）で比べる
+- 署名は1つのハッシュを num_perm 個のビンに振り分ける One Permutation Hashing（空のビンは隣のビンで埋める）で作る。
+  n-gramの数に比例する時間で、10万件以上でもほぼ線形に処理できる
+- 署名は一定件数のブロックごとに作り、帯のキーと、一致率の計算用に下位16ビットだけを残す（100万件で約400MB）
+- 署名を bands 個の帯に分け、いずれかの帯が一致した組を候補にする。候補は署名の一致率（Jaccard係数の推定値）が
+  threshold 以上のものだけを重複とし、重複でつながった件を1つのグループにする
+- グループで最初に現れた件を代表とし、それ以外の件を近似重複として扱う（作り直しの対象）
+- ペルソナ単位（columns を連結した文字列）と、自由記述のカラムの1セル単位（text_columns、カラムをまたいで比べる）で検出する
+"""
+
+import re
+import unicodedata
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from lib.log import logger
+
+# ペルソナ単位の件のカラム名
+PERSONA = "ペルソナ"
+
+# 作り直すときにユーザープロンプトの末尾に付ける指示
+DIVERSITY_HINT = """
+
+## 追加の依頼
+前回の生成内容は、ほかの人物のものとほぼ同じでした。次の内容と同じ言い回しを避け、
+この人物の基本属性に固有の事情を反映した、異なる内容にしてください。
+{examples}"""
+
+# 文字列の区切り（正規化で除かれる制御文字）
+_SEPARATOR = "\x00"
+_STRIP = re.compile(r"[\s\x00-\x1f\x7f]+")
+_MASK64 = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+# 署名を作る1ブロックの件数（ブロック内の n-gram・署名の一時配列の大きさを決める）
+BLOCK_SIZE = 20_000
+
+
+@dataclass
+class DuplicateReport:
+    """近似重複の検出結果（1件 = ペルソナ1行、または自由記述のカラムの1セル）"""
+
+    rows: np.ndarray  # 件の行番号（df の位置）
+    columns: np.ndarray  # 件のカラム（ペルソナ単位は PERSONA）
+    texts: list[str]  # 比べた文字列
+    representative: np.ndarray  # 同じグループの代表（最初に現れた件）の位置。重複がなければ自身
+
+    @property
+    def flagged(self) -> np.ndarray:
+        """近似重複の件（代表以外）の真偽値"""
+        return self.representative != np.arange(len(self.representative))
+
+
+def normalize(text: Any) -> str:
+    """比較用に文字列を正規化する（NFKC、空白・制御文字の除去、欠損は空文字列）"""
+    if text is None or (isinstance(text, float) and np.isnan(text)):
+        return ""
+    return _STRIP.sub("", unicodedata.normalize("NFKC", str(text)))
+
+
+def _mix(x: np.ndarray) -> np.ndarray:
+    """64ビットのハッシュをかき混ぜる（splitmix64 の最終段、桁あふれは切り捨て）"""
+    x = x ^ (x >> np.uint64(30))
+    x = x * np.uint64(0xBF58476D1CE4E5B9)
+    x = x ^ (x >> np.uint64(27))
+    x = x * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def shingle_hashes(texts: list[str], ngram: int = 3) -> tuple[np.ndarray, np.ndarray]:
+    """
+    文字列ごとの文字n-gramのハッシュを求める（すべての文字列を連結して配列演算で求める）
+
+    Args:
+        texts: 正規化した文字列
+        ngram: n-gramの文字数
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: n-gramのハッシュと、その n-gram の文字列の番号
+            （ngram 文字に満たない文字列の n-gram はない）
+    """
+    codes = np.frombuffer((_SEPARATOR.join(texts) + _SEPARATOR).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    separators = codes == 0
+    owner = np.cumsum(separators) - separators
+    count = len(codes) - ngram + 1
+    if count <= 0:
+        return np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int64)
+
+    hashes = np.zeros(count, dtype=np.uint64)
+    spans = np.zeros(count, dtype=np.int64)
+    for offset in range(ngram):
+        hashes = hashes * np.uint64(0x100000001B3) + codes[offset : offset + count]
+        spans += separators[offset : offset + count]
+    # 区切りをまたぐ n-gram は除く
+    valid = spans == 0
+    return _mix(hashes[valid]), owner[:count][valid]
+
+
+def minhash_signatures(texts: list[str], ngram: int = 3, num_perm: int = 128) -> tuple[np.ndarray, np.ndarray]:
+    """
+    文字列ごとの MinHash の署名を求める（One Permutation Hashing）
+
+    Args:
+        texts: 正規化した文字列
+        ngram: n-gramの文字数
+        num_perm: 署名の長さ（2のべき乗）
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: (文字列, num_perm) の署名と、n-gramを持つ文字列の真偽値
+    """
+    if num_perm & (num_perm - 1):
+        raise ValueError(f"num_perm は2のべき乗を指定してください: {num_perm}")
+    hashes, owner = shingle_hashes(texts, ngram)
+    bits = np.uint64(64 - num_perm.bit_length() + 1)
+    empty = np.iinfo(np.uint64).max
+
+    signatures = np.full(len(texts) * num_perm, empty, dtype=np.uint64)
+    np.minimum.at(
+        signatures, owner * num_perm + (hashes >> bits).astype(np.int64), hashes & (_MASK64 >> (np.uint64(64) - bits))
+    )
+    signatures = signatures.reshape(len(texts), num_perm)
+    valid = (signatures != empty).any(axis=1)
+
+    # 空のビンは右隣（循環）の空でないビンの値で埋める（距離ごとに値をずらし、偶然の一致を避ける）
+    positions = np.arange(num_perm, dtype=np.int16)
+    filled = np.where(signatures != empty, positions, np.int16(2 * num_perm))
+    filled = np.concatenate([filled, filled + np.int16(num_perm)], axis=1)
+    nearest = np.minimum.accumulate(filled[:, ::-1], axis=1)[:, ::-1][:, :num_perm]
+    distance = np.minimum(nearest - positions, num_perm).astype(np.uint64)
+    signatures = np.take_along_axis(signatures, nearest % np.int16(num_perm), axis=1)
+    signatures += distance * np.uint64(0x9E3779B97F4A7C15)
+    return signatures, valid
+
+
+def band_keys(signatures: np.ndarray, bands: int) -> np.ndarray:
+    """
+    署名を帯に分け、帯ごとの値を1つのキーにまとめる
+
+    Args:
+        signatures: (件, num_perm) の署名
+        bands: 帯の数（num_perm を割り切ること）
+
+    Returns:
+        np.ndarray: (件, bands) の帯のキー
+    """
+    n, num_perm = signatures.shape
+    if num_perm % bands:
+        raise ValueError(f"bands は num_perm（{num_perm}）を割り切る数を指定してください: {bands}")
+    width = num_perm // bands
+    keys = np.zeros((n, bands), dtype=np.uint64)
+    for offset in range(width):
+        keys = _mix(keys * np.uint64(0x100000001B3) + signatures[:, offset::width])
+    return keys
+
+
+def signature_index(
+    texts: list[str], ngram: int = 3, num_perm: int = 128, bands: int = 16, block_size: int = BLOCK_SIZE
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    文字列をブロックごとに署名にし、LSH の帯のキーと、一致率の計算用の署名を求める
+
+    Args:
+        texts: 正規化した文字列
+        ngram: n-gramの文字数
+        num_perm: 署名の長さ
+        bands: LSH の帯の数
+        block_size: 1ブロックの件数
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: (件, bands) の帯のキー、(件, num_perm) の署名の下位16ビット、
+            n-gramを持つ文字列の真偽値
+    """
+    keys = np.empty((len(texts), bands), dtype=np.uint64)
+    short = np.empty((len(texts), num_perm), dtype=np.uint16)
+    valid = np.empty(len(texts), dtype=bool)
+    for lo in range(0, len(texts), block_size):
+        block = slice(lo, lo + block_size)
+        signatures, valid[block] = minhash_signatures(texts[block], ngram, num_perm)
+        keys[block] = band_keys(signatures, bands)
+        short[block] = signatures.astype(np.uint16)
+    return keys, short, valid
+
+
+def lsh_candidates(keys: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    いずれかの帯のキーが一致する件の組を求める
+
+    バケットごとに先頭の件と残りの件を組にするため、組の数は件数にほぼ比例する。
+
+    Args:
+        keys: (件, bands) の帯のキー
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: 組の位置 (a, b)、a < b、重複なし
+    """
+    n = len(keys)
+    positions = np.arange(n)
+    pairs = []
+    for band in np.ascontiguousarray(keys.T):
+        # ハッシュ表でバケットに分け、バケットで最初に現れた件を先頭にする（並べ替えより速い）
+        codes, buckets = pd.factorize(band)
+        head = np.empty(len(buckets), dtype=np.int64)
+        head[codes[::-1]] = positions[::-1]
+        head = head[codes]
+        member = head != positions
+        pairs.append(np.stack([head[member], positions[member]], axis=1))
+
+    pairs = np.concatenate(pairs) if pairs else np.empty((0, 2), dtype=np.int64)
+    pairs = np.unique(pairs[:, 0] * n + pairs[:, 1])
+    return pairs // n, pairs % n
+
+
+def connected_representatives(n: int, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """組でつながった件のグループごとに、最小の位置を代表として返す（ラベル伝播とポインタジャンプ）"""
+    labels = np.arange(n)
+    while True:
+        low = np.minimum(labels[a], labels[b])
+        updated = labels.copy()
+        np.minimum.at(updated, a, low)
+        np.minimum.at(updated, b, low)
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+
+def near_duplicates(
+    texts: list[str], threshold: float = 0.8, ngram: int = 3, num_perm: int = 128, bands: int = 16
+) -> np.ndarray:
+    """
+    近似重複のグループを求める
+
+    Args:
+        texts: 正規化した文字列
+        threshold: 重複とする Jaccard 係数（署名の一致率）の下限
+        ngram: n-gramの文字数
+        num_perm: 署名の長さ
+        bands: LSH の帯の数
+
+    Returns:
+        np.ndarray: 件ごとのグループの代表（最初に現れた件）の位置。重複がなければ自身
+    """
+    keys, signatures, valid = signature_index(texts, ngram, num_perm, bands)
+    a, b = lsh_candidates(keys)
+    keep = valid[a] & valid[b]
+    a, b = a[keep], b[keep]
+
+    # 候補の組の署名の一致率を、メモリを抑えるために区切って求める
+    similar = np.zeros(len(a), dtype=bool)
+    step = max(1, 4_000_000 // num_perm)
+    for lo in range(0, len(a), step):
+        block = slice(lo, lo + step)
+        similar[block] = (signatures[a[block]] == signatures[b[block]]).mean(axis=1) >= threshold
+    logger.info("Near-duplicate candidates: %d pairs, %d above threshold %.2f", len(a), int(similar.sum()), threshold)
+    return connected_representatives(len(texts), a[similar], b[similar])
+
+
+def audit(
+    df: pd.DataFrame,
+    columns: list[str],
+    text_columns: list[str],
+    threshold: float = 0.8,
+    ngram: int = 3,
+    num_perm: int = 128,
+    bands: int = 16,
+) -> DuplicateReport:
+    """
+    ペルソナ単位と自由記述のセル単位で、近似重複を検出する
+
+    Args:
+        df: 生成結果
+        columns: ペルソナ単位で比べるカラム（値を連結した文字列で比べる）
+        text_columns: 1セルずつ比べる自由記述のカラム（カラムをまたいで比べる）
+        threshold: 重複とする Jaccard 係数の下限
+        ngram: n-gramの文字数
+        num_perm: 署名の長さ
+        bands: LSH の帯の数
+
+    Returns:
+        DuplicateReport: 検出結果（ペルソナ単位の件、自由記述のセルの件の順）
+    """
+    groups = []
+    persona_columns = [c for c in columns if c in df.columns]
+    if persona_columns:
+        texts = ["|".join(map(normalize, row)) for row in df[persona_columns].itertuples(index=False)]
+        groups.append((np.arange(len(df)), np.full(len(df), PERSONA, dtype=object), texts))
+
+    cells = [c for c in text_columns if c in df.columns]
+    if cells:
+        # カラムごとではなく行ごとに並べ、代表がなるべく前の行になるようにする
+        rows = np.repeat(np.arange(len(df)), len(cells))
+        kinds = np.tile(np.array(cells, dtype=object), len(df))
+        groups.append((rows, kinds, [normalize(t) for t in df[cells].to_numpy().ravel()]))
+
+    all_rows, all_columns, all_texts, representative = [], [], [], []
+    for rows, kinds, texts in groups:
+        offset = len(all_texts)
+        representative.append(near_duplicates(texts, threshold, ngram, num_perm, bands) + offset)
+        all_rows.append(rows)
+        all_columns.append(kinds)
+        all_texts += texts
+
+    if not groups:
+        raise ValueError("比べるカラムが出力にありません")
+    return DuplicateReport(
+        rows=np.concatenate(all_rows),
+        columns=np.concatenate(all_columns),
+        texts=all_texts,
+        representative=np.concatenate(representative),
+    )
+
+
+def duplicate_labels(df: pd.DataFrame, report: DuplicateReport) -> pd.Series:
+    """
+    行ごとに、近似重複だった件と代表の id を文字列にする
+
+    Returns:
+        pd.Series: 「Choice3.reason(id=12)」のように「、」でつないだ文字列（重複がなければ空文字列）
+    """
+    ids = df["id"].to_numpy() if "id" in df.columns else np.arange(1, len(df) + 1)
+    labels = [[] for _ in range(len(df))]
+    for i in np.flatnonzero(report.flagged):
+        rep = report.representative[i]
+        labels[report.rows[i]].append(f"{report.columns[i]}(id={ids[report.rows[rep]]})")
+    return pd.Series(["、".join(label) for label in labels], index=df.index)
+
+
+def diversity_hints(df: pd.DataFrame, report: DuplicateReport, max_examples: int = 5, max_chars: int = 200) -> dict[int, str]:
+    """
+    近似重複の行を作り直すときの指示を、ペルソナIDごとに作る
+
+    Args:
+        df: 生成結果（id カラムがあること）
+        report: 検出結果
+        max_examples: 指示に含める代表の文字列の最大数（1行あたり）
+        max_chars: 指示に含める代表の文字列の最大文字数
+
+    Returns:
+        dict[int, str]: ペルソナID -> ユーザープロンプトの末尾に付ける指示
+    """
+    examples: dict[int, dict[str, None]] = {}
+    for i in np.flatnonzero(report.flagged):
+        rep = report.representative[i]
+        label = "" if report.columns[i] == PERSONA else f"{report.columns[i]}: "
+        lines = examples.setdefault(int(df["id"].iloc[report.rows[i]]), {})
+        if len(lines) < max_examples:
+            lines[f"- {label}{report.texts[rep][:max_chars]}"] = None
+    return {persona_id: DIVERSITY_HINT.format(examples="\n".join(lines)) for persona_id, lines in examples.items()}
+
+
+def summarize(report: DuplicateReport, top: int = 5) -> list[str]:
+    """
+    カラムごとの近似重複の件数と、大きいグループをレポートの行にする
+
+    Args:
+        report: 検出結果
+        top: 表示するグループの数
+
+    Returns:
+        list[str]: 表示用の行
+    """
+    frame = pd.DataFrame({"column": report.columns, "flagged": report.flagged, "rep": report.representative})
+    lines = []
+    for column, rows in frame.groupby("column", sort=False):
+        count = int(rows["flagged"].sum())
+        lines.append(f"{column}: {count:,} / {len(rows):,}件（{count / len(rows):.1%}）")
+
+    sizes = frame.loc[frame["flagged"], "rep"].value_counts().head(top)
+    if len(sizes):
+        lines.append(f"\n--- 大きいグループ（上位{len(sizes)}） ---")
+        for rep, size in sizes.items():
+            lines.append(f"  {size + 1:>5}件  [{report.columns[rep]}] {report.texts[rep][:60]}")
+    flagged_rows = len(np.unique(report.rows[report.flagged]))
+    lines.append(f"近似重複のある行: {flagged_rows:,}件")
+    return lines
@@ -0,0 +1,900 @@
+"""選好の異質性の推定（混合ロジット・潜在クラスロジット）
+
+生成したDCE回答（ChoiceN.choice）と、ペルソナの属性（年齢・婚姻状況・子供の人数・LLMが生成した特性）から、
+選択肢の属性に対する選好が回答者によってどう異なるかを推定する。
+
+- プール: 全員に共通の係数の条件付きロジット（混合ロジット・潜在クラスの初期値にも使う）
+- 混合ロジット: 係数 = 平均 + 共変量による平均のずれ + 正規分布の個人差。シミュレーション最尤法で推定し、
+  個人差の乱数には回答者 × ドロー × 属性の Halton 列（ランダムシフト付き）を配列演算でまとめて作る
+- 潜在クラスロジット: クラスごとの係数と、共変量によるクラス所属確率（多項ロジット）をEMアルゴリズムで推定する
+
+対数尤度と勾配は回答者のシャードごとに計算して合計する。workers が2以上の場合はシャードをプロセスプールで並列に計算する
+（データとドローはプールの作成時に各プロセスへ1回だけ渡す。fork が使える環境ではコピーせずに共有される）。
+回答者ごとのドローは全体の通し番号で決まるため、workers を変えても結果は変わらない。
+標準誤差は回答者ごとのスコアの外積（BHHH）から求める（潜在クラスはEMの点推定のみ）。
+
+scipy が必要（uv sync --extra estimation）。
+"""
+
+import json
+import math
+import multiprocessing
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field, replace
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from lib.log import logger
+
+# 1回の配列演算で扱う要素数（回答者 × ドロー × タスク × 選択肢）の目安。シャードの大きさを決める
+SHARD_ELEMENTS = 2_000_000
+
+# Halton 列の先頭から捨てる点の数（先頭の点は次元間の相関が強い）
+HALTON_BURN = 10
+
+# 選択肢のどの水準も参照にしない属性の既定の参照水準
+DEFAULT_REFERENCE = "現状"
+
+
+@dataclass
+class DesignColumn:
+    """説明変数の1列"""
+
+    name: str
+    attribute: str  # 選択肢の属性
+    level: str | None = None  # ダミー変数の水準（Noneは coding で水準を数値にした列）
+
+
+@dataclass
+class CovariateSpec:
+    """共変量の1列の作り方（シミュレーションで同じ標準化を再現するために保存する）"""
+
+    name: str
+    column: str  # 元のカラム
+    category: str | None  # ダミー変数の値（Noneは数値のカラム）
+    mean: float
+    scale: float
+
+
+@dataclass
+class ChoiceData:
+    """推定に使う選択データ（回答者 × タスク × 選択肢 × 説明変数）"""
+
+    X: np.ndarray  # (回答者, タスク, 選択肢, 説明変数) の説明変数
+    y: np.ndarray  # (回答者, タスク) の選んだ選択肢の番号
+    mask: np.ndarray  # (回答者, タスク) の有効な回答（1.0）/ 欠けた回答（0.0）
+    Z: np.ndarray  # (回答者, 共変量) の標準化した共変量
+    ids: np.ndarray  # 回答者のペルソナID
+    attributes: list[str]  # 説明変数の名前
+    covariates: list[str]  # 共変量の名前（カテゴリはダミー変数に展開した名前）
+    design: list[DesignColumn] = field(default_factory=list)  # 説明変数の作り方
+    coding: dict[str, dict[str, float]] = field(default_factory=dict)  # 属性 -> {水準: 数値}
+    covariate_specs: list[CovariateSpec] = field(default_factory=list)  # 共変量の作り方
+
+    @property
+    def n_respondents(self) -> int:
+        return self.X.shape[0]
+
+    @property
+    def n_observations(self) -> int:
+        return int(self.mask.sum())
+
+
+@dataclass
+class EstimationResult:
+    """推定結果"""
+
+    model: str  # pooled | mixed | latent_class
+    names: list[str]
+    estimates: np.ndarray
+    std_errors: np.ndarray | None
+    log_likelihood: float
+    n_respondents: int
+    n_observations: int
+    converged: bool
+    iterations: int
+    elapsed: float
+    # params（シミュレーション用のパラメータ）、covariates（共変量の作り方）、潜在クラスのクラス構成比など
+    extra: dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def n_params(self) -> int:
+        return len(self.estimates)
+
+    @property
+    def aic(self) -> float:
+        return 2 * self.n_params - 2 * self.log_likelihood
+
+    @property
+    def bic(self) -> float:
+        return self.n_params * math.log(self.n_respondents) - 2 * self.log_likelihood
+
+    def to_frame(self) -> pd.DataFrame:
+        """パラメータの表（model, name, estimate, std_error, z）"""
+        df = pd.DataFrame({"model": self.model, "name": self.names, "estimate": self.estimates})
+        if self.std_errors is not None:
+            df["std_error"] = self.std_errors
+            df["z"] = self.estimates / self.std_errors
+        return df
+
+
+# ---------------------------------------------------------------------------
+# データの準備
+# ---------------------------------------------------------------------------
+
+
+def design_columns(
+    choice_sets: list[dict[str, Any]],
+    coding: dict[str, dict[str, float]] | None = None,
+    reference: dict[str, str] | None = None,
+) -> tuple[list[str], list[DesignColumn], np.ndarray]:
+    """
+    選択肢の水準から説明変数を作る
+
+    coding に挙げた属性は水準を数値に置き換えた1列にし、それ以外の属性は参照水準を除いたダミー変数にする。
+
+    Args:
+        choice_sets: [{"Choice1": {"1A": {属性: 水準}, "1B": {...}}}, ...] の形式の選択肢
+        coding: 属性 -> {水準: 数値}
+        reference: 属性 -> ダミー変数の参照水準（省略時は「現状」、なければ最初に現れた水準）
+
+    Returns:
+        tuple: (タスク名の一覧, 説明変数, (タスク, 選択肢, 説明変数) の配列)
+
+    Raises:
+        ValueError: タスクごとの選択肢の数が異なる、または coding にない水準がある場合
+    """
+    from lib.prompt_format import choice_rows
+
+    coding = coding or {}
+    reference = reference or {}
+    attributes, rows = choice_rows(choice_sets)
+    options, levels = _task_levels(attributes, rows)
+    tasks = list(options)
+    if len({len(v) for v in options.values()}) != 1:
+        raise ValueError("タスクごとの選択肢の数が異なります")
+
+    columns: list[DesignColumn] = []
+    for a in attributes:
+        if a in coding:
+            unknown = [level for level in levels[a] if level not in coding[a]]
+            if unknown:
+                raise ValueError(f"estimation.coding の {a} にない水準があります: {unknown}")
+            columns.append(DesignColumn(a, a))
+            continue
+        base = reference.get(a) or (DEFAULT_REFERENCE if DEFAULT_REFERENCE in levels[a] else levels[a][0])
+        columns.extend(DesignColumn(f"{a}:{level}", a, level) for level in levels[a] if level != base)
+
+    X = np.array([[encode_levels(option_levels, columns, coding) for option_levels in options[task]] for task in tasks])
+    return tasks, columns, X
+
+
+def encode_levels(levels: dict[str, Any], columns: list[DesignColumn], coding: dict[str, dict[str, float]]) -> np.ndarray:
+    """
+    1つの選択肢の水準を説明変数の値にする
+
+    Args:
+        levels: 属性 -> 水準
+        columns: 説明変数（design_columns の戻り値）
+        coding: 属性 -> {水準: 数値}
+
+    Returns:
+        np.ndarray: 説明変数の値
+
+    Raises:
+        ValueError: 数値にする属性の水準が coding にない場合
+    """
+    values = np.zeros(len(columns))
+    for k, column in enumerate(columns):
+        level = str(levels.get(column.attribute))
+        if column.level is not None:
+            values[k] = float(level == column.level)
+        elif level in coding[column.attribute]:
+            values[k] = coding[column.attribute][level]
+        else:
+            raise ValueError(f"{column.attribute} の水準 {level} は estimation.coding にありません")
+    return values
+
+
+def _task_levels(
+    attributes: list[str], rows: list[tuple[str, str, dict[str, Any]]]
+) -> tuple[dict[str, list[dict[str, Any]]], dict[str, list[str]]]:
+    """choice_rows の行を、タスクごとの選択肢の水準と、属性ごとの水準の一覧（出現順）にまとめる"""
+    options: dict[str, list[dict[str, Any]]] = {}
+    levels: dict[str, list[str]] = {a: [] for a in attributes}
+    for task, _option, option_levels in rows:
+        options.setdefault(task, []).append(option_levels)
+        for a in attributes:
+            if str(option_levels.get(a)) not in levels[a]:
+                levels[a].append(str(option_levels.get(a)))
+    return options, levels
+
+
+def _normalize(value: Any) -> str:
+    """回答の表記ゆれ（全角・小文字・空白）をそろえる"""
+    return unicodedata.normalize("NFKC", str(value)).strip().upper()
+
+
+def parse_choices(df: pd.DataFrame, tasks: list[str], choice_sets: list[dict[str, Any]]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    ChoiceN.choice カラムを選んだ選択肢の番号にする
+
+    Args:
+        df: 生成結果
+        tasks: タスク名の一覧（design_columns の戻り値）
+        choice_sets: 選択肢
+
+    Returns:
+        tuple: ((回答者, タスク) の選択肢の番号, 有効な回答のマスク)
+            「1A」のほかに「A」も受け付ける。カラムがない・選択肢にない回答は欠けた回答として扱う
+    """
+    option_names = {task: list(options) for choice_set in choice_sets for task, options in choice_set.items()}
+    y = np.zeros((len(df), len(tasks)), dtype=np.int64)
+    mask = np.zeros((len(df), len(tasks)))
+    for t, task in enumerate(tasks):
+        column = f"{task}.choice"
+        if column not in df.columns:
+            logger.warning("Column %s not found, treating all answers as missing", column)
+            continue
+        lookup = {}
+        for j, option in enumerate(option_names[task]):
+            lookup[_normalize(option)] = j
+            lookup[_normalize(option).lstrip("0123456789")] = j
+        index = df[column].map(lambda v, lookup=lookup: lookup.get(_normalize(v), -1) if pd.notna(v) else -1).to_numpy()
+        y[:, t] = np.maximum(index, 0)
+        mask[:, t] = index >= 0
+    return y, mask
+
+
+def encode_covariates(df: pd.DataFrame, covariates: list[str]) -> tuple[np.ndarray, list[CovariateSpec], np.ndarray]:
+    """
+    共変量を標準化した数値の配列にする
+
+    すべての値が数値に変換できるカラムは数値として、それ以外はカテゴリとして
+    最も多い値を基準にしたダミー変数にする。どちらも平均0・標準偏差1に標準化する。
+
+    Args:
+        df: 共変量のカラムを持つデータ
+        covariates: 共変量のカラム
+
+    Returns:
+        tuple: ((行, 共変量) の配列, 共変量の作り方, 共変量がそろっている行のマスク)
+    """
+    columns: list[np.ndarray] = []
+    sources: list[tuple[str, str, str | None]] = []  # (名前, 元のカラム, ダミー変数の値)
+    complete = np.ones(len(df), dtype=bool)
+    for c in covariates:
+        if c not in df.columns:
+            raise ValueError(f"共変量 {c} のカラムがありません（--personas でペルソナの出力を指定してください）")
+        values = df[c]
+        complete &= values.notna().to_numpy()
+        numeric = pd.to_numeric(values, errors="coerce")
+        if numeric.notna().sum() == values.notna().sum():
+            columns.append(numeric.to_numpy(dtype=float))
+            sources.append((c, c, None))
+            continue
+        categories = values.dropna().astype(str).value_counts().index[1:]
+        for category in categories:
+            columns.append((values.astype(str) == category).to_numpy(dtype=float))
+            sources.append((f"{c}:{category}", c, category))
+
+    if not columns:
+        return np.zeros((len(df), 0)), [], complete
+
+    Z = np.column_stack(columns)
+    valid = Z[complete]
+    means = valid.mean(axis=0)
+    scales = valid.std(axis=0)
+    scales = np.where(scales > 0, scales, 1.0)
+    specs = [
+        CovariateSpec(name, column, category, float(mean), float(scale))
+        for (name, column, category), mean, scale in zip(sources, means, scales, strict=True)
+    ]
+    Z = (Z - means) / scales
+    return np.where(np.isnan(Z), 0.0, Z), specs, complete
+
+
+def build_choice_data(
+    df: pd.DataFrame,
+    choice_sets: list[dict[str, Any]],
+    covariates: list[str] | None = None,
+    coding: dict[str, dict[str, float]] | None = None,
+    reference: dict[str, str] | None = None,
+    personas: pd.DataFrame | None = None,
+) -> ChoiceData:
+    """
+    生成結果から推定に使う選択データを作る
+
+    Args:
+        df: DCE回答の生成結果（id と ChoiceN.choice を持つ）
+        choice_sets: 選択肢
+        covariates: 共変量のカラム
+        coding: 属性 -> {水準: 数値}（design_columns 参照）
+        reference: 属性 -> ダミー変数の参照水準
+        personas: 共変量を持つペルソナの生成結果（id で結合する。df にあるカラムは df を優先する）
+
+    Returns:
+        ChoiceData: 有効な回答が1つ以上あり、共変量がそろっている回答者のデータ
+
+    Raises:
+        ValueError: 説明変数がタスクの違いから識別できない場合など
+    """
+    covariates = covariates or []
+    if personas is not None:
+        extra = ["id", *(c for c in personas.columns if c not in df.columns)]
+        df = df.merge(personas[extra].drop_duplicates("id"), on="id", how="left")
+
+    tasks, design, X_task = design_columns(choice_sets, coding, reference)
+    attributes = [column.name for column in design]
+    check_identification(X_task, attributes)
+
+    y, mask = parse_choices(df, tasks, choice_sets)
+    Z, covariate_specs, complete = encode_covariates(df, covariates)
+
+    keep = complete & (mask.sum(axis=1) > 0)
+    if (~keep).any():
+        logger.warning(
+            "Dropping %d respondents (no valid answers: %d, missing covariates: %d)",
+            int((~keep).sum()),
+            int((mask.sum(axis=1) == 0).sum()),
+            int((~complete).sum()),
+        )
+    n = int(keep.sum())
+    if n == 0:
+        raise ValueError("推定に使える回答がありません（ChoiceN.choice のカラムと値を確認してください）")
+
+    ids = df["id"].to_numpy()[keep] if "id" in df.columns else np.arange(1, len(df) + 1)[keep]
+    return ChoiceData(
+        X=np.ascontiguousarray(np.broadcast_to(X_task, (n, *X_task.shape))),
+        y=y[keep],
+        mask=mask[keep],
+        Z=Z[keep],
+        ids=ids,
+        attributes=attributes,
+        covariates=[spec.name for spec in covariate_specs],
+        design=design,
+        coding=coding or {},
+        covariate_specs=covariate_specs,
+    )
+
+
+def check_identification(X_task: np.ndarray, attributes: list[str]) -> None:
+    """
+    説明変数がタスク内の選択肢の違いから識別できるかを確かめる
+
+    全員に同じタスクを提示する設計では、識別できる係数の数は（タスク数 × (選択肢数 - 1)）までになる。
+
+    Raises:
+        ValueError: 選択肢どうしの差の行列の階数が説明変数の数より小さい場合
+    """
+    diff = (X_task[:, 1:, :] - X_task[:, :1, :]).reshape(-1, X_task.shape[-1])
+    rank = np.linalg.matrix_rank(diff)
+    if rank < len(attributes):
+        raise ValueError(
+            f"説明変数 {len(attributes)}個のうち {rank}個分しかタスクの違いから識別できません。"
+            "estimation.coding で水準を数値にして説明変数を減らしてください"
+        )
+
+
+# ---------------------------------------------------------------------------
+# Halton 列
+# ---------------------------------------------------------------------------
+
+
+def _primes(n: int) -> list[int]:
+    """小さい順にn個の素数を返す"""
+    primes: list[int] = []
+    candidate = 2
+    while len(primes) < n:
+        if all(candidate % p for p in primes if p * p <= candidate):
+            primes.append(candidate)
+        candidate += 1
+    return primes
+
+
+def _radical_inverse(index: np.ndarray, base: int) -> np.ndarray:
+    """index の base 進の桁を小数点の反対側に折り返した値（Halton 列の1次元）"""
+    result = np.zeros(index.shape)
+    scale = 1.0 / base
+    index = index.copy()
+    while index.any():
+        index, digit = np.divmod(index, base)
+        result += digit * scale
+        scale /= base
+    return result
+
+
+def halton_draws(start: int, n_respondents: int, n_draws: int, dims: int, seed: int = 42) -> np.ndarray:
+    """
+    回答者ごとの標準正規分布のドローを Halton 列で作る
+
+    回答者 i（全体の通し番号）は Halton 列の [HALTON_BURN + i * n_draws, HALTON_BURN + (i + 1) * n_draws) の点を使う。
+    次元ごとに seed から決めたランダムシフトを加え、正規分布の逆関数で変換する。
+
+    Args:
+        start: 先頭の回答者の通し番号
+        n_respondents: 回答者数
+        n_draws: 1人あたりのドロー数
+        dims: 次元数（個人差を推定する説明変数の数）
+        seed: ランダムシフトの乱数シード
+
+    Returns:
+        np.ndarray: (回答者, ドロー, 次元) の配列（float32）
+    """
+    from scipy.special import ndtri
+
+    index = np.arange(HALTON_BURN + start * n_draws, HALTON_BURN + (start + n_respondents) * n_draws, dtype=np.int64)
+    shifts = np.random.default_rng(seed).random(dims)
+    draws = np.empty((len(index), dims), dtype=np.float32)
+    for d, base in enumerate(_primes(dims)):
+        u = (_radical_inverse(index, base) + shifts[d]) % 1.0
+        draws[:, d] = ndtri(np.clip(u, 1e-10, 1 - 1e-10))
+    return draws.reshape(n_respondents, n_draws, dims)
+
+
+# ---------------------------------------------------------------------------
+# シャードごとの対数尤度と勾配（プロセスプールのワーカーでも呼ばれる）
+# ---------------------------------------------------------------------------
+
+# ワーカープロセスが参照するデータ（_init_worker で設定する）
+_SHARED: dict[str, Any] = {}
+
+
+def _init_worker(data: ChoiceData, draws: np.ndarray | None, shards: list[tuple[int, int]]) -> None:
+    """ワーカープロセスの初期化（データ・ドロー・シャードの範囲を保持する）"""
+    _SHARED.update(data=data, draws=draws, shards=shards)
+
+
+def _draw_loglik(X: np.ndarray, y: np.ndarray, mask: np.ndarray, beta: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    ドローごとの対数尤度と、係数に対する勾配を求める
+
+    Args:
+        X: (回答者, タスク, 選択肢, 説明変数)
+        y: (回答者, タスク) の選んだ選択肢
+        mask: (回答者, タスク) の有効な回答
+        beta: (回答者, ドロー, 説明変数) の係数
+
+    Returns:
+        tuple: ((回答者, ドロー) の対数尤度, (回答者, ドロー, 説明変数) の勾配)
+    """
+    # 選択肢の数は少ない（2〜3）ため、選択肢の軸で集計せず選択肢ごとの (回答者, ドロー, タスク) の配列で計算する
+    alternatives = [X[:, :, j, :] for j in range(X.shape[2])]
+    V = [np.matmul(beta, x.transpose(0, 2, 1)) for x in alternatives]
+    top = np.maximum.reduce(V)
+    log_denom = top + np.log(sum(np.exp(v - top) for v in V))
+    chosen = sum(v * (y == j)[:, None, :] for j, v in enumerate(V))
+    loglik = ((chosen - log_denom) * mask[:, None, :]).sum(axis=-1)
+
+    x_chosen = np.take_along_axis(X, y[:, :, None, None], axis=2)[:, :, 0, :]
+    grad = np.einsum("nt,ntk->nk", mask, x_chosen)[:, None, :]
+    for v, x in zip(V, alternatives, strict=True):
+        grad = grad - np.matmul(np.exp(v - log_denom) * mask[:, None, :], x)
+    return loglik, grad
+
+
+@dataclass
+class _MixedLayout:
+    """混合ロジットのパラメータの並び（平均、共変量によるずれ、個人差の標準偏差）"""
+
+    n_attributes: int
+    n_covariates: int
+    random: list[int]  # 個人差を推定する説明変数の番号
+
+    @property
+    def size(self) -> int:
+        return self.n_attributes * (1 + self.n_covariates) + len(self.random)
+
+    def unpack(self, params: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        K, M = self.n_attributes, self.n_covariates
+        return params[:K], params[K : K + K * M].reshape(K, M), params[K + K * M :]
+
+
+def _mixed_shard(shard: int, params: np.ndarray, layout: _MixedLayout, scores: bool = False) -> tuple:
+    """
+    シャードの回答者について、混合ロジットのシミュレーション対数尤度と勾配を求める
+
+    Returns:
+        tuple: (対数尤度, 勾配) または scores=True なら (対数尤度, 勾配, スコアの外積)
+    """
+    data: ChoiceData = _SHARED["data"]
+    lo, hi = _SHARED["shards"][shard]
+    X, y, mask, Z = data.X[lo:hi], data.y[lo:hi], data.mask[lo:hi], data.Z[lo:hi]
+    b, delta, sd = layout.unpack(params)
+
+    beta = (b + Z @ delta.T)[:, None, :]
+    draws = None
+    if layout.random:
+        draws = _SHARED["draws"][lo:hi].astype(np.float64)
+        beta = np.repeat(beta, draws.shape[1], axis=1)
+        beta[:, :, layout.random] += draws * sd
+
+    loglik, grad = _draw_loglik(X, y, mask, beta)
+    # 回答者ごとの尤度 = ドローの尤度の平均（対数で計算して桁あふれを防ぐ）
+    top = loglik.max(axis=1, keepdims=True)
+    weights = np.exp(loglik - top)
+    total = weights.sum(axis=1, keepdims=True)
+    respondent_ll = np.log(total[:, 0] / loglik.shape[1]) + top[:, 0]
+    weights /= total
+
+    mean_grad = np.einsum("nr,nrk->nk", weights, grad)
+    parts = [mean_grad, (mean_grad[:, :, None] * Z[:, None, :]).reshape(len(Z), -1)]
+    if layout.random:
+        parts.append(np.einsum("nr,nrk,nrk->nk", weights, grad[:, :, layout.random], draws))
+    score = np.concatenate(parts, axis=1)
+
+    if scores:
+        return respondent_ll.sum(), score.sum(axis=0), score.T @ score
+    return respondent_ll.sum(), score.sum(axis=0)
+
+
+def _class_shard(shard: int, betas: np.ndarray) -> np.ndarray:
+    """シャードの回答者について、クラスごとの対数尤度 (回答者, クラス) を求める"""
+    data: ChoiceData = _SHARED["data"]
+    lo, hi = _SHARED["shards"][shard]
+    beta = np.broadcast_to(betas[None, :, :], (hi - lo, *betas.shape))
+    loglik, _grad = _draw_loglik(data.X[lo:hi], data.y[lo:hi], data.mask[lo:hi], beta)
+    return loglik
+
+
+def _weighted_shard(shard: int, beta: np.ndarray, weights: np.ndarray) -> tuple[float, np.ndarray]:
+    """シャードの回答者について、重み付きの条件付きロジットの対数尤度と勾配を求める（潜在クラスのMステップ）"""
+    data: ChoiceData = _SHARED["data"]
+    lo, hi = _SHARED["shards"][shard]
+    beta = np.broadcast_to(beta, (hi - lo, 1, len(beta)))
+    loglik, grad = _draw_loglik(data.X[lo:hi], data.y[lo:hi], data.mask[lo:hi], beta)
+    return float(weights @ loglik[:, 0]), weights @ grad[:, 0, :]
+
+
+class _ShardRunner:
+    """シャードごとの計算を、呼び出し元のプロセスまたはプロセスプールで実行する"""
+
+    def __init__(self, data: ChoiceData, draws: np.ndarray | None, n_draws: int, workers: int):
+        size = max(1, SHARD_ELEMENTS // (max(n_draws, 1) * data.X.shape[1] * data.X.shape[2]))
+        self.shards = [(lo, min(lo + size, data.n_respondents)) for lo in range(0, data.n_respondents, size)]
+        self.workers = min(workers, len(self.shards))
+        self._executor = None
+        if self.workers > 1:
+            # fork ではデータとドローをコピーせずに共有できる（使えない環境では各プロセスに送る）
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("fork" if "fork" in methods else None)
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=context, initializer=_init_worker, initargs=(data, draws, self.shards)
+            )
+        else:
+            _init_worker(data, draws, self.shards)
+
+    def map(self, fn, *args, per_shard: list | None = None) -> list:
+        """
+        すべてのシャードについて fn(shard, *args) を実行し、シャードの順に結果を返す
+
+        per_shard を指定すると、シャードごとの値を最後の引数として渡す（fn(shard, *args, per_shard[shard])）
+        """
+        calls = [(shard, *args, *([per_shard[shard]] if per_shard is not None else [])) for shard in range(len(self.shards))]
+        if self._executor is None:
+            return [fn(*call) for call in calls]
+        futures = [self._executor.submit(fn, *call) for call in calls]
+        return [future.result() for future in futures]
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+        _SHARED.clear()
+
+    def __enter__(self) -> "_ShardRunner":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+# ---------------------------------------------------------------------------
+# 推定
+# ---------------------------------------------------------------------------
+
+
+def _minimize(objective, x0: np.ndarray, max_iter: int):
+    """負の対数尤度を L-BFGS-B で最小化する"""
+    from scipy.optimize import minimize
+
+    return minimize(objective, x0, jac=True, method="L-BFGS-B", options={"maxiter": max_iter})
+
+
+def _std_errors(bhhh: np.ndarray) -> np.ndarray:
+    """スコアの外積（BHHH）の逆行列から標準誤差を求める（特異なら一般化逆行列を使う）"""
+    try:
+        covariance = np.linalg.inv(bhhh)
+    except np.linalg.LinAlgError:
+        covariance = np.linalg.pinv(bhhh)
+    return np.sqrt(np.clip(np.diag(covariance), 0, None))
+
+
+def fit_mixed_logit(
+    data: ChoiceData,
+    n_draws: int = 200,
+    random: list[str] | None = None,
+    covariates: bool = True,
+    workers: int = 1,
+    seed: int = 42,
+    max_iter: int = 500,
+    start: np.ndarray | None = None,
+) -> EstimationResult:
+    """
+    混合ロジットをシミュレーション最尤法で推定する
+
+    係数 = 平均 + 共変量 × ずれ + 標準偏差 × 標準正規分布のドロー（属性ごとに独立）
+
+    Args:
+        data: 選択データ
+        n_draws: 1人あたりの Halton ドロー数
+        random: 個人差を推定する説明変数（None は全説明変数、空リストはプールの条件付きロジット）
+        covariates: 共変量による平均のずれを推定するか
+        workers: 対数尤度の計算に使うプロセス数
+        seed: Halton 列のランダムシフトの乱数シード
+        max_iter: 最適化の最大反復回数
+        start: パラメータの初期値（平均の部分だけでもよい）
+
+    Returns:
+        EstimationResult: 推定結果（標準偏差は絶対値で報告する）
+    """
+    random_names = data.attributes if random is None else random
+    unknown = [name for name in random_names if name not in data.attributes]
+    if unknown:
+        raise ValueError(f"個人差を推定する説明変数がありません: {unknown}（候補: {data.attributes}）")
+    layout = _MixedLayout(
+        n_attributes=len(data.attributes),
+        n_covariates=data.Z.shape[1] if covariates else 0,
+        random=[data.attributes.index(name) for name in random_names],
+    )
+    if not covariates:
+        data = replace(data, Z=np.zeros((data.n_respondents, 0)), covariates=[], covariate_specs=[])
+
+    draws_per_respondent = n_draws if layout.random else 1
+    draws = halton_draws(0, data.n_respondents, n_draws, len(layout.random), seed) if layout.random else None
+
+    x0 = np.zeros(layout.size)
+    x0[layout.size - len(layout.random) :] = 0.1
+    if start is not None:
+        x0[: len(start)] = start
+
+    model = "mixed" if layout.random else "pooled"
+    logger.info(
+        "Fitting %s logit: respondents=%d, params=%d, draws=%d, workers=%d",
+        model,
+        data.n_respondents,
+        layout.size,
+        draws_per_respondent,
+        workers,
+    )
+    started = time.perf_counter()
+    with _ShardRunner(data, draws, draws_per_respondent, workers) as runner:
+
+        def objective(params: np.ndarray) -> tuple[float, np.ndarray]:
+            results = runner.map(_mixed_shard, params, layout)
+            return -sum(r[0] for r in results), -sum(r[1] for r in results)
+
+        optimum = _minimize(objective, x0, max_iter)
+        results = runner.map(_mixed_shard, optimum.x, layout, True)
+
+    estimates = optimum.x.copy()
+    if layout.random:
+        estimates[-len(layout.random) :] = np.abs(estimates[-len(layout.random) :])
+    names = list(data.attributes)
+    names += [f"{a}×{c}" for a in data.attributes for c in data.covariates]
+    names += [f"SD:{data.attributes[k]}" for k in layout.random]
+    mean, shift, sd = layout.unpack(estimates)
+    params = {
+        "mean": mean.tolist(),
+        "shift": shift.tolist(),
+        "sd": {data.attributes[k]: float(v) for k, v in zip(layout.random, sd, strict=True)},
+    }
+
+    return EstimationResult(
+        model=model,
+        names=names,
+        estimates=estimates,
+        std_errors=_std_errors(sum(r[2] for r in results)),
+        log_likelihood=float(sum(r[0] for r in results)),
+        n_respondents=data.n_respondents,
+        n_observations=data.n_observations,
+        converged=bool(optimum.success),
+        iterations=int(optimum.nit),
+        elapsed=time.perf_counter() - started,
+        extra={"params": params, "covariates": data.covariate_specs},
+    )
+
+
+def fit_pooled_logit(data: ChoiceData, workers: int = 1, max_iter: int = 500) -> EstimationResult:
+    """
+    全員に共通の係数の条件付きロジットを推定する（共変量・個人差なし）
+
+    Args:
+        data: 選択データ
+        workers: 対数尤度の計算に使うプロセス数
+        max_iter: 最適化の最大反復回数
+
+    Returns:
+        EstimationResult: 推定結果
+    """
+    return fit_mixed_logit(data, random=[], covariates=False, workers=workers, max_iter=max_iter)
+
+
+def _membership(Z1: np.ndarray, gamma: np.ndarray) -> np.ndarray:
+    """クラス所属確率の対数 (回答者, クラス)（クラス1を基準にした多項ロジット）"""
+    utility = np.concatenate([np.zeros((len(Z1), 1)), Z1 @ gamma.T], axis=1)
+    return utility - np.logaddexp.reduce(utility, axis=1, keepdims=True)
+
+
+def _fit_membership(Z1: np.ndarray, posterior: np.ndarray, gamma: np.ndarray, max_iter: int) -> np.ndarray:
+    """事後確率を目的変数にした重み付き多項ロジットでクラス所属の係数を求める（Mステップ）"""
+    shape = gamma.shape
+
+    def objective(flat: np.ndarray) -> tuple[float, np.ndarray]:
+        log_pi = _membership(Z1, flat.reshape(shape))
+        residual = posterior[:, 1:] - np.exp(log_pi[:, 1:])
+        return -float((posterior * log_pi).sum()), -(residual.T @ Z1).ravel()
+
+    return _minimize(objective, gamma.ravel(), max_iter).x.reshape(shape)
+
+
+def fit_latent_class(
+    data: ChoiceData,
+    n_classes: int = 2,
+    workers: int = 1,
+    seed: int = 42,
+    max_iter: int = 200,
+    tol: float = 1e-6,
+    start: np.ndarray | None = None,
+) -> EstimationResult:
+    """
+    潜在クラスロジットをEMアルゴリズムで推定する
+
+    Eステップで回答者ごとのクラスの事後確率を求め、Mステップでクラスごとの重み付き条件付きロジットと、
+    共変量によるクラス所属の多項ロジットを推定し直す。対数尤度の増加が tol 未満になったら終了する。
+
+    Args:
+        data: 選択データ
+        n_classes: クラス数
+        workers: 対数尤度の計算に使うプロセス数
+        seed: 初期値の乱数シード
+        max_iter: EMの最大反復回数
+        tol: 収束判定に使う対数尤度の増加（回答者あたり）
+        start: クラスの係数の初期値の中心（プールの推定値など）
+
+    Returns:
+        EstimationResult: 推定結果（extra["shares"] にクラスの構成比、extra["posterior"] に回答者ごとの事後確率）
+    """
+    if n_classes < 2:
+        raise ValueError(f"クラス数は2以上を指定してください: {n_classes}")
+    K = len(data.attributes)
+    Z1 = np.concatenate([np.ones((data.n_respondents, 1)), data.Z], axis=1)
+    rng = np.random.default_rng(seed)
+    center = np.zeros(K) if start is None else start
+    betas = center + rng.normal(scale=0.5 * (np.abs(center).mean() + 0.1), size=(n_classes, K))
+    gamma = np.zeros((n_classes - 1, Z1.shape[1]))
+
+    logger.info("Fitting latent class logit: respondents=%d, classes=%d, workers=%d", data.n_respondents, n_classes, workers)
+    started = time.perf_counter()
+    previous = -np.inf
+    converged = False
+    iteration = 0
+    with _ShardRunner(data, None, 1, workers) as runner:
+        for iteration in range(1, max_iter + 1):
+            # Eステップ: クラスの事後確率
+            class_ll = np.concatenate(runner.map(_class_shard, betas))
+            joint = _membership(Z1, gamma) + class_ll
+            respondent_ll = np.logaddexp.reduce(joint, axis=1)
+            posterior = np.exp(joint - respondent_ll[:, None])
+            log_likelihood = float(respondent_ll.sum())
+            logger.debug("EM iteration %d: log-likelihood=%.4f", iteration, log_likelihood)
+            if log_likelihood - previous < tol * data.n_respondents:
+                converged = True
+                break
+            previous = log_likelihood
+
+            # Mステップ: クラスごとの係数とクラス所属の係数
+            for c in range(n_classes):
+                betas[c] = _fit_class(runner, posterior[:, c], betas[c])
+            gamma = _fit_membership(Z1, posterior, gamma, max_iter=100)
+
+    shares = posterior.mean(axis=0)
+    names = [f"クラス{c + 1}:{a}" for c in range(n_classes) for a in data.attributes]
+    names += [f"所属{c + 2}:{z}" for c in range(n_classes - 1) for z in ["定数", *data.covariates]]
+    return EstimationResult(
+        model="latent_class",
+        names=names,
+        estimates=np.concatenate([betas.ravel(), gamma.ravel()]),
+        std_errors=None,
+        log_likelihood=log_likelihood,
+        n_respondents=data.n_respondents,
+        n_observations=data.n_observations,
+        converged=converged,
+        iterations=iteration,
+        elapsed=time.perf_counter() - started,
+        extra={
+            "shares": shares,
+            "posterior": posterior,
+            "params": {"betas": betas.tolist(), "membership": gamma.tolist()},
+            "covariates": data.covariate_specs,
+        },
+    )
+
+
+def _fit_class(runner: _ShardRunner, weights: np.ndarray, beta: np.ndarray) -> np.ndarray:
+    """事後確率で重み付けした条件付きロジットで1クラスの係数を求める"""
+    shard_weights = [weights[lo:hi] for lo, hi in runner.shards]
+
+    def objective(params: np.ndarray) -> tuple[float, np.ndarray]:
+        results = runner.map(_weighted_shard, params, per_shard=shard_weights)
+        return -sum(r[0] for r in results), -sum(r[1] for r in results)
+
+    return _minimize(objective, beta, max_iter=100).x
+
+
+def save_estimates(path: str | Path, data: ChoiceData, results: list[EstimationResult]) -> Path:
+    """
+    推定結果を、政策シミュレーション（lib/simulation.py）で使うJSONとして保存する
+
+    Args:
+        path: 出力ファイルパス
+        data: 推定に使った選択データ（説明変数・共変量の作り方を保存する）
+        results: 推定結果
+
+    Returns:
+        Path: 出力されたファイルのパス
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    payload = {
+        "design": [asdict(column) for column in data.design],
+        "coding": data.coding,
+        "models": {
+            result.model: {
+                "log_likelihood": result.log_likelihood,
+                "n_respondents": result.n_respondents,
+                "params": result.extra["params"],
+                "covariates": [asdict(spec) for spec in result.extra["covariates"]],
+            }
+            for result in results
+        },
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    logger.info("Estimates saved: %s (%s)", path, ", ".join(payload["models"]))
+    return path
+
+
+def format_result(result: EstimationResult) -> list[str]:
+    """
+    推定結果をレポートの行にする
+
+    Args:
+        result: 推定結果
+
+    Returns:
+        list[str]: 表示用の行
+    """
+    title = {"pooled": "プール（条件付きロジット）", "mixed": "混合ロジット", "latent_class": "潜在クラスロジット"}
+    status = "収束" if result.converged else "未収束"
+    lines = [
+        f"=== {title.get(result.model, result.model)} ===",
+        f"回答者: {result.n_respondents:,}人 / 回答: {result.n_observations:,}件 / パラメータ: {result.n_params}",
+        f"対数尤度: {result.log_likelihood:,.2f}  AIC: {result.aic:,.1f}  BIC: {result.bic:,.1f}",
+        f"{status}（反復 {result.iterations}回、{result.elapsed:.1f}秒）",
+    ]
+    if "shares" in result.extra:
+        lines.append("クラス構成比: " + " / ".join(f"{s:.1%}" for s in result.extra["shares"]))
+    width = max(len(name) for name in result.names)
+    for i, name in enumerate(result.names):
+        line = f"  {name:<{width}} {result.estimates[i]:>10.4f}"
+        if result.std_errors is not None:
+            se = result.std_errors[i]
+            z = result.estimates[i] / se if se > 0 else float("nan")
+            line += f" ({se:.4f})  z={z:>7.2f}"
+        lines.append(line)
+    return lines
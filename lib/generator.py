@@ -1,28 +1,65 @@
 """ペルソナ生成ロジック"""
 
 import json
-from collections.abc import Callable
-from typing import Any
+from collections.abc import Callable, Iterable
+from typing import TYPE_CHECKING, Any
 
 from lib.config import Config
-from lib.llm.base import LLMClient
+from lib.jsonstream import IncrementalJSONParser, OffSchemaError
+from lib.llm.base import LLMClient, LLMResponse, TruncatedResponseError
 from lib.log import logger
-from lib.sampling import generate_synthetic_nurse_data
+from lib.preflight import FailFastGuard, PreflightError
+from lib.prompt_format import build_user_prompt, render_choice_sets
+from lib.sampling import generate_per_id_nurse_data, sample_nurse_data
+from lib.usage import UsageReport
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+    from lib.choice_scoring import ChoiceScorer
+    from lib.token_budget import TokenBudget
 
 
 class PersonaGenerator:
     """ペルソナを1人ずつ生成するクラス"""
 
-    def __init__(self, config: Config, llm_client: LLMClient):
+    def __init__(
+        self,
+        config: Config,
+        llm_client: LLMClient,
+        workers: int = 1,
+        on_field: Callable[[int, str, Any], None] | None = None,
+        preflight: bool = False,
+        fail_fast_k: int = 0,
+    ):
         """
         PersonaGeneratorを初期化
 
         Args:
             config: 設定オブジェクト
             llm_client: LLMクライアント
+            workers: 同時リクエスト数（2以上でパイプライン処理、lib/pipeline.py参照）
+            on_field: ストリーミング時、フィールドが届くたびに呼ばれるコールバック (persona_id, key, value) -> None
+            preflight: バッチの前に1行目だけを単独で生成し、失敗したら中断する（lib/preflight.py参照）
+            fail_fast_k: 最初のK件がすべて同じ種類のエラーで失敗したら中断する（0の場合は中断しない）
         """
         self.config = config
-        self.llm = llm_client
+        # ジョブごとの使用量（ヘッジなど自前で使用量を記録するクライアントにも、このレポートを結び付ける）
+        self.usage = UsageReport()
+        self.llm = llm_client.bind_usage(self.usage)
+        # 補完のリクエストは種別 repair として記録する
+        self._repair_llm = llm_client.bind_usage(self.usage, kind="repair")
+        self.workers = workers
+        self.on_field = on_field
+        self.preflight = preflight
+        self.fail_fast_k = fail_fast_k
+        self._fail_fast = FailFastGuard(fail_fast_k)
+        # 選択肢は全員に共通のため、テンプレートに1回だけ埋め込んでおく
+        self._user_template = render_choice_sets(config.user_prompt, config.choice_sets, config.prompt.choice_format)
+        self.token_budget = self._create_token_budget()
+        self.scorer = self._create_scorer()
+        # ペルソナIDごとにユーザープロンプトの末尾に付ける指示（近似重複の作り直しなど、lib/diversity.py参照）
+        self.prompt_hints: dict[int, str] = {}
 
     def generate_one(self, persona_id: int, base_attributes: dict[str, Any]) -> dict[str, Any]:
         """
@@ -41,13 +78,7 @@ class PersonaGenerator:
         logger.info("Generating persona id=%d", persona_id)
 
         # LLMにリクエスト
-        response = self.llm.generate_json(
-            system_prompt=self.config.system_prompt,
-            user_prompt=user_prompt,
-            temperature=self.config.llm.temperature,
-            max_tokens=self.config.llm.max_tokens,
-            extra_params=self.config.llm.extra_params,
-        )
+        response = self._request(user_prompt, persona_id, base_attributes)
 
         # レスポンスをパース
         persona = self._parse_response(response.content, persona_id, base_attributes)
@@ -62,6 +93,7 @@ class PersonaGenerator:
         seed: int | None = None,
         start_id: int = 1,
         on_progress: Callable[[int, int, dict], None] | None = None,
+        row_range: range | None = None,
     ) -> list[dict[str, Any]]:
         """
         n人分のペルソナを1人ずつ生成
@@ -71,39 +103,56 @@ class PersonaGenerator:
             seed: 乱数シード（Noneの場合は設定から取得）
             start_id: 開始ID
             on_progress: 進捗コールバック (current, total, persona) -> None
+            row_range: n人のうち生成する行番号の範囲（シャード実行用、Noneの場合は全行）
+                IDは全体の行番号から振られるため、シャードを結合しても重複しない
 
         Returns:
             list[dict]: ペルソナのリスト
         """
-        if seed is None:
-            seed = self.config.sampling.seed
+        if row_range is None:
+            row_range = range(n)
+        base_data = self.sample_base_data(n, seed=seed, start_id=start_id, row_range=row_range)
+        start_id += row_range.start
 
-        # サンプリングデータを生成
-        logger.info("Generating base data: n=%d, seed=%d", n, seed)
-        base_data = generate_synthetic_nurse_data(n=n, seed=seed)
+        rows = (row.to_dict() for _, row in base_data.iterrows())
+        return self._generate_rows(rows, total=len(base_data), start_id=start_id, on_progress=on_progress)
 
-        results = []
-        for i, row in base_data.iterrows():
-            persona_id = start_id + i
-            base_attrs = row.to_dict()
+    def sample_base_data(
+        self,
+        n: int,
+        seed: int | None = None,
+        start_id: int = 1,
+        row_range: range | None = None,
+    ) -> "pd.DataFrame":
+        """
+        設定のサンプリング方式で基本属性を生成する（generate_batch と連結パイプラインの1段目で使う）
 
-            try:
-                persona = self.generate_one(persona_id, base_attrs)
-                results.append(persona)
+        Args:
+            n: 全体の人数
+            seed: 乱数シード（Noneの場合は設定から取得）
+            start_id: 開始ID
+            row_range: n人のうち返す行番号の範囲（Noneの場合は全行）
 
-                if on_progress:
-                    on_progress(i + 1, n, persona)
+        Returns:
+            pd.DataFrame: 担当範囲の基本属性
+        """
+        if seed is None:
+            seed = self.config.sampling.seed
 
-            except Exception as e:
-                logger.error("Failed to generate persona id=%d: %s", persona_id, e)
-                # エラー時は基本属性のみで記録
-                error_persona = {"id": persona_id, **base_attrs, "_error": str(e)}
-                results.append(error_persona)
+        # サンプリングデータを生成
+        method = self.config.sampling.method
+        if row_range is None:
+            row_range = range(n)
+        logger.info("Generating base data: n=%d, seed=%d, method=%s", n, seed, method)
 
-                if on_progress:
-                    on_progress(i + 1, n, error_persona)
+        if method == "per_id":
+            # IDごとの乱数列で生成するため、担当範囲のIDだけをサンプリングすればよい
+            ids = range(start_id + row_range.start, start_id + row_range.stop)
+            return generate_per_id_nurse_data(ids, seed=seed)
 
-        return results
+        # 全行を同じシードでサンプリングしてから担当範囲だけを切り出す
+        base_data = sample_nurse_data(n=n, seed=seed, method=method)
+        return base_data.iloc[row_range.start : row_range.stop]
 
     def generate_batch_from_excel(
         self,
@@ -117,8 +166,10 @@ class PersonaGenerator:
         """
         Excelファイルから属性を読み込んでペルソナを生成
 
+        行はストリームで読み込むため、ブック全体の読み込みを待たずに1行目から生成を開始する。
+
         Args:
-            file_path: Excelファイルのパス
+            file_path: Excelファイルのパス（.parquet / .arrow / .feather も可）
             sheet_name: シート名またはインデックス（デフォルト: 0）
             n: 読み込む行数（Noneの場合は全行）
             skip_rows: スキップする先頭行数
@@ -128,59 +179,379 @@ class PersonaGenerator:
         Returns:
             list[dict]: ペルソナのリスト
         """
-        from lib.sampling import load_nurse_data_from_excel
-
-        # Excelからデータを読み込む
-        logger.info("Loading base data from Excel: %s", file_path)
-        base_data = load_nurse_data_from_excel(
+        from lib.sampling import count_nurse_data_rows, iter_nurse_data_from_excel
+
+        # 進捗表示用の総数（シートの寸法情報から求めるため読み込みは発生しない）
+        total = count_nurse_data_rows(file_path, sheet_name=sheet_name)
+        if total is None:
+            total = n
+        else:
+            total = max(0, total - skip_rows)
+            if n is not None:
+                total = min(n, total)
+
+        logger.info("Streaming base data from Excel: %s (rows=%s)", file_path, total if total is not None else "?")
+        rows = iter_nurse_data_from_excel(
             file_path=file_path,
             sheet_name=sheet_name,
             n=n,
             skip_rows=skip_rows,
         )
 
-        total = len(base_data)
-        logger.info("Loaded %d rows from Excel", total)
+        results = self._generate_rows(rows, total=total, start_id=start_id, on_progress=on_progress)
+        logger.info("Loaded %d rows from Excel", len(results))
+        return results
 
-        results = []
-        for i, row in base_data.iterrows():
-            persona_id = start_id + i
-            base_attrs = row.to_dict()
+    def regenerate(
+        self,
+        rows: Iterable[tuple[int, dict[str, Any]]],
+        on_progress: Callable[[int, int, dict], None] | None = None,
+    ) -> list[dict[str, Any]]:
+        """
+        指定したIDの行だけを作り直す（整合性チェックで違反した行など、lib/validation.py参照）
+
+        重複プロファイルのまとめ・プリフライトは行わず、元のペルソナIDのまま生成する。
+
+        Args:
+            rows: (ペルソナID, 基本属性) のイテラブル
+            on_progress: 進捗コールバック (current, total, persona) -> None
+
+        Returns:
+            list[dict]: ペルソナのリスト（rows の順）
+        """
+        rows = list(rows)
+        self._fail_fast = FailFastGuard(self.fail_fast_k)
+        results = self._run_rows(rows, total=len(rows), on_progress=on_progress)
+        if self.token_budget is not None:
+            self.token_budget.save()
+        return results
+
+    def _generate_rows(
+        self,
+        rows: Iterable[dict[str, Any]],
+        total: int | None,
+        start_id: int = 1,
+        on_progress: Callable[[int, int, dict], None] | None = None,
+    ) -> list[dict[str, Any]]:
+        """
+        基本属性の行を順に受け取り、1人ずつペルソナを生成
+
+        Args:
+            rows: 基本属性の辞書を返すイテラブル
+            total: 総数（進捗表示用、不明な場合はNone）
+            start_id: 開始ID
+            on_progress: 進捗コールバック (current, total, persona) -> None
+
+        Returns:
+            list[dict]: ペルソナのリスト
+
+        Raises:
+            PreflightError: プリフライトのリクエストが失敗した場合
+            BatchAbortedError: 最初のK件が同じ種類のエラーで失敗した場合
+        """
+        numbered: Iterable[tuple[int, dict[str, Any]]] = enumerate(rows, start=start_id)
+
+        # 同じ基本属性の行はプロファイルごとにまとめて生成する（進捗はリクエスト単位）
+        plan = None
+        if self.config.sampling.dedup:
+            from lib.dedup import DedupPlan
+
+            samples = self.config.sampling.samples_per_profile if self.config.llm.temperature > 0 else 1
+            plan = DedupPlan(numbered, samples_per_profile=samples)
+            numbered, total = plan.requests, len(plan.requests)
+
+        numbered = iter(numbered)
+        results: list[dict[str, Any]] = []
+
+        # プリフライト: 1行目だけを単独で生成し、成功したら1行目の結果としてそのまま使う
+        if self.preflight:
+            first = next(numbered, None)
+            if first is None:
+                return results
+            persona = self._preflight(*first)
+            results.append(persona)
+            if on_progress:
+                on_progress(1, total if total is not None else 1, persona)
+                on_progress = _offset_progress(on_progress, total, offset=1)
+
+        self._fail_fast = FailFastGuard(self.fail_fast_k)
+        results += self._run_rows(numbered, total=total, on_progress=on_progress)
+
+        # 実測した出力トークン数を次回の実行に引き継ぐ
+        if self.token_budget is not None:
+            self.token_budget.save()
 
+        if plan is not None:
+            results = plan.expand(results)
+
+        return results
+
+    def _run_rows(
+        self,
+        rows: Iterable[tuple[int, dict[str, Any]]],
+        total: int | None,
+        on_progress: Callable[[int, int, dict], None] | None = None,
+    ) -> list[dict[str, Any]]:
+        """(ペルソナID, 基本属性) の行を1人ずつ、またはパイプラインで並列に処理する"""
+        if self.workers > 1:
+            from lib.pipeline import GenerationPipeline
+
+            pipeline = GenerationPipeline(self, workers=self.workers)
+            return pipeline.run(rows, total=total, on_progress=on_progress)
+
+        results = []
+        for i, (persona_id, base_attrs) in enumerate(rows):
+            error = None
             try:
                 persona = self.generate_one(persona_id, base_attrs)
-                results.append(persona)
+            except Exception as e:
+                error = e
+                persona = self._error_persona(persona_id, base_attrs, e)
+
+            results.append(persona)
+            self._check_fail_fast(persona, error)
+
+            if on_progress:
+                on_progress(i + 1, total if total is not None else i + 1, persona)
+
+        return results
+
+    def _preflight(self, persona_id: int, base_attributes: dict[str, Any]) -> dict[str, Any]:
+        """
+        1行目だけを単独でリクエストし、認証情報・モデル名・パラメータ・レスポンスの形式を確かめる
 
-                if on_progress:
-                    on_progress(i + 1, total, persona)
+        Args:
+            persona_id: 1行目のペルソナID
+            base_attributes: 1行目の基本属性
+
+        Returns:
+            dict: 1行目のペルソナ
+
+        Raises:
+            PreflightError: リクエストが失敗した、またはレスポンスをパースできなかった場合
+        """
+        logger.info("Preflight: probing with persona id=%d", persona_id)
+        user_prompt = self._build_user_prompt(persona_id, base_attributes)
+        try:
+            response = self._request(user_prompt, persona_id, base_attributes)
+        except Exception as e:
+            raise PreflightError(f"プリフライトのリクエストが失敗しました: {type(e).__name__}: {e}") from e
+
+        persona = self._parse_response(response.content, persona_id, base_attributes)
+        if "_parse_error" in persona:
+            raise PreflightError(f"プリフライトのレスポンスをJSONとしてパースできません: {persona['_parse_error']}")
+
+        # 選択スコアリングでは理由のカラムは出力されない
+        columns = self.config.output.columns if self.scorer is None else [f"Choice{n}.choice" for n in self.scorer.tasks]
+        missing = [c for c in columns if c not in persona and c not in base_attributes]
+        if missing:
+            logger.warning("Preflight response is missing %d output columns: %s", len(missing), missing[:5])
+
+        logger.info("Preflight passed: %s (%s)", self.llm.provider_name, response.model)
+        return persona
+
+    def _check_fail_fast(self, persona: dict[str, Any], error: Exception | None = None) -> None:
+        """結果をフェイルファストの判定に記録する（最初のK件が同じエラーなら BatchAbortedError）"""
+        if error is not None:
+            error_type = type(error).__name__
+        elif "_parse_error" in persona:
+            error_type = "JSONDecodeError"
+        else:
+            error_type = None
+        self._fail_fast.record(error_type)
+
+    def _request(
+        self,
+        user_prompt: str,
+        persona_id: int = 0,
+        base_attributes: dict[str, Any] | None = None,
+    ) -> LLMResponse:
+        """構築済みのユーザープロンプトでLLMにリクエストし、使用量をコストレポートに記録"""
+        if self.scorer is not None:
+            response = self.scorer.score(user_prompt)
+        else:
+            response = self._request_with_budget(user_prompt, persona_id, base_attributes or {})
+        if not self.llm.records_usage:
+            self.usage.add("primary", response.model, response.usage)
+        if self.config.repair.enabled and self.scorer is None:
+            response = self._repair(response, user_prompt, persona_id, base_attributes or {})
+        return response
+
+    def _repair(self, response: LLMResponse, user_prompt: str, persona_id: int, base_attributes: dict[str, Any]) -> LLMResponse:
+        """
+        欠けた・不正なフィールドだけを追加のリクエストで補い、補った内容を反映したレスポンスを返す（lib/repair.py参照）
+
+        JSONとしてパースできないレスポンスや、欠けたフィールドが max_fields より多いレスポンスはそのまま返す。
+        """
+        from lib.repair import build_repair_prompt, invalid_fields, merge_fields, missing_fields
+        from lib.validation import load_rules
 
+        try:
+            persona = json.loads(response.content)
+        except json.JSONDecodeError:
+            return response
+        if isinstance(persona, dict) and "persona" in persona:
+            persona = persona["persona"]
+        if not isinstance(persona, dict):
+            return response
+
+        settings = self.config.repair
+        fixed = {"id", *self.config.sampling.attributes, *base_attributes}
+        rules = load_rules(self.config.validation.rules) if settings.use_rules else []
+        repaired: list[str] = []
+
+        for _ in range(settings.max_attempts):
+            candidate = {**base_attributes, **persona}
+            fields = missing_fields(persona, self.config.output.columns, fixed)
+            fields += [f for f in invalid_fields(candidate, rules, self.config.validation.numeric, fixed) if f not in fields]
+            if not fields or len(fields) > settings.max_fields:
+                break
+
+            logger.info("Repairing persona id=%d: %s", persona_id, fields)
+            try:
+                patch = self._repair_llm.generate_json(
+                    system_prompt=self.config.system_prompt,
+                    user_prompt=build_repair_prompt(user_prompt, persona, fields),
+                    temperature=self.config.llm.temperature,
+                    max_tokens=settings.max_tokens,
+                    extra_params=self.config.llm.extra_params,
+                )
             except Exception as e:
-                logger.error("Failed to generate persona id=%d: %s", persona_id, e)
-                # エラー時は基本属性のみで記録
-                error_persona = {"id": persona_id, **base_attrs, "_error": str(e)}
-                results.append(error_persona)
+                logger.warning("Repair request failed for persona id=%d: %s", persona_id, e)
+                break
+            if not self._repair_llm.records_usage:
+                self.usage.add("repair", patch.model, patch.usage)
+            repaired += [f for f in merge_fields(persona, patch.content, fields) if f not in repaired]
+
+        if not repaired:
+            return response
+        persona["_repaired"] = "、".join(repaired)
+        return LLMResponse(content=json.dumps(persona, ensure_ascii=False), model=response.model, usage=response.usage)
+
+    def _request_with_budget(self, user_prompt: str, persona_id: int, base_attributes: dict[str, Any]) -> LLMResponse:
+        """
+        max_tokens を決めてリクエスト
 
-                if on_progress:
-                    on_progress(i + 1, total, error_persona)
+        max_tokens の自動調整が有効な場合は、実測した出力トークン数から max_tokens を決め、
+        出力が打ち切られたときだけ上限を引き上げて再試行する。
+        """
+        if self.token_budget is None:
+            return self._send(user_prompt, self.config.llm.max_tokens, persona_id, base_attributes)
 
-        return results
+        max_tokens = self.token_budget.suggest()
+        retries = self.config.llm.adaptive_max_tokens.max_retries
+        while True:
+            try:
+                response = self._send(user_prompt, max_tokens, persona_id, base_attributes)
+            except TruncatedResponseError:
+                self.token_budget.record_truncated(max_tokens)
+                escalated = self.token_budget.escalate(max_tokens)
+                if escalated is None or retries <= 0:
+                    raise
+                logger.warning(
+                    "Response truncated for persona id=%d at max_tokens=%d, retrying with %d", persona_id, max_tokens, escalated
+                )
+                max_tokens, retries = escalated, retries - 1
+                continue
+
+            self.token_budget.record(response.usage)
+            return response
+
+    def _send(self, user_prompt: str, max_tokens: int, persona_id: int, base_attributes: dict[str, Any]) -> LLMResponse:
+        """1回分のリクエストを送信"""
+        if self.config.llm.stream:
+            return self._request_stream(user_prompt, max_tokens, persona_id, base_attributes)
+
+        return self.llm.generate_json(
+            system_prompt=self.config.system_prompt,
+            user_prompt=user_prompt,
+            temperature=self.config.llm.temperature,
+            max_tokens=max_tokens,
+            extra_params=self.config.llm.extra_params,
+        )
 
-    def _build_user_prompt(self, persona_id: int, base_attributes: dict[str, Any]) -> str:
-        """ユーザープロンプトを構築"""
-        # 基本属性を文字列化
-        attrs_str = "\n".join(f"- {k}: {v}" for k, v in base_attributes.items())
+    def _request_stream(
+        self, user_prompt: str, max_tokens: int, persona_id: int, base_attributes: dict[str, Any]
+    ) -> LLMResponse:
+        """
+        レスポンスをストリーミングで受け取りながら逐次パースする
 
-        # テンプレートに埋め込み
-        prompt = self.config.user_prompt
-        prompt = prompt.replace("{base_attributes}", attrs_str)
-        prompt = prompt.replace("{id}", str(persona_id))
+        JSONオブジェクトでない出力や想定外のキーを検出した時点でリクエストを打ち切り、
+        OffSchemaError を送出する（残りの生成を待たず、トークンも消費しない）。
+        """
+        stream = self.llm.stream_json(
+            system_prompt=self.config.system_prompt,
+            user_prompt=user_prompt,
+            temperature=self.config.llm.temperature,
+            max_tokens=max_tokens,
+            extra_params=self.config.llm.extra_params,
+        )
+
+        def on_field(key: str, value: Any) -> None:
+            logger.debug("Streamed field id=%d %s=%s", persona_id, key, value)
+            if self.on_field:
+                self.on_field(persona_id, key, value)
+
+        parser = IncrementalJSONParser(expected_keys=self._expected_keys(base_attributes), on_field=on_field)
+        try:
+            for chunk in stream:
+                parser.feed(chunk)
+        except OffSchemaError as e:
+            stream.close()
+            logger.warning("Cancelled off-schema response for persona id=%d: %s", persona_id, e)
+            raise
+
+        # Anthropic などは ```json で囲んで返すため、装飾を除いたオブジェクト部分を内容とする
+        response = stream.to_response()
+        response.content = parser.text
+        return response
+
+    def _create_token_budget(self) -> "TokenBudget | None":
+        """max_tokens の自動調整が有効な場合、設定名・プロバイダー・モデルごとの統計を用意する"""
+        if not self.config.llm.adaptive_max_tokens.enabled:
+            return None
+
+        from lib.token_budget import TokenBudget
+
+        key = f"{self.config.name}/{self.llm.provider_name}/{self.config.llm.model}"
+        budget = TokenBudget(key, self.config.llm.adaptive_max_tokens, default_max_tokens=self.config.llm.max_tokens)
+        logger.info("Adaptive max_tokens enabled: %s (max_tokens=%d)", key, budget.suggest())
+        return budget
+
+    def _create_scorer(self) -> "ChoiceScorer | None":
+        """選択スコアリングが有効な場合、出力カラムの ChoiceN.choice をタスクとして用意する"""
+        if not self.config.choice_scoring.enabled:
+            return None
+
+        from lib.choice_scoring import ChoiceScorer, choice_tasks
+
+        tasks = choice_tasks(self.config.output.columns)
+        logger.info("Choice scoring enabled: %d tasks per persona", len(tasks))
+        return ChoiceScorer(
+            self.llm,
+            self.config.system_prompt,
+            tasks,
+            self.config.choice_scoring,
+            temperature=self.config.llm.temperature,
+            extra_params=self.config.llm.extra_params,
+            fallback_max_tokens=self.config.llm.max_tokens,
+        )
+
+    def _expected_keys(self, base_attributes: dict[str, Any]) -> set[str] | None:
+        """レスポンスに現れてよいキー（出力カラムが未設定なら検証しない）"""
+        if not self.config.output.columns:
+            return None
+        return {"id", *self.config.output.columns, *self.config.sampling.attributes, *base_attributes}
 
-        # 各属性を個別に埋め込み
-        for key, value in base_attributes.items():
-            placeholder = "{" + key + "}"
-            prompt = prompt.replace(placeholder, str(value))
+    def _error_persona(self, persona_id: int, base_attributes: dict[str, Any], error: Exception) -> dict[str, Any]:
+        """生成に失敗したペルソナを基本属性のみで記録"""
+        logger.error("Failed to generate persona id=%d: %s", persona_id, error)
+        return {"id": persona_id, **base_attributes, "_error": str(error)}
 
-        return prompt
+    def _build_user_prompt(self, persona_id: int, base_attributes: dict[str, Any]) -> str:
+        """ユーザープロンプトを構築"""
+        user_prompt = build_user_prompt(self._user_template, persona_id, base_attributes, self.config.prompt.profile_format)
+        return user_prompt + self.prompt_hints.get(persona_id, "")
 
     def _parse_response(
         self,
@@ -220,3 +591,14 @@ class PersonaGenerator:
                 "_raw_response": content,
                 "_parse_error": str(e),
             }
+
+
+def _offset_progress(
+    on_progress: Callable[[int, int, dict], None], total: int | None, offset: int
+) -> Callable[[int, int, dict], None]:
+    """件数をoffset件ずらして進捗コールバックに渡すラッパー"""
+
+    def wrapped(current: int, current_total: int, persona: dict) -> None:
+        on_progress(current + offset, total if total is not None else current + offset, persona)
+
+    return wrapped
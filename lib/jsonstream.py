@@ -0,0 +1,180 @@
+"""ストリーミングで届くJSONオブジェクトの逐次パーサー
+
+LLMのレスポンスをチャンク単位で受け取りながら、トップレベルのフィールドが1つ完成するたびに通知する。
+出力がJSONオブジェクトでない場合や、想定外のキーが現れた場合は OffSchemaError を送出するため、
+呼び出し側はその時点でリクエストを打ち切れる。
+
+{"persona": {...}} のように1段包まれた形式にも対応し、その場合は内側のオブジェクトをフィールドとして扱う。
+"""
+
+import json
+from collections.abc import Callable, Iterable
+from typing import Any
+
+# オブジェクトの開始前に現れてもよい文字（```json などの装飾）
+_PREAMBLE_CHARS = set("`json \t\r\n")
+
+# 1段包まれた形式のラッパーキー
+_WRAPPER_KEY = "persona"
+
+
+class OffSchemaError(ValueError):
+    """レスポンスが想定したJSONの形式から外れている"""
+
+
+class IncrementalJSONParser:
+    """チャンク単位で受け取ったJSONオブジェクトを逐次パースするクラス"""
+
+    def __init__(
+        self,
+        expected_keys: Iterable[str] | None = None,
+        on_field: Callable[[str, Any], None] | None = None,
+    ):
+        """
+        IncrementalJSONParserを初期化
+
+        Args:
+            expected_keys: 出現してよいフィールド名（Noneの場合はキーを検証しない）
+            on_field: フィールドが1つ完成するたびに呼ばれるコールバック (key, value) -> None
+        """
+        self.expected_keys = set(expected_keys) if expected_keys is not None else None
+        self.on_field = on_field
+        self.fields: dict[str, Any] = {}
+        self.done = False
+
+        self._text = ""
+        self._pos = 0
+        self._start: int | None = None
+        self._end: int | None = None
+        self._started = False
+        self._depth = 0
+        self._field_depth = 1
+        self._in_string = False
+        self._escape = False
+        self._expect_key = False
+        self._key_start: int | None = None
+        self._key: str | None = None
+        self._value_start: int | None = None
+
+    def feed(self, chunk: str) -> None:
+        """
+        チャンクを追加してパースを進める
+
+        Raises:
+            OffSchemaError: JSONオブジェクトでない、または想定外のキーが現れた場合
+        """
+        self._text += chunk
+        while self._pos < len(self._text):
+            self._step(self._text[self._pos])
+            self._pos += 1
+
+    @property
+    def text(self) -> str:
+        """
+        受信したテキストのうちJSONオブジェクトの部分
+
+        前後の ```json などの装飾を除いたもので、オブジェクトが閉じる前は途中までを返す。
+        オブジェクトが始まっていない場合は受信したテキストをそのまま返す。
+        """
+        if self._start is None:
+            return self._text
+        return self._text[self._start : self._end]
+
+    def _step(self, c: str) -> None:
+        """1文字分パースを進める"""
+        if not self._started:
+            self._step_preamble(c)
+        elif self.done:
+            return
+        elif self._in_string:
+            self._step_string(c)
+        elif c == '"':
+            self._in_string = True
+            if self._depth == self._field_depth and self._expect_key:
+                self._key_start = self._pos
+                self._expect_key = False
+        elif c == ":" and self._depth == self._field_depth and self._key is not None and self._value_start is None:
+            self._value_start = self._pos + 1
+        elif c in "{[":
+            self._open(c)
+        elif c in "}]":
+            self._close(c)
+        elif c == "," and self._depth == self._field_depth:
+            self._finish_value()
+            self._expect_key = True
+
+    def _step_preamble(self, c: str) -> None:
+        """オブジェクト開始前の文字を読み飛ばす"""
+        if c == "{":
+            self._started = True
+            self._start = self._pos
+            self._depth = 1
+            self._expect_key = True
+        elif c not in _PREAMBLE_CHARS:
+            raise OffSchemaError(f"JSONオブジェクトではない出力です: {self._text[: self._pos + 1]!r}")
+
+    def _step_string(self, c: str) -> None:
+        """文字列の中を読み進め、キーが完成したら検証する"""
+        if self._escape:
+            self._escape = False
+        elif c == "\\":
+            self._escape = True
+        elif c == '"':
+            self._in_string = False
+            if self._key_start is not None:
+                self._key = json.loads(self._text[self._key_start : self._pos + 1])
+                self._key_start = None
+                self._check_key(self._key)
+
+    def _open(self, c: str) -> None:
+        """オブジェクト・配列の開始"""
+        # {"persona": {...}} の場合は内側のオブジェクトをフィールドの階層とする
+        is_wrapper = (
+            c == "{"
+            and self._depth == 1
+            and self._field_depth == 1
+            and self._key == _WRAPPER_KEY
+            and self._value_start is not None
+        )
+        self._depth += 1
+        if is_wrapper:
+            self._field_depth = 2
+            self._expect_key = True
+            self._key = None
+            self._value_start = None
+
+    def _close(self, c: str) -> None:
+        """オブジェクト・配列の終了"""
+        if c == "}" and self._depth == self._field_depth:
+            self._finish_value()
+        self._depth -= 1
+        if self._depth == 0:
+            self.done = True
+            self._end = self._pos + 1
+
+    def _check_key(self, key: str) -> None:
+        """キーが想定内か検証する"""
+        if self.expected_keys is None:
+            return
+        if self._field_depth == 1 and key == _WRAPPER_KEY:
+            return
+        if key not in self.expected_keys:
+            raise OffSchemaError(f"想定外のキーです: {key}")
+
+    def _finish_value(self) -> None:
+        """値が完成したフィールドを記録して通知する"""
+        if self._key is None or self._value_start is None:
+            return
+
+        raw = self._text[self._value_start : self._pos].strip()
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise OffSchemaError(f"フィールド {self._key} の値がJSONとして不正です: {raw[:50]!r}") from e
+
+        self.fields[self._key] = value
+        if self.on_field:
+            self.on_field(self._key, value)
+
+        self._key = None
+        self._value_start = None
@@ -1,8 +1,34 @@
-"""LLMクライアントモジュール"""
+"""LLMクライアントモジュール
 
-from .anthropic_client import AnthropicClient
-from .base import LLMClient, LLMResponse
-from .gemini_client import GeminiClient
-from .openai_client import OpenAIClient
+各プロバイダーのSDKは読み込みが重いため、クライアントクラスは属性に初めてアクセスしたときに読み込む。
+"""
 
-__all__ = ["LLMClient", "LLMResponse", "OpenAIClient", "AnthropicClient", "GeminiClient"]
+from importlib import import_module
+
+from .base import LLMClient, LLMResponse, TruncatedResponseError
+
+# 公開名 -> 定義しているサブモジュール
+_CLIENTS = {
+    "OpenAIClient": ".openai_client",
+    "AnthropicClient": ".anthropic_client",
+    "GeminiClient": ".gemini_client",
+    "HedgedClient": ".hedged_client",
+    "RoutingClient": ".routing_client",
+}
+
+__all__ = [
+    "LLMClient",
+    "LLMResponse",
+    "TruncatedResponseError",
+    "OpenAIClient",
+    "AnthropicClient",
+    "GeminiClient",
+    "HedgedClient",
+    "RoutingClient",
+]
+
+
+def __getattr__(name: str):
+    if name not in _CLIENTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(import_module(_CLIENTS[name], __name__), name)
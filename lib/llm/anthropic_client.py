@@ -6,22 +6,47 @@ from anthropic import Anthropic
 
 from lib.log import logger
 
-from .base import LLMClient, LLMResponse
+from .base import LLMClient, LLMResponse, LLMStream, TruncatedResponseError, resolve_thinking_budget
+
+# Anthropicには response_format がないため、システムプロンプトの末尾にJSON出力の指示を付ける
+# 拡張思考の予算の下限（APIの制約）
+MIN_THINKING_BUDGET = 1024
+
+JSON_INSTRUCTION = "\n\n重要: 出力は必ず有効なJSONオブジェクトのみを返してください。説明文や前後のテキストは不要です。** 先頭にjsonをつけるな。 **"
+
+
+def _usage(usage) -> dict:
+    """レスポンスの usage を共通の形式に変換（思考トークンは output_tokens に含まれ、内訳は返されない）"""
+    return {
+        "prompt_tokens": usage.input_tokens,
+        "completion_tokens": usage.output_tokens,
+        "total_tokens": usage.input_tokens + usage.output_tokens,
+    }
 
 
 class AnthropicClient(LLMClient):
     """Anthropic APIを使用するLLMクライアント"""
 
-    def __init__(self, api_key: str, model: str = "claude-sonnet-4-20250514"):
+    def __init__(
+        self,
+        api_key: str,
+        model: str = "claude-sonnet-4-20250514",
+        thinking_budget: int | None = None,
+        reasoning_effort: str | None = None,
+    ):
         """
         Anthropicクライアントを初期化
 
         Args:
             api_key: Anthropic APIキー
             model: 使用するモデル名
+            thinking_budget: 拡張思考の予算（0またはNoneで思考なし、1024未満は1024に切り上げる）
+            reasoning_effort: 予算の代わりに指定する思考の度合い（minimal | low | medium | high）
         """
         self._client = Anthropic(api_key=api_key)
         self._model = model
+        budget = resolve_thinking_budget(thinking_budget, reasoning_effort)
+        self._thinking_budget = max(budget, MIN_THINKING_BUDGET) if budget else 0
 
     @property
     def provider_name(self) -> str:
@@ -37,10 +62,7 @@ class AnthropicClient(LLMClient):
     ) -> LLMResponse:
         logger.info("Anthropic generate: model=%s", self._model)
 
-        # extra_params にトークン制限がなければ max_tokens を使用
-        params = extra_params.copy() if extra_params else {}
-        if "max_tokens" not in params:
-            params["max_tokens"] = max_tokens
+        params = self._request_params(temperature, max_tokens, extra_params)
 
         response = self._client.messages.create(
             model=self._model,
@@ -48,7 +70,6 @@ class AnthropicClient(LLMClient):
             messages=[
                 {"role": "user", "content": user_prompt},
             ],
-            temperature=temperature,
             **params,
         )
 
@@ -57,11 +78,7 @@ class AnthropicClient(LLMClient):
             if block.type == "text":
                 content += block.text
 
-        usage = {
-            "prompt_tokens": response.usage.input_tokens,
-            "completion_tokens": response.usage.output_tokens,
-            "total_tokens": response.usage.input_tokens + response.usage.output_tokens,
-        }
+        usage = _usage(response.usage)
 
         logger.info("Anthropic response received: tokens=%d", usage["total_tokens"])
 
@@ -85,13 +102,9 @@ class AnthropicClient(LLMClient):
         logger.info("Anthropic generate_json: model=%s", self._model)
 
         # JSON出力を強制するための指示を追加
-        json_instruction = "\n\n重要: 出力は必ず有効なJSONオブジェクトのみを返してください。説明文や前後のテキストは不要です。** 先頭にjsonをつけるな。 **"
-        enhanced_system_prompt = system_prompt + json_instruction
+        enhanced_system_prompt = system_prompt + JSON_INSTRUCTION
 
-        # extra_params にトークン制限がなければ max_tokens を使用
-        params = extra_params.copy() if extra_params else {}
-        if "max_tokens" not in params:
-            params["max_tokens"] = max_tokens
+        params = self._request_params(temperature, max_tokens, extra_params)
 
         logger.info("Anthropic JSON SYSTEM: %s", enhanced_system_prompt)
         logger.info("Anthropic JSON USER: %s", user_prompt)
@@ -102,10 +115,13 @@ class AnthropicClient(LLMClient):
             messages=[
                 {"role": "user", "content": user_prompt},
             ],
-            temperature=temperature,
             **params,
         )
 
+        # 出力が max_tokens に達した場合、JSONが途中で切れている
+        if response.stop_reason == "max_tokens":
+            raise TruncatedResponseError("Anthropic", params["max_tokens"])
+
         content = ""
         for block in response.content:
             if block.type == "text":
@@ -120,13 +136,75 @@ class AnthropicClient(LLMClient):
             content = re.sub(r"json\n?", "", content, flags=re.DOTALL)
         print(f"# 3 #########\n{content}$$$$$$$$$$$$\n")
 
-        usage = {
-            "prompt_tokens": response.usage.input_tokens,
-            "completion_tokens": response.usage.output_tokens,
-            "total_tokens": response.usage.input_tokens + response.usage.output_tokens,
-        }
+        usage = _usage(response.usage)
 
         logger.info("Anthropic JSON response: %s", response)
         logger.info("Anthropic JSON response received: tokens=%d", usage["total_tokens"])
 
         return LLMResponse(content=content, model=self._model, usage=usage)
+
+    def stream_json(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float = 1.0,
+        max_tokens: int = 2000,
+        extra_params: dict | None = None,
+    ) -> LLMStream:
+        """
+        JSON形式での出力を要求し、レスポンスをストリーミングで受け取る
+
+        Note:
+            先頭の ```json などの装飾は取り除かずにそのまま返す（呼び出し側のパーサーで読み飛ばす）
+        """
+        logger.info("Anthropic stream_json: model=%s", self._model)
+
+        # JSON出力を強制するための指示を追加
+        enhanced_system_prompt = system_prompt + JSON_INSTRUCTION
+
+        params = self._request_params(temperature, max_tokens, extra_params)
+
+        manager = self._client.messages.stream(
+            model=self._model,
+            system=enhanced_system_prompt,
+            messages=[
+                {"role": "user", "content": user_prompt},
+            ],
+            **params,
+        )
+
+        llm_stream = LLMStream(chunks=iter(()), model=self._model)
+
+        def chunks():
+            # ジェネレーターが閉じられると with を抜けてHTTPストリームも閉じる
+            with manager as stream:
+                yield from stream.text_stream
+                message = stream.get_final_message()
+                if message.stop_reason == "max_tokens":
+                    raise TruncatedResponseError("Anthropic", params["max_tokens"])
+                llm_stream.usage = _usage(message.usage)
+            logger.info("Anthropic usage: %s", llm_stream.usage)
+
+        llm_stream.chunks = chunks()
+        return llm_stream
+
+    def _request_params(self, temperature: float, max_tokens: int, extra_params: dict | None) -> dict:
+        """
+        リクエストのパラメータを組み立てる
+
+        拡張思考では temperature を変更できないため送らない。max_tokens は思考を含む上限のため、
+        予算以下のときは予算に max_tokens を上乗せして回答の分を残す。
+        """
+        # extra_params にトークン制限がなければ max_tokens を使用
+        params = extra_params.copy() if extra_params else {}
+        if "max_tokens" not in params:
+            params["max_tokens"] = max_tokens
+
+        if self._thinking_budget and "thinking" not in params:
+            if params["max_tokens"] <= self._thinking_budget:
+                params["max_tokens"] += self._thinking_budget
+            params["thinking"] = {"type": "enabled", "budget_tokens": self._thinking_budget}
+
+        if "thinking" not in params:
+            params["temperature"] = temperature
+        return params
@@ -1,7 +1,65 @@
 """LLMクライアントの基底クラス定義"""
 
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from lib.usage import UsageReport
+
+
+class TruncatedResponseError(ValueError):
+    """出力が max_tokens に達して打ち切られた"""
+
+    def __init__(self, provider: str, max_tokens: int):
+        super().__init__(
+            f"{provider} response was truncated due to max_tokens limit ({max_tokens}). Please increase max_tokens in config."
+        )
+        self.max_tokens = max_tokens
+
+
+# reasoning_effort を思考トークンの予算に換算する目安（予算で指定するGemini / Anthropic用）
+EFFORT_BUDGETS = {"minimal": 0, "low": 1024, "medium": 4096, "high": 16384}
+
+
+def resolve_thinking_budget(thinking_budget: int | None, reasoning_effort: str | None) -> int | None:
+    """
+    思考トークンの予算を求める（予算の指定を優先し、なければ reasoning_effort から換算する）
+
+    Args:
+        thinking_budget: 思考トークンの予算（0で思考なし）
+        reasoning_effort: 思考の度合い（minimal | low | medium | high）
+
+    Returns:
+        int | None: 思考トークンの予算（どちらも指定がなければNone = モデルの既定）
+    """
+    if thinking_budget is not None:
+        return thinking_budget
+    if reasoning_effort is None:
+        return None
+    if reasoning_effort not in EFFORT_BUDGETS:
+        raise ValueError(f"未対応の reasoning_effort: {reasoning_effort}（{' | '.join(EFFORT_BUDGETS)}）")
+    return EFFORT_BUDGETS[reasoning_effort]
+
+
+def resolve_reasoning_effort(thinking_budget: int | None, reasoning_effort: str | None) -> str | None:
+    """
+    思考の度合いを求める（reasoning_effort の指定を優先し、なければ予算から近い段階を選ぶ）
+
+    Args:
+        thinking_budget: 思考トークンの予算（0で思考なし）
+        reasoning_effort: 思考の度合い（minimal | low | medium | high）
+
+    Returns:
+        str | None: 思考の度合い（どちらも指定がなければNone = モデルの既定）
+    """
+    if reasoning_effort is not None or thinking_budget is None:
+        return reasoning_effort
+    for effort, budget in EFFORT_BUDGETS.items():
+        if thinking_budget <= budget:
+            return effort
+    return "high"
 
 
 @dataclass
@@ -10,12 +68,65 @@ class LLMResponse:
 
     content: str
     model: str
-    usage: dict
+    usage: dict  # prompt_tokens, completion_tokens, total_tokens（分かる場合は thinking_tokens も）
+
+
+@dataclass
+class LLMStream:
+    """
+    LLMからのストリーミングレスポンス
+
+    イテレートするとテキストのチャンクを順に返す。close() で途中で打ち切ると、
+    下層のHTTPストリームも閉じられ、以降の生成は行われない。
+    usage はストリームを最後まで読み終えた時点で設定される。
+    """
+
+    chunks: Iterator[str]
+    model: str
+    usage: dict = field(default_factory=dict)
+    on_close: Callable[[], None] | None = None
+    _content: list[str] = field(default_factory=list)
+
+    def __iter__(self) -> Iterator[str]:
+        for chunk in self.chunks:
+            self._content.append(chunk)
+            yield chunk
+
+    def close(self) -> None:
+        """ストリームを打ち切る"""
+        close = getattr(self.chunks, "close", None)
+        if close:
+            close()
+        if self.on_close:
+            self.on_close()
+
+    def to_response(self) -> LLMResponse:
+        """ここまでに受信した内容をLLMResponseにまとめる"""
+        return LLMResponse(content="".join(self._content), model=self.model, usage=self.usage)
 
 
 class LLMClient(ABC):
     """LLMクライアントの抽象基底クラス（Strategyパターン）"""
 
+    # 内部で複数のリクエストを送るクライアント（ヘッジなど）は、bind_usage で渡されたレポートに自前で使用量を記録する
+    records_usage: bool = False
+
+    def bind_usage(self, report: "UsageReport", kind: str = "primary") -> "LLMClient":
+        """
+        使用量の記録先を結び付けたクライアントを返す
+
+        自前で使用量を記録しないクライアントはそのまま返す。サーバーモードではクライアントを
+        ジョブ間で使い回すため、記録先はクライアント自身ではなくジョブ（PersonaGenerator）ごとに渡す。
+
+        Args:
+            report: 使用量の記録先
+            kind: このクライアントで送るリクエストの種別（primary / repair）
+
+        Returns:
+            LLMClient: 記録先を結び付けたクライアント
+        """
+        return self
+
     @property
     @abstractmethod
     def provider_name(self) -> str:
@@ -69,3 +180,56 @@ class LLMClient(ABC):
             LLMResponse: レスポンスオブジェクト（contentはJSON文字列）
         """
         pass
+
+    def stream_json(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float = 1.0,
+        max_tokens: int = 2000,
+        extra_params: dict | None = None,
+    ) -> LLMStream:
+        """
+        JSON形式での出力を強制し、レスポンスをストリーミングで受け取る
+
+        ストリーミングに対応していないクライアントでは、generate_json の結果を1チャンクとして返す。
+
+        Args:
+            system_prompt: システムプロンプト
+            user_prompt: ユーザープロンプト
+            temperature: 生成の多様性（0.0-2.0）
+            max_tokens: 最大トークン数
+            extra_params: モデル固有の追加パラメータ
+
+        Returns:
+            LLMStream: テキストのチャンクを返すストリーム
+        """
+        response = self.generate_json(system_prompt, user_prompt, temperature, max_tokens, extra_params)
+        return LLMStream(chunks=iter([response.content]), model=response.model, usage=response.usage)
+
+    def option_logprobs(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float = 1.0,
+        max_tokens: int = 16,
+        top_logprobs: int = 5,
+        extra_params: dict | None = None,
+    ) -> tuple[list[tuple[str, dict[str, float]]], LLMResponse]:
+        """
+        短い回答を生成し、生成したトークンごとに候補の対数確率を返す（選択肢の確率を求めるのに使う）
+
+        log-probability に対応していないクライアントでは NotImplementedError を送出する。
+
+        Args:
+            system_prompt: システムプロンプト
+            user_prompt: ユーザープロンプト
+            temperature: 生成の多様性（0.0-2.0）
+            max_tokens: 最大トークン数
+            top_logprobs: 位置ごとに受け取る候補の数
+            extra_params: モデル固有の追加パラメータ
+
+        Returns:
+            tuple: ([(生成したトークン, 候補トークン -> 対数確率), ...], レスポンス)
+        """
+        raise NotImplementedError(f"{self.provider_name} は log-probability に対応していません")
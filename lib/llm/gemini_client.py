@@ -5,19 +5,43 @@ from google.genai import types
 
 from lib.log import logger
 
-from .base import LLMClient, LLMResponse
+from .base import LLMClient, LLMResponse, LLMStream, TruncatedResponseError, resolve_thinking_budget
+
+
+# 思考を無効にできない（thinking_budget=0 を受け付けない）モデル
+THINKING_REQUIRED_MODELS = ("models/gemini-2.5-pro",)
+
+
+def _usage(metadata) -> dict:
+    """usage_metadata を共通の usage に変換（candidates_token_count には思考トークンが含まれない）"""
+    if metadata is None:
+        return {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "thinking_tokens": 0}
+    return {
+        "prompt_tokens": metadata.prompt_token_count or 0,
+        "completion_tokens": metadata.candidates_token_count or 0,
+        "total_tokens": metadata.total_token_count or 0,
+        "thinking_tokens": metadata.thoughts_token_count or 0,
+    }
 
 
 class GeminiClient(LLMClient):
     """Google Gemini APIを使用するLLMクライアント"""
 
-    def __init__(self, api_key: str, model: str = "gemini-2.0-flash"):
+    def __init__(
+        self,
+        api_key: str,
+        model: str = "gemini-2.0-flash",
+        thinking_budget: int | None = None,
+        reasoning_effort: str | None = None,
+    ):
         """
         Geminiクライアントを初期化
 
         Args:
             api_key: Gemini APIキー
             model: 使用するモデル名
+            thinking_budget: 思考トークンの予算（0で思考なし。2.5 Pro は無効にできず128以上）
+            reasoning_effort: 予算の代わりに指定する思考の度合い（minimal | low | medium | high）
         """
         self._client = genai.Client(api_key=api_key)
         # モデル名を小文字に変換し、models/ プレフィックスがなければ追加
@@ -25,6 +49,7 @@ class GeminiClient(LLMClient):
         if not model.startswith("models/"):
             model = f"models/{model}"
         self._model = model
+        self._thinking_budget = resolve_thinking_budget(thinking_budget, reasoning_effort)
 
     @property
     def provider_name(self) -> str:
@@ -44,6 +69,7 @@ class GeminiClient(LLMClient):
             system_instruction=system_prompt,
             temperature=temperature,
             max_output_tokens=max_tokens,
+            thinking_config=self._thinking_config(),
         )
 
         logger.debug("Gemini SYSTEM_PROMPT", system_prompt)
@@ -56,11 +82,7 @@ class GeminiClient(LLMClient):
 
         logger.debug("Gemini RESPONSE", response)
         content = response.text or ""
-        usage = {
-            "prompt_tokens": response.usage_metadata.prompt_token_count if response.usage_metadata else 0,
-            "completion_tokens": response.usage_metadata.candidates_token_count if response.usage_metadata else 0,
-            "total_tokens": response.usage_metadata.total_token_count if response.usage_metadata else 0,
-        }
+        usage = _usage(response.usage_metadata)
 
         logger.info("Gemini response received: tokens=%d", usage["total_tokens"])
 
@@ -79,10 +101,9 @@ class GeminiClient(LLMClient):
         config = types.GenerateContentConfig(
             system_instruction=system_prompt,
             temperature=temperature,
-            include_thoughts=True,
             max_output_tokens=max_tokens,
             response_mime_type="application/json",
-                        
+            thinking_config=self._thinking_config(),
         )
 
         logger.debug("Gemini SYSTEM: %s", system_prompt)
@@ -99,18 +120,102 @@ class GeminiClient(LLMClient):
         if response.candidates and response.candidates[0].finish_reason:
             finish_reason = response.candidates[0].finish_reason
             if finish_reason.name == "MAX_TOKENS":
-                raise ValueError(
-                    f"Gemini response was truncated due to max_tokens limit ({max_tokens}). "
-                    "Please increase max_tokens in config."
-                )
+                raise TruncatedResponseError("Gemini", max_tokens)
 
         content = response.text or ""
-        usage = {
-            "prompt_tokens": response.usage_metadata.prompt_token_count if response.usage_metadata else 0,
-            "completion_tokens": response.usage_metadata.candidates_token_count if response.usage_metadata else 0,
-            "total_tokens": response.usage_metadata.total_token_count if response.usage_metadata else 0,
-        }
+        usage = _usage(response.usage_metadata)
 
         logger.info("Gemini usage: %s", usage)
 
         return LLMResponse(content=content, model=self._model, usage=usage)
+
+    def stream_json(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float = 1.0,
+        max_tokens: int = 8192,
+        extra_params: dict | None = None,
+    ) -> LLMStream:
+        logger.info("Gemini stream_json: model=%s, max_tokens=%d", self._model, max_tokens)
+
+        config = types.GenerateContentConfig(
+            system_instruction=system_prompt,
+            temperature=temperature,
+            max_output_tokens=max_tokens,
+            response_mime_type="application/json",
+            thinking_config=self._thinking_config(),
+        )
+
+        response = self._client.models.generate_content_stream(
+            model=self._model,
+            contents=user_prompt,
+            config=config,
+        )
+
+        llm_stream = LLMStream(chunks=iter(()), model=self._model, on_close=getattr(response, "close", None))
+
+        def chunks():
+            for chunk in response:
+                if chunk.text:
+                    yield chunk.text
+
+                if chunk.usage_metadata:
+                    llm_stream.usage = _usage(chunk.usage_metadata)
+
+                # finish_reasonを確認
+                if chunk.candidates and chunk.candidates[0].finish_reason:
+                    if chunk.candidates[0].finish_reason.name == "MAX_TOKENS":
+                        raise TruncatedResponseError("Gemini", max_tokens)
+            logger.info("Gemini usage: %s", llm_stream.usage)
+
+        llm_stream.chunks = chunks()
+        return llm_stream
+
+    def option_logprobs(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float = 1.0,
+        max_tokens: int = 16,
+        top_logprobs: int = 5,
+        extra_params: dict | None = None,
+    ) -> tuple[list[tuple[str, dict[str, float]]], LLMResponse]:
+        """
+        思考を無効にして回答のトークンの log-probability を求める
+
+        思考トークンも max_output_tokens に含まれるため、思考すると短い上限を使い切って回答が返らない。
+        思考を無効にできないモデルでは NotImplementedError を送出する（呼び出し側はサンプリングで回答する）。
+        """
+        logger.info("Gemini option_logprobs: model=%s", self._model)
+        if self._model.startswith(THINKING_REQUIRED_MODELS):
+            raise NotImplementedError(f"{self._model} は思考を無効にできないため、log-probability を求められません")
+
+        config = types.GenerateContentConfig(
+            system_instruction=system_prompt,
+            temperature=temperature,
+            max_output_tokens=max_tokens,
+            response_logprobs=True,
+            logprobs=top_logprobs,
+            thinking_config=types.ThinkingConfig(thinking_budget=0),
+        )
+        response = self._client.models.generate_content(
+            model=self._model,
+            contents=user_prompt,
+            config=config,
+        )
+
+        # chosen_candidates は生成したトークン、top_candidates は同じ位置の候補
+        result = response.candidates[0].logprobs_result if response.candidates else None
+        tokens = []
+        if result and result.chosen_candidates and result.top_candidates:
+            for chosen, top in zip(result.chosen_candidates, result.top_candidates, strict=False):
+                tokens.append((chosen.token, {c.token: c.log_probability for c in top.candidates or []}))
+
+        return tokens, LLMResponse(content=response.text or "", model=self._model, usage=_usage(response.usage_metadata))
+
+    def _thinking_config(self) -> types.ThinkingConfig | None:
+        """思考トークンの予算の設定（指定がなければモデルの既定に任せる）"""
+        if self._thinking_budget is None:
+            return None
+        return types.ThinkingConfig(thinking_budget=self._thinking_budget)
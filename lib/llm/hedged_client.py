@@ -0,0 +1,254 @@
+"""ヘッジリクエストでテールレイテンシを抑えるLLMクライアント
+
+プライマリへのリクエストが観測したレイテンシのパーセンタイル（既定p90）を過ぎても返ってこない場合、
+同じリクエストをセカンダリ（別プロバイダー・別モデル）にも送り、先に返った有効なレスポンスを採用する。
+
+- 採用されなかったリクエストは、SDKの途中で止められないため、完了を待たずに結果を捨てる（使用量は完了時に記録する）
+- ストリーミングはヘッジせずプライマリに送る（読み比べると形式外れの早期打ち切りが効かず、
+  採用されなかったストリームも最初のチャンクが届くまで閉じられないため）
+- ヘッジで送ったリクエストは使用量レポートで種別 "hedge" として別に集計する。記録先のレポートは
+  bind_usage でジョブごとに結び付ける（サーバーモードでクライアントを使い回しても、ジョブ間で混ざらない）
+"""
+
+import copy
+import json
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+from lib.log import logger
+from lib.usage import UsageReport
+
+from .base import LLMClient, LLMResponse, LLMStream
+
+# レイテンシの観測値を保持する件数
+LATENCY_WINDOW = 200
+
+
+class HedgedClient(LLMClient):
+    """プライマリが遅いときにセカンダリへ重複リクエストを送るLLMクライアント"""
+
+    records_usage = True
+
+    def __init__(
+        self,
+        primary: LLMClient,
+        secondary: LLMClient,
+        percentile: float = 90.0,
+        min_samples: int = 5,
+        initial_delay: float = 30.0,
+        max_workers: int = 32,
+    ):
+        """
+        HedgedClientを初期化
+
+        Args:
+            primary: 通常使うLLMクライアント
+            secondary: ヘッジ先のLLMクライアント
+            percentile: ヘッジを送るまでの待ち時間に使う、プライマリのレイテンシのパーセンタイル
+            min_samples: この件数が集まるまでは initial_delay を待ち時間に使う
+            initial_delay: 観測値が少ないうちの待ち時間（秒）
+            max_workers: 同時に実行するリクエストの上限
+        """
+        self.primary = primary
+        self.secondary = secondary
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.initial_delay = initial_delay
+        # 使用量の記録先（bind_usage で結び付ける。Noneの場合は記録しない）
+        self._usage_report: UsageReport | None = None
+        self._kind = "primary"
+        self._latencies: deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+
+    @property
+    def provider_name(self) -> str:
+        return self.primary.provider_name
+
+    def bind_usage(self, report: UsageReport, kind: str = "primary") -> "HedgedClient":
+        """
+        使用量の記録先を結び付けたクライアントを返す
+
+        レイテンシの観測値・スレッドプール・プライマリとセカンダリのクライアントは元のクライアントと共有する。
+        """
+        bound = copy.copy(self)
+        bound._usage_report = report
+        bound._kind = kind
+        return bound
+
+    def hedge_delay(self) -> float:
+        """
+        ヘッジを送るまでの待ち時間（秒）
+
+        Returns:
+            float: プライマリのレイテンシのパーセンタイル（観測値が少ないうちは initial_delay）
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < self.min_samples:
+            return self.initial_delay
+        rank = math.ceil(self.percentile / 100 * len(latencies))
+        return latencies[min(max(rank, 1), len(latencies)) - 1]
+
+    def generate(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float = 1.0,
+        max_tokens: int = 2000,
+        extra_params: dict | None = None,
+    ) -> LLMResponse:
+        args = (system_prompt, user_prompt, temperature, max_tokens, extra_params)
+        return self._hedge(lambda client: client.generate(*args), validate_json=False)
+
+    def generate_json(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float = 1.0,
+        max_tokens: int = 2000,
+        extra_params: dict | None = None,
+    ) -> LLMResponse:
+        args = (system_prompt, user_prompt, temperature, max_tokens, extra_params)
+        return self._hedge(lambda client: client.generate_json(*args), validate_json=True)
+
+    def stream_json(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float = 1.0,
+        max_tokens: int = 2000,
+        extra_params: dict | None = None,
+    ) -> LLMStream:
+        """
+        ストリーミングはヘッジせず、プライマリのストリームをそのまま返す
+
+        呼び出し側がストリームを打ち切れば（形式外れの検出など）、プライマリへのリクエストもその時点で止まる。
+        使用量は、読み終えるか打ち切った時点で結び付けたレポートに記録する。
+        """
+        stream = self.primary.stream_json(system_prompt, user_prompt, temperature, max_tokens, extra_params)
+        report, kind = self._usage_report, self._kind
+
+        def chunks():
+            try:
+                yield from stream
+            finally:
+                if report is not None:
+                    report.add(kind, stream.model, stream.usage)
+
+        return LLMStream(chunks=chunks(), model=stream.model, on_close=stream.close)
+
+    def _hedge(self, request, validate_json: bool) -> LLMResponse:
+        """
+        プライマリに送信し、待ち時間を過ぎたらセカンダリにも送信して、先に返った有効なレスポンスを返す
+
+        Args:
+            request: client -> LLMResponse を行う関数
+            validate_json: レスポンスがJSONとしてパースできるものだけを有効とするか
+
+        Returns:
+            LLMResponse: 採用されたレスポンス（JSONとして有効なものがなければ、最後に返ったJSONでないレスポンス）
+        """
+        call = _HedgeCall(self._usage_report)
+        futures = {self._submit(self.primary, self._kind, request, call): "primary"}
+
+        delay = self.hedge_delay()
+        done, _ = wait(futures, timeout=delay)
+        if not done:
+            logger.info("Primary did not respond within %.1fs, sending hedge request", delay)
+            futures[self._submit(self.secondary, "hedge", request, call)] = "hedge"
+
+        pending = set(futures)
+        errors: list[BaseException] = []
+        invalid: Future | None = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                error = future.exception()
+                if error is not None:
+                    errors.append(error)
+                    continue
+                if validate_json and not _is_json(future.result().content):
+                    logger.warning("Invalid JSON response from %s", futures[future])
+                    invalid = future
+                    continue
+
+                # 採用したら残りのリクエストを打ち切る
+                call.decide(future)
+                for other in pending:
+                    other.cancel()
+                if futures[future] == "hedge":
+                    logger.info("Hedge request won")
+                return future.result()
+
+        # 有効なレスポンスがなければ、JSONでないレスポンスをそのまま返す（ヘッジなしと同じく呼び出し側でパースエラーになる）
+        call.decide(invalid)
+        if invalid is not None:
+            return invalid.result()
+        raise errors[0]
+
+    def _submit(self, client: LLMClient, kind: str, request, call: "_HedgeCall") -> Future:
+        """リクエストをスレッドで実行し、完了時にレイテンシと使用量を記録する"""
+        started = time.monotonic()
+        future = self._executor.submit(request, client)
+
+        def on_done(f: Future) -> None:
+            if kind != "hedge" and not f.cancelled() and f.exception() is None:
+                with self._lock:
+                    self._latencies.append(time.monotonic() - started)
+            call.finished(f, kind)
+
+        future.add_done_callback(on_done)
+        return future
+
+
+class _HedgeCall:
+    """
+    1回のヘッジ呼び出しの状態
+
+    採用されるレスポンスが決まる前に完了したリクエストは保留しておき、決まった時点でまとめて使用量を記録する。
+    決まった後に完了したリクエスト（結果を捨てたもの）は完了時に記録する。
+    """
+
+    def __init__(self, usage_report: UsageReport | None):
+        self._usage_report = usage_report
+        self._lock = threading.Lock()
+        self._decided = False
+        self._winner: Future | None = None
+        self._finished: list[tuple[Future, str]] = []
+
+    def finished(self, future: Future, kind: str) -> None:
+        """リクエストが完了した"""
+        with self._lock:
+            if not self._decided:
+                self._finished.append((future, kind))
+                return
+        self._record(future, kind)
+
+    def decide(self, winner: Future | None) -> None:
+        """採用するレスポンスが決まった（すべて失敗した場合はNone）"""
+        with self._lock:
+            self._decided = True
+            self._winner = winner
+            finished, self._finished = self._finished, []
+        for future, kind in finished:
+            self._record(future, kind)
+
+    def _record(self, future: Future, kind: str) -> None:
+        """1リクエスト分の使用量を記録"""
+        if self._usage_report is None or future.cancelled() or future.exception() is not None:
+            return
+        response = future.result()
+        self._usage_report.add(kind, response.model, response.usage, adopted=future is self._winner)
+
+
+def _is_json(content: str) -> bool:
+    """文字列がJSONとしてパースできるか"""
+    try:
+        json.loads(content)
+    except json.JSONDecodeError:
+        return False
+    return True
@@ -4,22 +4,53 @@ from openai import OpenAI
 
 from lib.log import logger
 
-from .base import LLMClient, LLMResponse
+from .base import LLMClient, LLMResponse, LLMStream, TruncatedResponseError, resolve_reasoning_effort
+
+
+def _token_limit(params: dict) -> int:
+    """リクエストに指定したトークン上限"""
+    return params.get("max_completion_tokens", params.get("max_tokens", 0))
+
+
+def _usage(usage) -> dict:
+    """レスポンスの usage を共通の形式に変換（completion_tokens には推論トークンが含まれる）"""
+    if usage is None:
+        return {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    result = {
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "total_tokens": usage.total_tokens,
+    }
+    details = getattr(usage, "completion_tokens_details", None)
+    if details is not None and details.reasoning_tokens is not None:
+        result["thinking_tokens"] = details.reasoning_tokens
+    return result
 
 
 class OpenAIClient(LLMClient):
     """OpenAI APIを使用するLLMクライアント"""
 
-    def __init__(self, api_key: str, model: str = "gpt-4o-mini"):
+    def __init__(
+        self,
+        api_key: str,
+        model: str = "gpt-4o-mini",
+        thinking_budget: int | None = None,
+        reasoning_effort: str | None = None,
+        base_url: str | None = None,
+    ):
         """
         OpenAIクライアントを初期化
 
         Args:
             api_key: OpenAI APIキー
             model: 使用するモデル名
+            thinking_budget: 思考トークンの予算（OpenAIでは近い reasoning_effort に換算する）
+            reasoning_effort: 推論の度合い（minimal | low | medium | high、推論モデルのみ）
+            base_url: OpenAI互換のAPIサーバー（ローカルのスタブなど）のURL（Noneの場合はOpenAI）
         """
-        self._client = OpenAI(api_key=api_key)
+        self._client = OpenAI(api_key=api_key, base_url=base_url)
         self._model = model
+        self._reasoning_effort = resolve_reasoning_effort(thinking_budget, reasoning_effort)
 
     @property
     def provider_name(self) -> str:
@@ -35,10 +66,7 @@ class OpenAIClient(LLMClient):
     ) -> LLMResponse:
         logger.info("OpenAI generate: model=%s", self._model)
 
-        # extra_params にトークン制限がなければ max_tokens を使用
-        params = extra_params.copy() if extra_params else {}
-        if "max_tokens" not in params and "max_completion_tokens" not in params:
-            params["max_tokens"] = max_tokens
+        params = self._request_params(temperature, max_tokens, extra_params)
 
         response = self._client.chat.completions.create(
             model=self._model,
@@ -46,16 +74,11 @@ class OpenAIClient(LLMClient):
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt},
             ],
-            temperature=temperature,
             **params,
         )
 
         content = response.choices[0].message.content or ""
-        usage = {
-            "prompt_tokens": response.usage.prompt_tokens if response.usage else 0,
-            "completion_tokens": response.usage.completion_tokens if response.usage else 0,
-            "total_tokens": response.usage.total_tokens if response.usage else 0,
-        }
+        usage = _usage(response.usage)
 
         logger.info("OpenAI response received: tokens=%d", usage["total_tokens"])
 
@@ -71,10 +94,7 @@ class OpenAIClient(LLMClient):
     ) -> LLMResponse:
         logger.info("OpenAI generate_json: model=%s", self._model)
 
-        # extra_params にトークン制限がなければ max_tokens を使用
-        params = extra_params.copy() if extra_params else {}
-        if "max_tokens" not in params and "max_completion_tokens" not in params:
-            params["max_tokens"] = max_tokens
+        params = self._request_params(temperature, max_tokens, extra_params)
 
         logger.info("OpenAI SYSTEM: %s", system_prompt)
         logger.info("OpenAI USER: %s", user_prompt)
@@ -86,19 +106,108 @@ class OpenAIClient(LLMClient):
                 {"role": "user", "content": user_prompt},
             ],
             response_format={"type": "json_object"},
-            temperature=temperature,
             **params,
         )
 
+        # 出力が max_tokens に達した場合、JSONが途中で切れている
+        if response.choices[0].finish_reason == "length":
+            raise TruncatedResponseError("OpenAI", _token_limit(params))
+
         content = response.choices[0].message.content or ""
-        usage = {
-            "prompt_tokens": response.usage.prompt_tokens if response.usage else 0,
-            "completion_tokens": response.usage.completion_tokens if response.usage else 0,
-            "total_tokens": response.usage.total_tokens if response.usage else 0,
-        }
+        usage = _usage(response.usage)
 
         # logger.info("OpenAI JSON response received: tokens=%d", usage["total_tokens"])
         logger.info("OpenAI response: %s", response)
         logger.info("OpenAI usage: %s", usage)
 
         return LLMResponse(content=content, model=self._model, usage=usage)
+
+    def stream_json(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float = 1.0,
+        max_tokens: int = 2000,
+        extra_params: dict | None = None,
+    ) -> LLMStream:
+        logger.info("OpenAI stream_json: model=%s", self._model)
+
+        params = self._request_params(temperature, max_tokens, extra_params)
+
+        response = self._client.chat.completions.create(
+            model=self._model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt},
+            ],
+            response_format={"type": "json_object"},
+            stream=True,
+            stream_options={"include_usage": True},
+            **params,
+        )
+
+        llm_stream = LLMStream(chunks=iter(()), model=self._model, on_close=response.close)
+
+        def chunks():
+            for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                if chunk.choices and chunk.choices[0].finish_reason == "length":
+                    raise TruncatedResponseError("OpenAI", _token_limit(params))
+                # usage は最後のチャンクにだけ含まれる
+                if chunk.usage:
+                    llm_stream.usage = _usage(chunk.usage)
+            logger.info("OpenAI usage: %s", llm_stream.usage)
+
+        llm_stream.chunks = chunks()
+        return llm_stream
+
+    def option_logprobs(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float = 1.0,
+        max_tokens: int = 16,
+        top_logprobs: int = 5,
+        extra_params: dict | None = None,
+    ) -> tuple[list[tuple[str, dict[str, float]]], LLMResponse]:
+        logger.info("OpenAI option_logprobs: model=%s", self._model)
+
+        params = self._request_params(temperature, max_tokens, extra_params)
+        response = self._client.chat.completions.create(
+            model=self._model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt},
+            ],
+            logprobs=True,
+            top_logprobs=top_logprobs,
+            **params,
+        )
+
+        choice = response.choices[0]
+        tokens = [
+            (item.token, {candidate.token: candidate.logprob for candidate in item.top_logprobs})
+            for item in (choice.logprobs.content if choice.logprobs else None) or []
+        ]
+
+        content = choice.message.content or ""
+        return tokens, LLMResponse(content=content, model=self._model, usage=_usage(response.usage))
+
+    def _request_params(self, temperature: float, max_tokens: int, extra_params: dict | None) -> dict:
+        """
+        リクエストのパラメータを組み立てる
+
+        推論モデル（reasoning_effort 指定時）は max_tokens と temperature を受け付けないため、
+        max_completion_tokens（推論トークンを含む上限）を使い、temperature は送らない。
+        """
+        params = extra_params.copy() if extra_params else {}
+        if self._reasoning_effort:
+            params.setdefault("reasoning_effort", self._reasoning_effort)
+        else:
+            params["temperature"] = temperature
+
+        # extra_params にトークン制限がなければ max_tokens を使用
+        if "max_tokens" not in params and "max_completion_tokens" not in params:
+            params["max_completion_tokens" if self._reasoning_effort else "max_tokens"] = max_tokens
+        return params
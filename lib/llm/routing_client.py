@@ -0,0 +1,308 @@
+"""複数のプロバイダーに振り分けるLLMクライアント（フェイルオーバー・サーキットブレーカー）
+
+優先順に並べたバックエンド（LLMClient）のうち、正常なものの先頭にリクエストを送る。
+失敗したら次のバックエンドで再試行するため、1つのプロバイダーが障害・クォータ切れ・設定ミスで
+全件失敗しても、出力が _error 行で埋まらずにスループットが落ちるだけで済む。
+
+バックエンドごとに直近のエラー率とレイテンシ（EWMA）を記録し、サーキットブレーカーで管理する。
+
+    closed（正常） --連続失敗 or エラー率超過--> open（除外） --cooldown経過--> half-open（1件だけ試す）
+    half-open --成功--> closed / --失敗--> open
+"""
+
+import threading
+import time
+from collections import deque
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+
+from lib.log import logger
+
+from .base import LLMClient, LLMResponse, LLMStream, TruncatedResponseError
+
+# 出力の打ち切りはバックエンドの障害ではない（max_tokens の調整で対処する）ため、フェイルオーバーしない
+NON_FAILOVER_ERRORS = (TruncatedResponseError,)
+
+
+class AllBackendsFailedError(RuntimeError):
+    """すべてのバックエンドでリクエストが失敗した"""
+
+
+class CircuitBreaker:
+    """1つのバックエンドの健全性を管理するサーキットブレーカー"""
+
+    def __init__(
+        self,
+        failure_threshold: int = 3,
+        error_rate: float = 0.5,
+        window: int = 20,
+        cooldown: float = 30.0,
+    ):
+        """
+        CircuitBreakerを初期化
+
+        Args:
+            failure_threshold: この回数連続で失敗したら open にする
+            error_rate: 直近 window 件のエラー率がこれ以上なら open にする
+            window: エラー率を計算する直近のリクエスト数
+            cooldown: open にしてから half-open で試すまでの秒数
+        """
+        self.failure_threshold = failure_threshold
+        self.error_rate_threshold = error_rate
+        self.cooldown = cooldown
+        self.state = "closed"
+        self._outcomes: deque[bool] = deque(maxlen=window)
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def error_rate(self) -> float:
+        """直近のエラー率"""
+        with self._lock:
+            if not self._outcomes:
+                return 0.0
+            return self._outcomes.count(False) / len(self._outcomes)
+
+    def allow(self) -> bool:
+        """リクエストを送ってよいか（half-open では1件だけ許可する）"""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state = "half-open"
+                self._trial_in_flight = False
+            if self.state == "half-open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        """成功を記録"""
+        with self._lock:
+            self._outcomes.append(True)
+            self._consecutive_failures = 0
+            self.state = "closed"
+            self._trial_in_flight = False
+
+    def record_failure(self) -> bool:
+        """
+        失敗を記録
+
+        Returns:
+            bool: この失敗で open になった場合True
+        """
+        with self._lock:
+            self._outcomes.append(False)
+            self._consecutive_failures += 1
+            errors = self._outcomes.count(False)
+            should_open = (
+                self.state == "half-open"
+                or self._consecutive_failures >= self.failure_threshold
+                or (
+                    len(self._outcomes) >= self._outcomes.maxlen // 2
+                    and errors / len(self._outcomes) >= self.error_rate_threshold
+                )
+            )
+            opened = should_open and self.state != "open"
+            if should_open:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+            return opened
+
+
+@dataclass
+class Backend:
+    """振り分け先のLLMクライアントと、その健全性・レイテンシの記録"""
+
+    client: LLMClient
+    breaker: CircuitBreaker
+    latency_ewma: float | None = None
+    requests: int = 0
+    failures: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @property
+    def name(self) -> str:
+        """ログ表示用の名前"""
+        return f"{self.client.provider_name}/{getattr(self.client, '_model', '?')}"
+
+    def record_latency(self, seconds: float, alpha: float = 0.2) -> None:
+        """レイテンシの指数移動平均を更新"""
+        with self._lock:
+            self.requests += 1
+            if self.latency_ewma is None:
+                self.latency_ewma = seconds
+            else:
+                self.latency_ewma = alpha * seconds + (1 - alpha) * self.latency_ewma
+
+    def record_failure(self) -> None:
+        """失敗回数を更新"""
+        with self._lock:
+            self.requests += 1
+            self.failures += 1
+
+
+class RoutingClient(LLMClient):
+    """優先順のバックエンドのうち、正常なものにリクエストを振り分けるLLMクライアント"""
+
+    def __init__(
+        self,
+        clients: list[LLMClient],
+        failure_threshold: int = 3,
+        error_rate: float = 0.5,
+        window: int = 20,
+        cooldown: float = 30.0,
+    ):
+        """
+        RoutingClientを初期化
+
+        Args:
+            clients: 優先順に並べたLLMクライアント（先頭が通常使うもの）
+            failure_threshold: この回数連続で失敗したバックエンドを除外する
+            error_rate: 直近 window 件のエラー率がこれ以上のバックエンドを除外する
+            window: エラー率を計算する直近のリクエスト数
+            cooldown: 除外したバックエンドを再び試すまでの秒数
+        """
+        if not clients:
+            raise ValueError("バックエンドが指定されていません")
+        self.backends = [Backend(client, CircuitBreaker(failure_threshold, error_rate, window, cooldown)) for client in clients]
+
+    @property
+    def provider_name(self) -> str:
+        return self.backends[0].client.provider_name
+
+    def generate(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float = 1.0,
+        max_tokens: int = 2000,
+        extra_params: dict | None = None,
+    ) -> LLMResponse:
+        args = (system_prompt, user_prompt, temperature, max_tokens, extra_params)
+        return self._route(lambda client: client.generate(*args))
+
+    def generate_json(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float = 1.0,
+        max_tokens: int = 2000,
+        extra_params: dict | None = None,
+    ) -> LLMResponse:
+        args = (system_prompt, user_prompt, temperature, max_tokens, extra_params)
+        return self._route(lambda client: client.generate_json(*args))
+
+    def stream_json(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float = 1.0,
+        max_tokens: int = 2000,
+        extra_params: dict | None = None,
+    ) -> LLMStream:
+        """
+        ストリーミングで振り分ける
+
+        最初のチャンクが届くまでに失敗した場合は次のバックエンドで再試行する。
+        受信の途中で失敗した場合は、失敗として記録したうえで呼び出し元に例外を送出する。
+        """
+        args = (system_prompt, user_prompt, temperature, max_tokens, extra_params)
+        return self._route(lambda client: client.stream_json(*args), stream=True)
+
+    def status(self) -> list[str]:
+        """
+        バックエンドごとの状態を表示用の行に整形する
+
+        Returns:
+            list[str]: 状態（名前、ブレーカーの状態、エラー率、レイテンシ）
+        """
+        lines = []
+        for backend in self.backends:
+            latency = f"{backend.latency_ewma:.1f}s" if backend.latency_ewma is not None else "-"
+            lines.append(
+                f"{backend.name}: {backend.breaker.state} "
+                f"(requests={backend.requests}, failures={backend.failures}, "
+                f"error_rate={backend.breaker.error_rate:.0%}, latency={latency})"
+            )
+        return lines
+
+    def _candidates(self) -> Iterator[Backend]:
+        """
+        今リクエストを送れるバックエンドを優先順に返す（すべて除外中なら、優先順にすべて）
+
+        half-open のバックエンドは試すときにだけ許可を取るため、先のバックエンドが成功すれば消費しない。
+        """
+        allowed = False
+        for backend in self.backends:
+            if backend.breaker.allow():
+                allowed = True
+                yield backend
+        if not allowed:
+            logger.warning("All backends are unhealthy, trying them in priority order")
+            yield from self.backends
+
+    def _route(self, request, stream: bool = False):
+        """正常なバックエンドに優先順で送信し、失敗したら次のバックエンドで再試行する"""
+        errors: list[Exception] = []
+        for backend in self._candidates():
+            started = time.monotonic()
+            try:
+                if stream:
+                    return self._open_stream(backend, request(backend.client), started)
+                response = request(backend.client)
+            except NON_FAILOVER_ERRORS:
+                # バックエンドは応答しているため正常とみなす
+                backend.breaker.record_success()
+                raise
+            except Exception as e:
+                self._record_failure(backend, e)
+                errors.append(e)
+                continue
+
+            backend.record_latency(time.monotonic() - started)
+            backend.breaker.record_success()
+            return response
+
+        summary = "; ".join(f"{type(e).__name__}: {e}" for e in errors)
+        raise AllBackendsFailedError(f"すべてのバックエンドで失敗しました: {summary}")
+
+    def _open_stream(self, backend: Backend, inner: LLMStream, started: float) -> LLMStream:
+        """最初のチャンクまで読んでからストリームを返す（それまでの失敗は呼び出し元でフェイルオーバーする）"""
+        chunks = iter(inner)
+        first = next(chunks, None)
+        # 応答が始まった時点で正常とみなす（途中で打ち切られても half-open の試行を終える）
+        backend.breaker.record_success()
+
+        wrapper = LLMStream(chunks=iter(()), model=inner.model, on_close=inner.close)
+
+        def relay():
+            if first is not None:
+                yield first
+            try:
+                yield from chunks
+            except NON_FAILOVER_ERRORS:
+                raise
+            except Exception as e:
+                self._record_failure(backend, e)
+                raise
+            wrapper.usage = inner.usage
+            backend.record_latency(time.monotonic() - started)
+
+        wrapper.chunks = relay()
+        return wrapper
+
+    def _record_failure(self, backend: Backend, error: Exception) -> None:
+        """失敗を記録し、ブレーカーが開いたらログに残す"""
+        backend.record_failure()
+        logger.warning("Backend %s failed: %s: %s", backend.name, type(error).__name__, error)
+        if backend.breaker.record_failure():
+            logger.warning(
+                "Circuit opened for %s (error_rate=%.0f%%), routing to other backends for %.0fs",
+                backend.name,
+                backend.breaker.error_rate * 100,
+                backend.breaker.cooldown,
+            )
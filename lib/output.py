@@ -1,13 +1,34 @@
-"""出力処理（Excel/CSV）"""
+"""出力処理（Excel/CSV/Parquet/Arrow）"""
 
 from pathlib import Path
 from typing import Any
 
+import numpy as np
 import pandas as pd
 
 from lib.config import Config
 from lib.log import logger
 
+# 出力形式ごとの拡張子
+FORMAT_SUFFIXES = {
+    "xlsx": ".xlsx",
+    "csv": ".csv",
+    "parquet": ".parquet",
+    "arrow": ".arrow",
+}
+
+# 拡張子から出力形式への対応（.feather は Arrow IPC と同じ）
+SUFFIX_FORMATS = {
+    ".xlsx": "xlsx",
+    ".csv": "csv",
+    ".parquet": "parquet",
+    ".arrow": "arrow",
+    ".feather": "arrow",
+}
+
+# Parquet/Arrow のファイルメタデータに実行設定を保存するキー
+SETTINGS_METADATA_KEY = b"dcepersona.settings"
+
 
 class OutputWriter:
     """ペルソナデータを出力するクラス"""
@@ -58,14 +79,17 @@ class OutputWriter:
         if append and output_path.exists():
             df = self._append_to_existing(df, output_path)
 
-        # 出力
-        if self.format == "xlsx" or output_path.suffix == ".xlsx":
-            self._write_excel(df, output_path, settings)
-        elif self.format == "csv" or output_path.suffix == ".csv":
+        # 出力（拡張子が既知ならそれを優先し、なければ設定の形式に従う）
+        output_format = SUFFIX_FORMATS.get(output_path.suffix.lower(), self.format)
+        if output_format == "csv":
             self._write_csv(df, output_path)
+        elif output_format == "parquet":
+            self._write_parquet(df, output_path, settings)
+        elif output_format == "arrow":
+            self._write_arrow(df, output_path, settings)
         else:
             # デフォルトはExcel
-            self._write_excel(df, output_path)
+            self._write_excel(df, output_path, settings)
 
         logger.info("Output written: %s (%d records)", output_path, len(df))
 
@@ -74,10 +98,7 @@ class OutputWriter:
     def _append_to_existing(self, df: pd.DataFrame, output_path: Path) -> pd.DataFrame:
         """既存ファイルにデータを追記"""
         try:
-            if output_path.suffix == ".xlsx":
-                df_existing = pd.read_excel(output_path, sheet_name="Sheet1")
-            else:
-                df_existing = pd.read_csv(output_path, encoding="utf-8-sig")
+            df_existing = read_output(output_path)
 
             df = pd.concat([df_existing, df], ignore_index=True)
             logger.info("Appending to existing file: %d existing + %d new", len(df_existing), len(df) - len(df_existing))
@@ -108,6 +129,204 @@ class OutputWriter:
         # BOM付きUTF-8でExcelでの文字化けを防ぐ
         df.to_csv(output_path, index=False, encoding="utf-8-sig")
 
+    def _write_parquet(self, df: pd.DataFrame, output_path: Path, settings: str = None) -> None:
+        """Parquetファイルとして出力（設定はファイルメタデータに保存）"""
+        import pyarrow.parquet as pq
+
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+
+        table = self._to_arrow_table(df, settings)
+        pq.write_table(table, output_path)
+
+    def _write_arrow(self, df: pd.DataFrame, output_path: Path, settings: str = None) -> None:
+        """Arrow IPC（Feather v2）ファイルとして出力（設定はファイルメタデータに保存）"""
+        import pyarrow as pa
+
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+
+        table = self._to_arrow_table(df, settings)
+        with pa.OSFile(str(output_path), "wb") as sink, pa.ipc.new_file(sink, table.schema) as ipc_writer:
+            ipc_writer.write_table(table)
+
+    def _to_arrow_table(self, df: pd.DataFrame, settings: str = None):
+        """DataFrameを型付きのArrowテーブルに変換"""
+        import pyarrow as pa
+
+        table = pa.Table.from_pandas(to_columnar_frame(df), preserve_index=False)
+        if settings:
+            metadata = dict(table.schema.metadata or {})
+            metadata[SETTINGS_METADATA_KEY] = settings.encode("utf-8")
+            table = table.replace_schema_metadata(metadata)
+        return table
+
+
+def to_columnar_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    列指向フォーマット向けにDataFrameの型を整える
+
+    - 文字列のみの属性カラムは category（Arrowでは辞書エンコード）に変換
+    - 自由記述（*.reason）と内部カラム（_error など）は文字列のまま
+    - LLMが数値と文字列を混在させたカラムは、すべて数値化できれば数値、できなければ文字列に統一
+    - 値がすべて整数の数値カラム（欠損のある 末子年齢 など）は、floatにせず Int64（欠損を扱える整数）に変換
+    - 欠損のある真偽値カラムは、数値にせず boolean（欠損を扱える真偽値）に変換
+
+    Args:
+        df: 変換元のDataFrame
+
+    Returns:
+        pd.DataFrame: 型を整えたDataFrame（元のDataFrameは変更しない）
+    """
+    df = df.copy()
+
+    for col in df.columns:
+        converted = _to_columnar_series(str(col), df[col])
+        if converted is not None:
+            df[col] = converted
+
+    return df
+
+
+def _to_columnar_series(col: str, series: pd.Series) -> pd.Series | None:
+    """1カラム分の型を整える（変換しない場合はNone）"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return None
+    if pd.api.types.is_float_dtype(series):
+        return _to_integer(series)
+    if not (pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)):
+        return None
+
+    values = series.dropna()
+    if values.map(lambda v: isinstance(v, str)).all():
+        if col.startswith("_") or col.endswith(".reason"):
+            return None
+        return series.astype("category")
+
+    if values.map(pd.api.types.is_bool).all():
+        return series.astype("boolean")
+
+    numeric = pd.to_numeric(values, errors="coerce")
+    if numeric.notna().all():
+        return _to_integer(pd.to_numeric(series, errors="coerce"))
+    return series.map(lambda v: v if pd.isna(v) else str(v))
+
+
+def _to_integer(series: pd.Series) -> pd.Series:
+    """値がすべて整数の数値カラムは Int64 に、それ以外はそのまま返す"""
+    values = series.dropna()
+    if len(values) and (values % 1 == 0).all():
+        return series.astype("Int64")
+    return series
+
+
+def from_columnar_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    to_columnar_frame で整えた型を、サンプリング・Excelの読み込みと同じ型に戻す
+
+    - category は元の値の型（文字列）に戻す
+    - Int64 は欠損がなければ int64、あれば float64（欠損はNaN）に戻す
+    - boolean は欠損がなければ bool、あれば object（欠損はNaN）に戻す
+
+    Args:
+        df: Parquet/Arrowから読み込んだDataFrame
+
+    Returns:
+        pd.DataFrame: 型を戻したDataFrame（元のDataFrameは変更しない）
+    """
+    df = df.copy()
+
+    for col in df.columns:
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            df[col] = series.astype(series.cat.categories.dtype)
+        elif isinstance(series.dtype, pd.Int64Dtype):
+            df[col] = series.astype("float64") if series.hasnans else series.astype("int64")
+        elif isinstance(series.dtype, pd.BooleanDtype):
+            df[col] = series.astype(object).where(series.notna(), np.nan) if series.hasnans else series.astype(bool)
+
+    return df
+
+
+def read_output(path: str | Path, sheet_name: str | int = "Sheet1") -> pd.DataFrame:
+    """
+    出力ファイル（xlsx/csv/parquet/arrow）をDataFrameとして読み込む
+
+    Args:
+        path: 出力ファイルのパス
+        sheet_name: xlsxの場合のシート名
+
+    Returns:
+        pd.DataFrame: 読み込んだデータ
+    """
+    path = Path(path)
+    suffix = path.suffix.lower()
+
+    if suffix == ".parquet":
+        return pd.read_parquet(path)
+    if suffix in (".arrow", ".feather"):
+        return pd.read_feather(path)
+    if suffix == ".csv":
+        return pd.read_csv(path, encoding="utf-8-sig")
+    return pd.read_excel(path, sheet_name=sheet_name)
+
+
+def read_output_settings(path: str | Path) -> str | None:
+    """
+    出力ファイルに保存された実行設定（JSON文字列）を読み込む
+
+    Args:
+        path: 出力ファイルのパス
+
+    Returns:
+        str | None: 設定のJSON文字列（保存されていなければNone）
+    """
+    path = Path(path)
+    suffix = path.suffix.lower()
+
+    if suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        metadata = pq.read_schema(path).metadata or {}
+        value = metadata.get(SETTINGS_METADATA_KEY)
+        return value.decode("utf-8") if value else None
+
+    if suffix in (".arrow", ".feather"):
+        import pyarrow as pa
+
+        with pa.memory_map(str(path)) as source:
+            metadata = pa.ipc.open_file(source).schema.metadata or {}
+        value = metadata.get(SETTINGS_METADATA_KEY)
+        return value.decode("utf-8") if value else None
+
+    if suffix == ".xlsx":
+        sheets = pd.read_excel(path, sheet_name=None)
+        if "settings" not in sheets:
+            return None
+        return "\n".join(sheets["settings"]["settings"].astype(str))
+
+    return None
+
+
+def get_unique_filepath(filepath: str) -> str:
+    """既存ファイルと重複しないファイルパスを返す
+
+    ファイルが存在しない場合はそのまま返す。
+    存在する場合は result(1).xlsx, result(2).xlsx のように連番を付ける。
+    """
+    path = Path(filepath)
+    if not path.exists():
+        return filepath
+
+    stem = path.stem
+    suffix = path.suffix
+    parent = path.parent
+
+    counter = 1
+    while True:
+        new_path = parent / f"{stem}({counter}){suffix}"
+        if not new_path.exists():
+            return str(new_path)
+        counter += 1
+
 
 def can_write(path: str | Path) -> bool:
     """
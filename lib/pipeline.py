@@ -0,0 +1,209 @@
+"""段階的な並列生成パイプライン（プロデューサー/コンシューマー）
+
+サンプリング・プロンプト構築、LLMへのリクエスト、レスポンスのパース・記録を別々のステージに分け、
+ステージ間を上限付きキューでつなぐ。
+
+    [プロデューサー] --work_queue--> [I/Oワーカー x N] --result_queue--> [パース/記録（呼び出し元スレッド）]
+
+- LLMへのリクエストはI/O待ちが支配的なため、I/Oワーカーはスレッドで並列化する
+- キューに上限があるため、先読みする行数はキューの大きさで頭打ちになり、大規模実行でもメモリが増えない
+- パースや進捗表示が遅くても、キューに空きがある限りリクエストは止まらない
+"""
+
+import queue
+import threading
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+from lib.llm.base import LLMResponse
+from lib.log import logger
+from lib.preflight import BatchAbortedError
+
+if TYPE_CHECKING:
+    from lib.generator import PersonaGenerator
+
+# ステージの終了を知らせる番兵
+_DONE = object()
+
+
+@dataclass
+class WorkItem:
+    """I/Oワーカーに渡す1人分のリクエスト"""
+
+    index: int
+    persona_id: int
+    base_attributes: dict[str, Any]
+    user_prompt: str
+
+
+@dataclass
+class ResultItem:
+    """I/Oワーカーからパース/記録ステージに渡す1人分の結果"""
+
+    index: int
+    persona_id: int
+    base_attributes: dict[str, Any]
+    response: LLMResponse | None = None
+    error: Exception | None = None
+
+
+class GenerationPipeline:
+    """プロデューサー → I/Oワーカー → パース/記録 の3ステージで生成するパイプライン"""
+
+    def __init__(
+        self,
+        generator: "PersonaGenerator",
+        workers: int = 4,
+        queue_size: int | None = None,
+    ):
+        """
+        GenerationPipelineを初期化
+
+        Args:
+            generator: プロンプト構築・リクエスト・パースを行うPersonaGenerator
+            workers: I/Oワーカー数（同時リクエスト数）
+            queue_size: 各キューの上限（Noneの場合はワーカー数の2倍）
+        """
+        self.generator = generator
+        self.workers = workers
+        self.queue_size = queue_size or workers * 2
+        # フェイルファストで中断したら立てる（プロデューサーは先読みを止め、I/Oワーカーはリクエストを送らない）
+        self._stop = threading.Event()
+
+    def run(
+        self,
+        rows: Iterable[tuple[int, dict[str, Any]]],
+        total: int | None,
+        on_progress: Callable[[int, int, dict], None] | None = None,
+    ) -> list[dict[str, Any]]:
+        """
+        基本属性の行をパイプラインで並列に処理してペルソナを生成
+
+        Args:
+            rows: (ペルソナID, 基本属性) を返すイテラブル（サンプリング結果やExcelのストリーム）
+            total: 総数（進捗表示用、不明な場合はNone）
+            on_progress: 進捗コールバック (current, total, persona) -> None
+                完了順に呼ばれる
+
+        Returns:
+            list[dict]: ペルソナのリスト（入力の行順）
+        """
+        work_queue: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        result_queue: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        producer_errors: list[Exception] = []
+
+        threads = [
+            threading.Thread(
+                target=self._produce,
+                args=(rows, work_queue, producer_errors),
+                name="pipeline-producer",
+                daemon=True,
+            )
+        ]
+        threads += [
+            threading.Thread(target=self._consume, args=(work_queue, result_queue), name=f"pipeline-io-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        logger.info("Pipeline started: workers=%d, queue_size=%d", self.workers, self.queue_size)
+
+        results = self._collect(result_queue, total, on_progress)
+
+        for thread in threads:
+            thread.join()
+
+        if producer_errors:
+            raise producer_errors[0]
+
+        return [results[i] for i in sorted(results)]
+
+    def _produce(
+        self,
+        rows: Iterable[tuple[int, dict[str, Any]]],
+        work_queue: queue.Queue,
+        producer_errors: list[Exception],
+    ) -> None:
+        """サンプリング結果を読み進め、プロンプトを構築してキューに積む（キューが満杯なら待つ）"""
+        try:
+            for i, (persona_id, base_attrs) in enumerate(rows):
+                if self._stop.is_set():
+                    break
+                user_prompt = self.generator._build_user_prompt(persona_id, base_attrs)
+                work_queue.put(WorkItem(i, persona_id, base_attrs, user_prompt))
+        except Exception as e:
+            logger.error("Pipeline producer failed: %s", e)
+            producer_errors.append(e)
+        finally:
+            for _ in range(self.workers):
+                work_queue.put(_DONE)
+
+    def _consume(self, work_queue: queue.Queue, result_queue: queue.Queue) -> None:
+        """キューからリクエストを取り出してLLMに送信する"""
+        while True:
+            item = work_queue.get()
+            if item is _DONE:
+                result_queue.put(_DONE)
+                return
+
+            if self._stop.is_set():
+                continue
+
+            logger.info("Generating persona id=%d", item.persona_id)
+            result = ResultItem(item.index, item.persona_id, item.base_attributes)
+            try:
+                result.response = self.generator._request(item.user_prompt, item.persona_id, item.base_attributes)
+            except Exception as e:
+                result.error = e
+            result_queue.put(result)
+
+    def _collect(
+        self,
+        result_queue: queue.Queue,
+        total: int | None,
+        on_progress: Callable[[int, int, dict], None] | None,
+    ) -> dict[int, dict[str, Any]]:
+        """
+        結果をパースして記録する（すべてのI/Oワーカーが終了するまで）
+
+        Raises:
+            BatchAbortedError: 最初のK件が同じ種類のエラーで失敗した場合（残りのキューを捨ててから送出する）
+        """
+        results: dict[int, dict[str, Any]] = {}
+        finished_workers = 0
+        aborted: BatchAbortedError | None = None
+
+        while finished_workers < self.workers:
+            item = result_queue.get()
+            if item is _DONE:
+                finished_workers += 1
+                continue
+            if aborted is not None:
+                continue
+
+            if item.error is not None:
+                persona = self.generator._error_persona(item.persona_id, item.base_attributes, item.error)
+            else:
+                persona = self.generator._parse_response(item.response.content, item.persona_id, item.base_attributes)
+                logger.info("Generated persona id=%d: %s", item.persona_id, persona.get("診療科", "N/A"))
+
+            results[item.index] = persona
+
+            if on_progress:
+                done = len(results)
+                on_progress(done, total if total is not None else done, persona)
+
+            try:
+                self.generator._check_fail_fast(persona, item.error)
+            except BatchAbortedError as e:
+                # 残りのリクエストを止め、ワーカーが終了するまでキューを読み捨てる
+                logger.error("Aborting pipeline: %s", e)
+                aborted = e
+                self._stop.set()
+
+        if aborted is not None:
+            raise aborted
+
+        return results
@@ -0,0 +1,198 @@
+"""大規模な合成母集団の生成（事後層化のウェイト計算用）
+
+1000万行規模の母集団を、一定行数のチャンクごとに生成してParquetへ書き出す。
+メモリ使用量はチャンクの大きさ（と同時に処理するチャンク数）で決まり、母集団の総数によらない。
+
+- 属性の分布は lib/sampling.py の sample_dependent_codes（配列演算版）と同じ
+- カテゴリ属性はカテゴリを固定した category 型にするため、どのチャンクもArrowの辞書型のスキーマが一致する
+- チャンクiは SeedSequence(seed, spawn_key=(i,)) の乱数列で生成するため、プロセスプールで並列に生成しても
+  逐次生成と同じ結果になる（chunk_size を変えると結果も変わる）
+"""
+
+from collections import deque
+from collections.abc import Callable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from lib.log import logger
+from lib.sampling import (
+    AGE_BAND_WEIGHTS,
+    AGE_BANDS,
+    CITY_SIZES,
+    HOUSING_TYPES,
+    MARITAL_STATUSES,
+    PREF_WEIGHTS,
+    PREFS,
+    SEED,
+    SEX_CATEGORIES,
+    SEX_WEIGHTS,
+    sample_dependent_codes,
+)
+
+DEFAULT_CHUNK_SIZE = 1_000_000
+
+# 母集団のカラムと型（カテゴリは固定し、チャンク間でスキーマを揃える）
+POPULATION_DTYPES = {
+    "id": "int64",
+    "性別": pd.CategoricalDtype(SEX_CATEGORIES),
+    "年齢": "int16",
+    "都道府県": pd.CategoricalDtype(PREFS),
+    "都市サイズ": pd.CategoricalDtype(CITY_SIZES),
+    "居住形態": pd.CategoricalDtype(HOUSING_TYPES),
+    "住宅ローン有無": "bool",
+    "婚姻": pd.CategoricalDtype(MARITAL_STATUSES),
+    "子ども数": "int8",
+    "末子年齢": "float32",
+}
+
+
+def population_chunk(seed: int, chunk_index: int, start: int, size: int) -> pd.DataFrame:
+    """
+    母集団の1チャンクを生成する
+
+    Args:
+        seed: 乱数シード
+        chunk_index: チャンク番号（乱数列の導出に使う）
+        start: チャンクの先頭行の番号（0始まり、idは start + 1 から振る）
+        size: チャンクの行数
+
+    Returns:
+        pd.DataFrame: POPULATION_DTYPES の型の属性データ
+    """
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(chunk_index,)))
+    sex_index = rng.choice(len(SEX_CATEGORIES), size=size, p=SEX_WEIGHTS)
+    band_index = rng.choice(len(AGE_BANDS), size=size, p=AGE_BAND_WEIGHTS)
+    pref_index = rng.choice(len(PREFS), size=size, p=PREF_WEIGHTS)
+    codes = sample_dependent_codes(rng, band_index, pref_index)
+
+    # 文字列を経由せず、番号からそのままカテゴリ型を作る
+    def categorical(index: np.ndarray, column: str) -> pd.Categorical:
+        return pd.Categorical.from_codes(index, dtype=POPULATION_DTYPES[column])
+
+    df = pd.DataFrame(
+        {
+            "id": np.arange(start + 1, start + size + 1),
+            "性別": categorical(sex_index, "性別"),
+            "年齢": codes["年齢"],
+            "都道府県": categorical(pref_index, "都道府県"),
+            "都市サイズ": categorical(codes["都市サイズ"], "都市サイズ"),
+            "居住形態": categorical(codes["居住形態"], "居住形態"),
+            "住宅ローン有無": codes["住宅ローン有無"],
+            "婚姻": categorical(codes["婚姻"], "婚姻"),
+            "子ども数": codes["子ども数"],
+            "末子年齢": codes["末子年齢"],
+        }
+    )
+    return df.astype(POPULATION_DTYPES)
+
+
+def iter_population_chunks(
+    n: int,
+    seed: int = SEED,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    workers: int = 1,
+) -> Iterator[pd.DataFrame]:
+    """
+    母集団をチャンクごとに順番に生成する
+
+    workers が2以上の場合はプロセスプールで並列に生成する。先に生成するチャンクは workers * 2 個までに抑えるため、
+    書き出しが遅くてもメモリ使用量は増え続けない。
+
+    Args:
+        n: 母集団の総数
+        seed: 乱数シード
+        chunk_size: 1チャンクの行数
+        workers: 生成に使うプロセス数
+
+    Yields:
+        pd.DataFrame: id順のチャンク
+    """
+    if chunk_size <= 0:
+        raise ValueError(f"chunk_size は1以上を指定してください: {chunk_size}")
+    chunks = [(index, start, min(chunk_size, n - start)) for index, start in enumerate(range(0, n, chunk_size))]
+
+    if workers <= 1:
+        for chunk in chunks:
+            yield population_chunk(seed, *chunk)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(population_chunk, seed, *chunk))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def iter_population_batches(
+    n: int,
+    seed: int = SEED,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    workers: int = 1,
+):
+    """
+    母集団をArrowのレコードバッチとして順番に生成する（引数は iter_population_chunks と同じ）
+
+    Yields:
+        pyarrow.RecordBatch: カテゴリ属性を辞書型にしたレコードバッチ
+    """
+    import pyarrow as pa
+
+    for df in iter_population_chunks(n, seed=seed, chunk_size=chunk_size, workers=workers):
+        yield pa.RecordBatch.from_pandas(df, preserve_index=False)
+
+
+def write_population_parquet(
+    output_path: str | Path,
+    n: int,
+    seed: int = SEED,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    workers: int = 1,
+    on_progress: Callable[[int, int], None] | None = None,
+) -> Path:
+    """
+    母集団を生成しながらParquetファイルへ書き出す（チャンクごとに1つの行グループ）
+
+    Args:
+        output_path: 出力ファイルパス
+        n: 母集団の総数
+        seed: 乱数シード
+        chunk_size: 1チャンクの行数
+        workers: 生成に使うプロセス数
+        on_progress: 進捗コールバック (書き出した行数, 総数) -> None
+
+    Returns:
+        Path: 出力されたファイルのパス
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    from lib.output import SETTINGS_METADATA_KEY
+
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    settings = f"population n={n} seed={seed} chunk_size={chunk_size}"
+
+    written = 0
+    writer = None
+    try:
+        for df in iter_population_chunks(n, seed=seed, chunk_size=chunk_size, workers=workers):
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if writer is None:
+                metadata = {**(table.schema.metadata or {}), SETTINGS_METADATA_KEY: settings.encode("utf-8")}
+                writer = pq.ParquetWriter(str(output_path), table.schema.with_metadata(metadata))
+            writer.write_table(table)
+            written += len(df)
+            if on_progress:
+                on_progress(written, n)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    logger.info("Population written: %s (%d records)", output_path, written)
+    return output_path
@@ -0,0 +1,58 @@
+"""大規模な実行の前後で設定ミスを早期に検出する仕組み
+
+- プリフライト: バッチを始める前に1行目だけを単独でリクエストし、認証情報・モデル名・パラメータの互換性・
+  レスポンスのパース可否を確かめる。失敗したら PreflightError で中断する（結果は1行目としてそのまま使う）
+- フェイルファスト: 最初のK件がすべて同じ種類のエラーで失敗したら BatchAbortedError で中断する
+  （設定ミスでは全件が同じ理由で失敗するため、残りのリクエストでクォータと時間を無駄にしない）
+"""
+
+from lib.log import logger
+
+
+class PreflightError(RuntimeError):
+    """プリフライトのリクエストが失敗した"""
+
+
+class BatchAbortedError(RuntimeError):
+    """最初のK件が同じエラーで失敗したため、バッチを中断した"""
+
+
+class FailFastGuard:
+    """最初のK件の結果を見て、すべて同じ種類のエラーならバッチを中断させるクラス"""
+
+    def __init__(self, k: int):
+        """
+        FailFastGuardを初期化
+
+        Args:
+            k: 判定に使う最初の件数（0以下の場合は判定しない）
+        """
+        self.k = k
+        self._error_types: list[str] = []
+        self._decided = k <= 0
+
+    def record(self, error_type: str | None) -> None:
+        """
+        1件分の結果を記録
+
+        Args:
+            error_type: 失敗した場合はエラーの種類（例外クラス名）、成功した場合はNone
+
+        Raises:
+            BatchAbortedError: 最初のK件がすべて同じ種類のエラーで失敗した場合
+        """
+        if self._decided:
+            return
+        if error_type is None:
+            # 1件でも成功すれば、設定そのものは正しいとみなす
+            self._decided = True
+            return
+
+        self._error_types.append(error_type)
+        if len(self._error_types) < self.k:
+            return
+
+        self._decided = True
+        if len(set(self._error_types)) == 1:
+            raise BatchAbortedError(f"最初の{self.k}件がすべて {error_type} で失敗したため中断しました。設定を確認してください")
+        logger.warning("First %d requests all failed with mixed errors: %s", self.k, sorted(set(self._error_types)))
@@ -0,0 +1,197 @@
+"""プロンプトに埋め込む基本属性・選択肢の形式（入力トークン数の削減）
+
+ユーザープロンプトは1人ごとに送るため、埋め込む基本属性と選択肢の書き方がそのまま入力トークン数に効く。
+v1_dce の選択肢は indent=4 のJSONで、16個の選択肢ごとに属性名が繰り返される。
+属性名を1回だけ書く表形式にすると、内容（どの選択肢がどの水準か）は同じまま入力トークンを大きく減らせる。
+
+- 基本属性 {base_attributes}: list（"- 属性: 値" の行）| compact（1行にまとめる）| json（空白なしのJSON）
+- 選択肢 {choice_sets}: json（indent=4、従来の形式）| json_min（空白なしのJSON）| markdown（表）| matrix（ヘッダー1行＋CSV）
+- トークン数は tiktoken があればそのトークナイザーで数え、なければ文字種から概算する
+"""
+
+import csv
+import io
+import json
+import math
+import unicodedata
+from typing import Any
+
+PROFILE_FORMATS = ("list", "compact", "json")
+CHOICE_FORMATS = ("json", "json_min", "markdown", "matrix")
+
+# トークン数を数える tiktoken のエンコーディング（gpt-4o 系）
+DEFAULT_ENCODING = "o200k_base"
+
+
+def format_profile(base_attributes: dict[str, Any], style: str = "list") -> str:
+    """
+    基本属性をプロンプトに埋め込む文字列にする
+
+    Args:
+        base_attributes: 基本属性
+        style: list | compact | json
+
+    Returns:
+        str: 埋め込む文字列
+    """
+    if style == "list":
+        return "\n".join(f"- {k}: {v}" for k, v in base_attributes.items())
+    if style == "compact":
+        return " / ".join(f"{k}:{v}" for k, v in base_attributes.items())
+    if style == "json":
+        return json.dumps(base_attributes, ensure_ascii=False, separators=(",", ":"), default=str)
+    raise ValueError(f"未対応の基本属性の形式です: {style}（{' | '.join(PROFILE_FORMATS)}）")
+
+
+def choice_rows(choice_sets: list[dict[str, Any]]) -> tuple[list[str], list[tuple[str, str, dict[str, Any]]]]:
+    """
+    選択肢を (タスク名, 選択肢名, 水準) の行にする
+
+    Args:
+        choice_sets: [{"Choice1": {"1A": {属性: 水準}, "1B": {...}}}, ...] の形式の選択肢
+
+    Returns:
+        tuple: (属性名の一覧（出現順）, 行のリスト)
+    """
+    attributes: list[str] = []
+    rows = []
+    for choice_set in choice_sets:
+        for task, options in choice_set.items():
+            for option, levels in options.items():
+                attributes.extend(k for k in levels if k not in attributes)
+                rows.append((task, option, levels))
+    return attributes, rows
+
+
+def format_choice_sets(choice_sets: list[dict[str, Any]], style: str = "json") -> str:
+    """
+    選択肢をプロンプトに埋め込む文字列にする
+
+    Args:
+        choice_sets: [{"Choice1": {"1A": {属性: 水準}, "1B": {...}}}, ...] の形式の選択肢
+        style: json | json_min | markdown | matrix
+
+    Returns:
+        str: 埋め込む文字列
+    """
+    if style == "json":
+        return json.dumps(choice_sets, ensure_ascii=False, indent=4)
+    if style == "json_min":
+        return json.dumps(choice_sets, ensure_ascii=False, separators=(",", ":"))
+
+    attributes, rows = choice_rows(choice_sets)
+    header = ["Choice", "選択肢", *attributes]
+    table = [[task, option, *(str(levels.get(k, "")) for k in attributes)] for task, option, levels in rows]
+
+    if style == "markdown":
+        lines = ["| " + " | ".join(header) + " |", "|" + "---|" * len(header)]
+        lines.extend("| " + " | ".join(row) + " |" for row in table)
+        return "\n".join(lines)
+    if style == "matrix":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerow(header)
+        writer.writerows(table)
+        return buffer.getvalue().rstrip("\n")
+    raise ValueError(f"未対応の選択肢の形式です: {style}（{' | '.join(CHOICE_FORMATS)}）")
+
+
+def render_choice_sets(template: str, choice_sets: list[dict[str, Any]], style: str = "json") -> str:
+    """
+    テンプレートの {choice_sets} を選択肢で置き換える（全員に共通のため、生成の前に1回だけ行う）
+
+    Args:
+        template: ユーザープロンプトのテンプレート
+        choice_sets: 選択肢
+        style: 選択肢の形式
+
+    Returns:
+        str: {choice_sets} を置き換えたテンプレート
+    """
+    if "{choice_sets}" not in template:
+        return template
+    if not choice_sets:
+        raise ValueError("ユーザープロンプトに {choice_sets} がありますが、prompt.choices_file が設定されていません")
+    return template.replace("{choice_sets}", format_choice_sets(choice_sets, style))
+
+
+def build_user_prompt(template: str, persona_id: int, base_attributes: dict[str, Any], profile_style: str = "list") -> str:
+    """
+    テンプレートに1人分の基本属性とIDを埋め込む
+
+    Args:
+        template: ユーザープロンプトのテンプレート（{choice_sets} は置き換え済み）
+        persona_id: ペルソナID
+        base_attributes: 基本属性
+        profile_style: {base_attributes} の形式
+
+    Returns:
+        str: ユーザープロンプト
+    """
+    prompt = template.replace("{base_attributes}", format_profile(base_attributes, profile_style))
+    prompt = prompt.replace("{id}", str(persona_id))
+
+    # 各属性を個別に埋め込み
+    for key, value in base_attributes.items():
+        prompt = prompt.replace("{" + key + "}", str(value))
+
+    return prompt
+
+
+def count_tokens(text: str, encoding: str = DEFAULT_ENCODING) -> tuple[int, bool]:
+    """
+    テキストのトークン数を数える
+
+    Args:
+        text: テキスト
+        encoding: tiktoken のエンコーディング名
+
+    Returns:
+        tuple[int, bool]: (トークン数, tiktoken で数えたか)
+            tiktoken がなければ、全角文字は1文字1トークン、それ以外は4文字1トークンとして概算する
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        wide = sum(1 for c in text if unicodedata.east_asian_width(c) in ("W", "F"))
+        return wide + math.ceil((len(text) - wide) / 4), False
+    return len(tiktoken.get_encoding(encoding).encode(text)), True
+
+
+def format_report(
+    template: str,
+    choice_sets: list[dict[str, Any]],
+    base_attributes: dict[str, Any],
+    persona_id: int = 1,
+    encoding: str = DEFAULT_ENCODING,
+) -> list[dict[str, Any]]:
+    """
+    基本属性・選択肢の形式の組み合わせごとに、ユーザープロンプトの文字数とトークン数を求める
+
+    Args:
+        template: ユーザープロンプトのテンプレート
+        choice_sets: 選択肢（テンプレートに {choice_sets} がなければ使わない）
+        base_attributes: 例として埋め込む1人分の基本属性
+        persona_id: 例として埋め込むペルソナID
+        encoding: tiktoken のエンコーディング名
+
+    Returns:
+        list[dict]: profile_format, choice_format, chars, tokens, exact（tiktoken で数えたか）の行
+    """
+    choice_formats = CHOICE_FORMATS if "{choice_sets}" in template else ("json",)
+    rows = []
+    for choice_format in choice_formats:
+        rendered = render_choice_sets(template, choice_sets, choice_format)
+        for profile_format in PROFILE_FORMATS:
+            prompt = build_user_prompt(rendered, persona_id, base_attributes, profile_format)
+            tokens, exact = count_tokens(prompt, encoding)
+            rows.append(
+                {
+                    "profile_format": profile_format,
+                    "choice_format": choice_format,
+                    "chars": len(prompt),
+                    "tokens": tokens,
+                    "exact": exact,
+                }
+            )
+    return rows
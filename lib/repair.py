@@ -0,0 +1,113 @@
+"""欠けた・不正なフィールドだけの再生成（差分の補完）
+
+45項目のうち数項目が欠けていたり不正な値だったりするだけで、ペルソナ全体を生成し直すのは無駄が大きい。
+生成済みのフィールドを文脈として渡し、欠けた・不正なフィールドだけを出力させる小さな追加リクエストで補う。
+出力トークンは補うフィールドの分だけで済む。
+
+- 欠けたフィールド: output.columns のうちレスポンスにも基本属性にもないカラム
+- 不正なフィールド: 整合性ルール（lib/validation.py）に違反したルールの expr が参照するカラム
+  （基本属性のカラムは固定のため対象にしない。when だけが参照するカラムも対象にしない）
+- 補ったフィールドは _repaired カラムに記録する
+"""
+
+import json
+import re
+from typing import Any
+
+import pandas as pd
+
+from lib.validation import Rule, evaluate_rules
+
+# 補完リクエストのユーザープロンプトの末尾に付ける指示
+REPAIR_INSTRUCTION = """
+
+## 追加の依頼
+この人物について、次の属性はすでに生成済みです（変更しないでください）。
+{existing}
+
+上の属性と矛盾しないように、次の属性だけを決めて、これらのキーだけを持つJSONオブジェクトで出力してください。
+{fields}"""
+
+# ルールの式からカラム名（バッククォートで囲まれた部分）を読み取る
+COLUMN_PATTERN = re.compile(r"`([^`]+)`")
+
+
+def missing_fields(persona: dict[str, Any], columns: list[str], fixed: set[str]) -> list[str]:
+    """
+    レスポンスに欠けている出力カラムを返す
+
+    Args:
+        persona: パースしたレスポンス
+        columns: 出力カラム
+        fixed: 基本属性など、生成の対象でないカラム
+
+    Returns:
+        list[str]: 欠けているカラム（出力カラムの順）
+    """
+    return [c for c in columns if c not in fixed and (c not in persona or persona[c] in (None, ""))]
+
+
+def invalid_fields(persona: dict[str, Any], rules: list[Rule], numeric: list[str], fixed: set[str]) -> list[str]:
+    """
+    整合性ルールに違反したフィールドを返す
+
+    Args:
+        persona: パースしたレスポンス
+        rules: 整合性ルール
+        numeric: 数値に変換してから評価するカラム
+        fixed: 基本属性など、生成の対象でないカラム
+
+    Returns:
+        list[str]: 違反したルールの expr が参照するカラム（固定のカラムを除く）
+    """
+    if not rules:
+        return []
+    # 欠けたカラムは missing_fields で扱うため、そのカラムを使うルールは黙って飛ばす
+    violations = evaluate_rules(pd.DataFrame([persona]), rules, numeric, warn_missing=False).iloc[0]
+    fields: list[str] = []
+    for rule in rules:
+        if violations.get(rule.name, False):
+            fields.extend(c for c in COLUMN_PATTERN.findall(rule.expr) if c not in fixed and c not in fields)
+    return fields
+
+
+def build_repair_prompt(user_prompt: str, persona: dict[str, Any], fields: list[str]) -> str:
+    """
+    補完リクエストのユーザープロンプトを作る
+
+    Args:
+        user_prompt: 元のユーザープロンプト（基本属性を含む）
+        persona: 生成済みのフィールド
+        fields: 補うフィールド
+
+    Returns:
+        str: 元のプロンプトに、生成済みのフィールドと補うフィールドの指示を付けたもの
+    """
+    existing = {k: v for k, v in persona.items() if k not in fields and not k.startswith("_")}
+    return user_prompt + REPAIR_INSTRUCTION.format(
+        existing=json.dumps(existing, ensure_ascii=False, separators=(",", ":"), default=str),
+        fields="\n".join(f"- {field}" for field in fields),
+    )
+
+
+def merge_fields(persona: dict[str, Any], content: str, fields: list[str]) -> list[str]:
+    """
+    補完リクエストのレスポンスから、依頼したフィールドだけを persona に反映する
+
+    Args:
+        persona: 生成済みのフィールド（上書きされる）
+        content: 補完リクエストのレスポンス（JSON文字列）
+        fields: 依頼したフィールド
+
+    Returns:
+        list[str]: 反映したフィールド（JSONとしてパースできなければ空）
+    """
+    try:
+        patch = json.loads(content)
+    except json.JSONDecodeError:
+        return []
+    if not isinstance(patch, dict):
+        return []
+    merged = [field for field in fields if field in patch]
+    persona.update({field: patch[field] for field in merged})
+    return merged
@@ -1,6 +1,14 @@
+import importlib.util
+import itertools
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from typing import Any
+
 import numpy as np
 import pandas as pd
 
+from lib.log import logger
+
 # -----------------------------
 # 設定（ここを調整すると分布が変わります）
 # -----------------------------
@@ -308,6 +316,469 @@ def generate_synthetic_nurse_data(n=N, seed=SEED):
     return df
 
 
+# -----------------------------
+# ベクトル化した生成（層別・割当サンプリング、大規模生成で使用）
+# 条件付き分布は上の行ごとの関数と同じものを表にしたもの
+# -----------------------------
+SEX_CATEGORIES = ["女性", "男性"]
+SEX_WEIGHTS = np.array([P_FEMALE, 1 - P_FEMALE])
+HOUSING_TYPES = ["賃貸", "持ち家", "実家"]
+MARITAL_STATUSES = ["未婚", "既婚"]
+PREF_IS_METRO = np.isin(PREFS, list(METRO_PREFS))
+
+# 都市サイズ（都市部 / 地方）
+CITY_SIZE_WEIGHTS = {
+    True: np.array([0.55, 0.30, 0.12, 0.03]),
+    False: np.array([0.15, 0.35, 0.35, 0.15]),
+}
+
+# 婚姻確率: 年齢の区切り -> 基本確率、都市サイズによる補正
+MARRIED_AGE_BREAKS = np.array([25, 30, 35, 40, 45, 50, 55, 60])
+MARRIED_BASE_PROBS = np.array([0.15, 0.30, 0.55, 0.65, 0.70, 0.72, 0.74, 0.75, 0.72])
+MARRIED_CITY_ADJ = np.array([-0.10, -0.05, 0.00, 0.02])  # CITY_SIZES の順
+
+# 子ども数（0, 1, 2, 3+）: 既婚者の年齢の区切り -> 分布、都市サイズによる補正
+CHILDREN_AGE_BREAKS = np.array([27, 32, 37, 45])
+CHILDREN_WEIGHTS = np.array(
+    [
+        [0.80, 0.18, 0.02, 0.00],
+        [0.40, 0.40, 0.18, 0.02],
+        [0.20, 0.40, 0.33, 0.07],
+        [0.18, 0.32, 0.38, 0.12],
+        [0.22, 0.30, 0.34, 0.14],
+    ]
+)
+CHILDREN_CITY_MULT = np.array(
+    [
+        [1.30, 1.00, 0.80, 0.60],  # 大都市
+        [1.00, 1.00, 1.00, 1.00],  # 中都市
+        [1.00, 1.00, 1.00, 1.00],  # 小都市
+        [0.92, 1.00, 1.06, 1.12],  # 町村
+    ]
+)
+
+# 末子年齢のベータ分布のパラメータ: 親の年齢の区切り -> (a, b)
+YOUNGEST_AGE_BREAKS = np.array([30, 40, 50])
+YOUNGEST_BETA_PARAMS = np.array([[1.5, 6.0], [2.0, 3.5], [2.2, 2.2], [2.8, 1.8]])
+
+# 居住形態（賃貸, 持ち家, 実家）: 年齢の区切り -> 分布、大都市・既婚による補正
+HOUSING_AGE_BREAKS = np.array([25, 30, 40, 50])
+HOUSING_WEIGHTS = np.array(
+    [
+        [0.70, 0.00, 0.30],
+        [0.65, 0.10, 0.25],
+        [0.50, 0.40, 0.10],
+        [0.30, 0.65, 0.05],
+        [0.25, 0.70, 0.05],
+    ]
+)
+HOUSING_BIG_CITY_MULT = np.array([1.20, 0.80, 1.00])
+HOUSING_MARRIED_MULT = np.array([0.92, 1.10, 0.85])
+
+# 住宅ローンありの確率（持ち家のみ）: 年齢の区切り -> 確率
+MORTGAGE_AGE_BREAKS = np.array([30, 40, 50, 60])
+MORTGAGE_PROBS = np.array([0.70, 0.80, 0.70, 0.50, 0.25])
+
+
+def allocate_quotas(n: int, weights: np.ndarray) -> np.ndarray:
+    """
+    n件を重みに比例して各カテゴリに割り当てる（最大剰余法）
+
+    各カテゴリの件数は n * weight の切り捨てか切り上げになり、合計はちょうどnになる。
+
+    Args:
+        n: 総件数
+        weights: 各カテゴリの重み（合計が1でなくてもよい）
+
+    Returns:
+        np.ndarray: 各カテゴリの件数
+    """
+    weights = np.asarray(weights, dtype=float)
+    exact = n * weights / weights.sum()
+    counts = np.floor(exact).astype(int)
+    remainder = n - counts.sum()
+    if remainder > 0:
+        # 端数の大きい順に1件ずつ追加（同点は先のカテゴリを優先）
+        order = np.argsort(-(exact - counts), kind="stable")
+        counts[order[:remainder]] += 1
+    return counts
+
+
+def sample_quota(rng: np.random.Generator, categories: list, weights: np.ndarray, n: int) -> np.ndarray:
+    """
+    割当どおりの件数を並べてシャッフルする（周辺分布が目標に一致する）
+
+    Args:
+        rng: 乱数生成器
+        categories: カテゴリ
+        weights: 各カテゴリの目標比率
+        n: 件数
+
+    Returns:
+        np.ndarray: 長さnのカテゴリ配列
+    """
+    return rng.permutation(np.repeat(np.asarray(categories, dtype=object), allocate_quotas(n, weights)))
+
+
+def _choice_rows(rng: np.random.Generator, categories, weights: np.ndarray) -> np.ndarray:
+    """行ごとに異なる分布（weightsの各行、合計1）から1つずつカテゴリを選ぶ"""
+    u = rng.random(len(weights))[:, None]
+    index = (weights.cumsum(axis=1) < u).sum(axis=1)
+    return np.asarray(categories)[np.minimum(index, weights.shape[1] - 1)]
+
+
+def sample_dependent_codes(rng: np.random.Generator, band_index: np.ndarray, pref_index: np.ndarray) -> dict[str, np.ndarray]:
+    """
+    年代・都道府県から残りの属性をまとめて生成する（カテゴリは番号で返す）
+
+    行ごとの関数（sample_age, married_prob など）と同じ条件付き分布を、配列演算でまとめて計算する。
+
+    Args:
+        rng: 乱数生成器
+        band_index: 年代の番号の配列（AGE_BANDS の添字）
+        pref_index: 都道府県の番号の配列（PREFS の添字）
+
+    Returns:
+        dict: カラム名 -> 配列（都市サイズ・居住形態・婚姻は CITY_SIZES・HOUSING_TYPES・MARITAL_STATUSES の添字）
+    """
+    n = len(band_index)
+
+    # 年代 -> 実年齢（20代なら20〜29）
+    low = 20 + 10 * np.asarray(band_index)
+    age = rng.integers(low, low + 10)
+
+    # 都市サイズ（都道府県依存）
+    metro = PREF_IS_METRO[pref_index]
+    city_weights = np.where(metro[:, None], CITY_SIZE_WEIGHTS[True], CITY_SIZE_WEIGHTS[False])
+    city_index = _choice_rows(rng, np.arange(len(CITY_SIZES)), city_weights)
+
+    # 婚姻
+    p_married = MARRIED_BASE_PROBS[np.searchsorted(MARRIED_AGE_BREAKS, age, side="right")] + MARRIED_CITY_ADJ[city_index]
+    married = rng.random(n) < np.clip(p_married, 0.05, 0.95)
+
+    # 子ども数（未婚は0、3+は3〜5に散らす）
+    w = CHILDREN_WEIGHTS[np.searchsorted(CHILDREN_AGE_BREAKS, age, side="right")] * CHILDREN_CITY_MULT[city_index]
+    children = _choice_rows(rng, np.arange(4), w / w.sum(axis=1, keepdims=True))
+    many = rng.choice([3, 4, 5], size=n, p=[0.75, 0.20, 0.05])
+    children = np.where(children == 3, many, children)
+    children = np.where(married, children, 0)
+
+    # 末子年齢（子どもがいる場合のみ）
+    max_youngest = np.maximum(0, age - 18)
+    a, b = YOUNGEST_BETA_PARAMS[np.searchsorted(YOUNGEST_AGE_BREAKS, age, side="right")].T
+    youngest = np.floor(rng.beta(a, b) * (max_youngest + 1))
+    youngest = np.where(children >= 3, np.maximum(0, youngest - rng.integers(0, 3, size=n)), youngest)
+    youngest = np.where(children > 0, np.minimum(youngest, max_youngest), np.nan)
+
+    # 居住形態
+    w = HOUSING_WEIGHTS[np.searchsorted(HOUSING_AGE_BREAKS, age, side="right")]
+    w = w * np.where((city_index == 0)[:, None], HOUSING_BIG_CITY_MULT, 1.0)
+    w = w * np.where(married[:, None], HOUSING_MARRIED_MULT, 1.0)
+    housing_index = _choice_rows(rng, np.arange(len(HOUSING_TYPES)), w / w.sum(axis=1, keepdims=True))
+
+    # 住宅ローン（持ち家のみ）
+    p_mortgage = MORTGAGE_PROBS[np.searchsorted(MORTGAGE_AGE_BREAKS, age, side="right")]
+    mortgage = (housing_index == HOUSING_TYPES.index("持ち家")) & (rng.random(n) < p_mortgage)
+
+    return {
+        "年齢": age,
+        "都市サイズ": city_index,
+        "居住形態": housing_index,
+        "住宅ローン有無": mortgage,
+        "婚姻": married.astype(int),
+        "子ども数": children,
+        "末子年齢": youngest,
+    }
+
+
+def sample_dependent_attributes(
+    rng: np.random.Generator,
+    sex: np.ndarray,
+    age_band: np.ndarray,
+    pref: np.ndarray,
+) -> pd.DataFrame:
+    """
+    性別・年代・都道府県から残りの属性をまとめて生成する（sample_dependent_codes の結果を値に戻す）
+
+    Args:
+        rng: 乱数生成器
+        sex: 性別の配列
+        age_band: 年代の配列（AGE_BANDS のいずれか）
+        pref: 都道府県の配列
+
+    Returns:
+        pd.DataFrame: generate_synthetic_nurse_data と同じカラムの属性データ
+    """
+    band_index = pd.Categorical(age_band, categories=AGE_BANDS).codes
+    pref_index = pd.Categorical(pref, categories=PREFS).codes
+    codes = sample_dependent_codes(rng, band_index, pref_index)
+
+    return pd.DataFrame(
+        {
+            "性別": sex,
+            "年齢": codes["年齢"].astype(int),
+            "都道府県": pref,
+            "都市サイズ": np.asarray(CITY_SIZES, dtype=object)[codes["都市サイズ"]],
+            "居住形態": np.asarray(HOUSING_TYPES, dtype=object)[codes["居住形態"]],
+            "住宅ローン有無": codes["住宅ローン有無"],
+            "婚姻": np.asarray(MARITAL_STATUSES, dtype=object)[codes["婚姻"]],
+            "子ども数": codes["子ども数"].astype(int),
+            "末子年齢": codes["末子年齢"],
+        }
+    )
+
+
+def generate_stratified_nurse_data(n: int = N, seed: int = SEED) -> pd.DataFrame:
+    """
+    層別・割当サンプリングで看護師属性データを生成する
+
+    性別・年代・都道府県は目標比率どおりの件数（最大剰余法で割り当てた割当数）をシャッフルして並べるため、
+    n=50 のような小さなパネルでも周辺分布が目標に一致する（各属性は独立にシャッフルする）。
+    残りの属性は generate_synthetic_nurse_data と同じ条件付き分布から生成する。
+
+    Args:
+        n: 生成件数
+        seed: 乱数シード
+
+    Returns:
+        pd.DataFrame: generate_synthetic_nurse_data と同じカラムの属性データ
+    """
+    rng = np.random.default_rng(seed)
+    sex = sample_quota(rng, SEX_CATEGORIES, SEX_WEIGHTS, n)
+    age_band = sample_quota(rng, AGE_BANDS, AGE_BAND_WEIGHTS, n)
+    pref = sample_quota(rng, PREFS, PREF_WEIGHTS, n)
+    return sample_dependent_attributes(rng, sex, age_band, pref)
+
+
+def target_margins() -> dict[str, dict[str, float]]:
+    """
+    性別・年代・都道府県の目標比率（レイキングの目標値に使う）
+
+    Returns:
+        dict: カラム名 -> {カテゴリ: 比率}（年代は年齢から age_band_of で求める）
+    """
+    return {
+        "性別": dict(zip(SEX_CATEGORIES, SEX_WEIGHTS, strict=True)),
+        "年代": dict(zip(AGE_BANDS, AGE_BAND_WEIGHTS, strict=True)),
+        "都道府県": dict(zip(PREFS, PREF_WEIGHTS, strict=True)),
+    }
+
+
+def age_band_of(age) -> np.ndarray:
+    """年齢から年代（AGE_BANDS）を求める"""
+    index = np.clip((np.asarray(age, dtype=float) - 20) // 10, 0, len(AGE_BANDS) - 1).astype(int)
+    return np.asarray(AGE_BANDS, dtype=object)[index]
+
+
+def rake_weights(
+    df: pd.DataFrame,
+    targets: dict[str, dict[Any, float]],
+    max_iter: int = 100,
+    tol: float = 1e-8,
+) -> np.ndarray:
+    """
+    レイキング（反復比例フィッティング）で、重み付きの周辺分布が目標比率に一致する重みを求める
+
+    Args:
+        df: 属性データ
+        targets: カラム名 -> {カテゴリ: 目標比率}
+        max_iter: 最大反復回数
+        tol: 重みの最大変化量がこれを下回ったら収束とみなす
+
+    Returns:
+        np.ndarray: 各行の重み（平均1）
+
+    Raises:
+        ValueError: 目標比率が正なのに該当する行がないカテゴリがある場合
+    """
+    n = len(df)
+    weights = np.ones(n)
+
+    # カラムごとに、行のカテゴリ番号と目標比率の配列を用意する
+    margins = []
+    for column, target in targets.items():
+        categories = list(target)
+        codes = pd.Categorical(df[column], categories=categories).codes
+        shares = np.array([target[c] for c in categories], dtype=float)
+        shares = shares / shares.sum()
+        empty = [
+            c
+            for c, count in zip(categories, np.bincount(codes[codes >= 0], minlength=len(categories)), strict=True)
+            if count == 0 and target[c] > 0
+        ]
+        if empty:
+            raise ValueError(f"{column} の目標カテゴリに該当する行がありません: {empty}")
+        margins.append((codes, shares))
+
+    for _ in range(max_iter):
+        previous = weights.copy()
+        for codes, shares in margins:
+            valid = codes >= 0
+            totals = np.bincount(codes[valid], weights=weights[valid], minlength=len(shares))
+            factor = np.divide(shares * weights[valid].sum(), totals, out=np.ones_like(totals), where=totals > 0)
+            weights[valid] *= factor[codes[valid]]
+        if np.max(np.abs(weights - previous)) < tol:
+            break
+
+    return weights * n / weights.sum()
+
+
+def rake_to_targets(df: pd.DataFrame) -> tuple[pd.DataFrame, np.ndarray]:
+    """
+    生成結果などの属性データを、性別・年代・都道府県の目標比率（target_margins）に合わせるレイキング重みを求める
+
+    年代は 年齢 から age_band_of で求め、年齢が数値でない行は年代の調整から外す。
+    データにないカラムの目標は使わない。小さなデータで該当する行がないカテゴリ（都道府県など）は、
+    目標から除いて残りのカテゴリで比率を按分する。
+
+    Args:
+        df: 属性データ（性別・年齢・都道府県のうち少なくとも1つを含む）
+
+    Returns:
+        tuple[pd.DataFrame, np.ndarray]: レイキングに使ったカラム（年代を含む）、各行の重み（平均1）
+
+    Raises:
+        ValueError: 性別・年齢・都道府県のいずれのカラムもない場合
+    """
+    frame = _raking_frame(df)
+
+    targets = {}
+    for column, target in target_margins().items():
+        if column not in frame.columns:
+            continue
+        present = set(frame[column].dropna())
+        missing = [c for c in target if c not in present]
+        if missing:
+            logger.warning("No rows for %d %s categories, excluded from raking: %s", len(missing), column, missing[:5])
+        if len(missing) < len(target):
+            targets[column] = {c: share for c, share in target.items() if c in present}
+
+    weights = rake_weights(frame, targets)
+    _warn_unconverged(frame, weights, targets)
+    return frame, weights
+
+
+def _raking_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """レイキングに使うカラム（性別・年代・都道府県）を取り出す"""
+    frame = pd.DataFrame(index=df.index)
+    if "性別" in df.columns:
+        frame["性別"] = df["性別"]
+    if "年齢" in df.columns:
+        age = pd.to_numeric(df["年齢"], errors="coerce")
+        frame["年代"] = pd.Series(age_band_of(age.fillna(0)), index=df.index).where(age.notna())
+    if "都道府県" in df.columns:
+        frame["都道府県"] = df["都道府県"]
+    if frame.empty:
+        raise ValueError("性別・年齢・都道府県のいずれのカラムもありません")
+    return frame
+
+
+def _warn_unconverged(frame: pd.DataFrame, weights: np.ndarray, targets: dict[str, dict[Any, float]]) -> None:
+    """重み付きの構成比が目標から1%以上ずれたカラムを警告する（カテゴリに対して行が少ないと目標が両立しない）"""
+    for column, target in targets.items():
+        shares = pd.Series(weights, index=frame.index).groupby(frame[column]).sum() / weights.sum()
+        goal = pd.Series(target) / sum(target.values())
+        gap = (shares.reindex(goal.index, fill_value=0) - goal).abs().max()
+        if gap > 0.01:
+            logger.warning("Raking did not converge for %s (max gap %.1f%%); too few rows per category", column, gap * 100)
+
+
+# -----------------------------
+# ペルソナIDごとの乱数列で生成（任意のID範囲を独立に再現できる）
+# -----------------------------
+# generate_per_id_nurse_data のカラムと型（0件でも同じ形にする）
+PER_ID_COLUMNS = {
+    "性別": object,
+    "年齢": int,
+    "都道府県": object,
+    "都市サイズ": object,
+    "居住形態": object,
+    "住宅ローン有無": bool,
+    "婚姻": object,
+    "子ども数": int,
+    "末子年齢": float,
+}
+
+
+def sample_nurse_row(seed: int, persona_id: int) -> dict[str, Any]:
+    """
+    1人分の看護師属性を、(seed, ペルソナID) から導いた専用の乱数列で生成する
+
+    generate_synthetic_nurse_data は1つの乱数列を先頭から順に使うため、i行目を作るには0〜i-1行目も作り直す必要がある。
+    こちらは SeedSequence の spawn_key にIDを入れて行ごとに独立した乱数列を作るため、
+    どのIDもほかの行と無関係に同じ値を再現できる（シャード・追加生成・並列実行で結果が一致する）。
+
+    Args:
+        seed: 乱数シード
+        persona_id: ペルソナID
+
+    Returns:
+        dict: generate_synthetic_nurse_data の1行と同じカラムの属性
+    """
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(persona_id,)))
+
+    sex = str(rng.choice(["女性", "男性"], p=[P_FEMALE, 1 - P_FEMALE]))
+    age = sample_age(rng, rng.choice(AGE_BANDS, p=AGE_BAND_WEIGHTS))
+    pref = str(rng.choice(PREFS, p=PREF_WEIGHTS))
+    city_size = str(sample_city_size(rng, pref))
+    married = bool(rng.random() < married_prob(age, city_size))
+    children = sample_children_count(rng, age, married, city_size)
+    youngest = sample_youngest_age(rng, age, children)
+    housing = str(sample_housing(rng, age, married, city_size))
+    mortgage = sample_mortgage(rng, housing, age)
+
+    return {
+        "性別": sex,
+        "年齢": age,
+        "都道府県": pref,
+        "都市サイズ": city_size,
+        "居住形態": housing,
+        "住宅ローン有無": mortgage,
+        "婚姻": "既婚" if married else "未婚",
+        "子ども数": children,
+        "末子年齢": youngest,
+    }
+
+
+def generate_per_id_nurse_data(ids: Iterable[int], seed: int = SEED) -> pd.DataFrame:
+    """
+    指定したペルソナIDの行だけを、IDごとの乱数列で生成する
+
+    Args:
+        ids: 生成するペルソナID（例: range(501, 1001)）
+        seed: 乱数シード
+
+    Returns:
+        pd.DataFrame: generate_synthetic_nurse_data と同じカラムの属性データ（idsの順）
+    """
+    df = pd.DataFrame([sample_nurse_row(seed, persona_id) for persona_id in ids], columns=list(PER_ID_COLUMNS))
+    return df.astype(PER_ID_COLUMNS)
+
+
+def sample_nurse_data(n: int = N, seed: int = SEED, method: str = "sequential") -> pd.DataFrame:
+    """
+    設定したサンプリング方式で看護師属性データを生成する
+
+    Args:
+        n: 生成件数
+        seed: 乱数シード
+        method: サンプリング方式
+            - "sequential": 1つの乱数列から独立に生成（generate_synthetic_nurse_data、従来の方式）
+            - "stratified": 性別・年代・都道府県を割当どおりに生成（generate_stratified_nurse_data）
+            - "per_id": ID（1〜n）ごとの乱数列で生成（generate_per_id_nurse_data）
+
+    Returns:
+        pd.DataFrame: 看護師属性データ
+    """
+    if method == "sequential":
+        return generate_synthetic_nurse_data(n=n, seed=seed)
+    if method == "stratified":
+        return generate_stratified_nurse_data(n=n, seed=seed)
+    if method == "per_id":
+        return generate_per_id_nurse_data(range(1, n + 1), seed=seed)
+    raise ValueError(f"未対応のサンプリング方式: {method}")
+
+
 def load_nurse_data_from_excel(
     file_path: str,
     sheet_name: str | int = 0,
@@ -315,11 +786,12 @@ def load_nurse_data_from_excel(
     skip_rows: int = 0,
 ) -> pd.DataFrame:
     """
-    Excelファイルから看護師属性データを読み込む
+    Excel（またはParquet/Arrow）ファイルから看護師属性データを読み込む
 
     Args:
-        file_path: Excelファイルのパス
+        file_path: Excelファイルのパス（.parquet / .arrow / .feather も可）
         sheet_name: シート名またはインデックス（デフォルト: 0 = 最初のシート）
+            Parquet/Arrowの場合は無視される
         n: 読み込む行数（Noneの場合は全行）
         skip_rows: スキップする先頭行数（ヘッダー行は自動認識）
 
@@ -333,16 +805,147 @@ def load_nurse_data_from_excel(
         FileNotFoundError: ファイルが見つからない場合
         ValueError: 必要なカラムが不足している場合
     """
+    suffix = Path(file_path).suffix.lower()
+
+    # 列指向フォーマットは必要な行だけを切り出し、型をサンプリング・Excelの読み込みと揃える
+    if suffix in (".parquet", ".arrow", ".feather"):
+        from lib.output import from_columnar_frame
+
+        if suffix == ".parquet":
+            df = pd.read_parquet(file_path)
+        else:
+            df = pd.read_feather(file_path)
+        stop = None if n is None else skip_rows + n
+        return from_columnar_frame(df.iloc[skip_rows:stop].reset_index(drop=True))
+
+    # python-calamine があればRust実装のリーダーで高速に読み込む
     df = pd.read_excel(
         file_path,
         sheet_name=sheet_name,
-        skiprows=skip_rows,
+        skiprows=range(1, skip_rows + 1),
         nrows=n,
+        engine="calamine" if _has_calamine() else None,
     )
 
     return df
 
 
+def iter_nurse_data_from_excel(
+    file_path: str,
+    sheet_name: str | int = 0,
+    n: int | None = None,
+    skip_rows: int = 0,
+) -> Iterator[dict[str, Any]]:
+    """
+    Excel（またはParquet/Arrow）ファイルから看護師属性データを1行ずつ読み込む
+
+    ブック全体を読み込まずに先頭から順に行を返すため、大きなファイルでも
+    最初の行からすぐに生成を始められ、メモリ使用量もシートの大きさに依存しない。
+
+    Args:
+        file_path: Excelファイルのパス（.parquet / .arrow / .feather も可）
+        sheet_name: シート名またはインデックス（デフォルト: 0 = 最初のシート）
+            Parquet/Arrowの場合は無視される
+        n: 読み込む行数（Noneの場合は全行）
+        skip_rows: スキップする先頭行数（ヘッダー行は自動認識）
+
+    Yields:
+        dict: 1行分の属性（カラム名 -> 値、空セルはNaN）
+    """
+    stop = None if n is None else skip_rows + n
+    rows = itertools.islice(_iter_rows(file_path, sheet_name), skip_rows, stop)
+
+    for row in rows:
+        yield {key: (np.nan if value is None else value) for key, value in row.items()}
+
+
+def count_nurse_data_rows(file_path: str, sheet_name: str | int = 0) -> int | None:
+    """
+    ファイルのデータ行数（ヘッダーを除く）を返す
+
+    Excelはシートの寸法情報から求めるため、ファイルによっては取得できずNoneを返す。
+
+    Args:
+        file_path: Excelファイルのパス（.parquet / .arrow / .feather も可）
+        sheet_name: シート名またはインデックス
+
+    Returns:
+        int | None: データ行数
+    """
+    suffix = Path(file_path).suffix.lower()
+
+    if suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        return pq.ParquetFile(file_path).metadata.num_rows
+
+    if suffix in (".arrow", ".feather"):
+        import pyarrow as pa
+
+        with pa.memory_map(str(file_path)) as source:
+            reader = pa.ipc.open_file(source)
+            return sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True)
+    try:
+        worksheet = _get_worksheet(workbook, sheet_name)
+        return None if worksheet.max_row is None else max(0, worksheet.max_row - 1)
+    finally:
+        workbook.close()
+
+
+def _iter_rows(file_path: str, sheet_name: str | int) -> Iterator[dict[str, Any]]:
+    """ファイル形式に応じて1行ずつ辞書を返す"""
+    suffix = Path(file_path).suffix.lower()
+
+    if suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(file_path).iter_batches():
+            yield from batch.to_pylist()
+        return
+
+    if suffix in (".arrow", ".feather"):
+        import pyarrow as pa
+
+        with pa.memory_map(str(file_path)) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                yield from reader.get_batch(i).to_pylist()
+        return
+
+    # 読み取り専用モードのopenpyxlはシートをストリームで読み、全体をメモリに載せない
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = _get_worksheet(workbook, sheet_name).iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(col) for col in header]
+        for values in rows:
+            if all(value is None for value in values):
+                continue
+            yield dict(zip(columns, values, strict=False))
+    finally:
+        workbook.close()
+
+
+def _get_worksheet(workbook, sheet_name: str | int):
+    """シート名またはインデックスからワークシートを取得"""
+    if isinstance(sheet_name, int):
+        return workbook.worksheets[sheet_name]
+    return workbook[sheet_name]
+
+
+def _has_calamine() -> bool:
+    """python-calamine がインストールされているか"""
+    return importlib.util.find_spec("python_calamine") is not None
+
+
 # 実行例
 if __name__ == "__main__":
     df = generate_synthetic_nurse_data(n=1000, seed=42)
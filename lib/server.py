@@ -0,0 +1,189 @@
+"""常駐サービスモード（LLMクライアントを使い回してジョブを処理するローカルサーバー）
+
+`main.py serve` で起動し、`main.py generate --server` からジョブを送信する。
+LLMクライアント（とSDK内部のHTTPコネクションプール）はプロバイダー・モデルごとに1つだけ作成して
+プロセスが終了するまで保持するため、ジョブごとのSDK初期化・TLS接続確立のコストがかからない。
+
+通信はローカルのTCPソケット上の1行1JSON:
+    リクエスト: {"config": "v1_nurse", "count": 10, ...}
+    レスポンス: {"ok": true, "output": "output/v1_nurse.xlsx", "count": 10, "errors": 0, "usage": [...]}
+"""
+
+import json
+import socket
+import socketserver
+import threading
+from typing import Any
+
+from lib.config import ConfigLoader, LLMConfig, apply_job_overrides, create_llm_client
+from lib.llm.base import LLMClient
+from lib.log import logger
+from lib.output import OutputWriter, can_write
+from lib.shard import parse_shard, resolve_output_path, shard_range
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+
+class ClientPool:
+    """プロバイダー・モデル・思考の設定（とヘッジ先・フェイルオーバー先）ごとにLLMクライアントを1つだけ作成して使い回す"""
+
+    def __init__(self):
+        self._clients: dict[tuple[str, str, str], LLMClient] = {}
+        self._lock = threading.Lock()
+
+    def get(self, llm_config: LLMConfig) -> LLMClient:
+        """
+        設定に対応するLLMクライアントを返す（なければ作成する）
+
+        Args:
+            llm_config: LLM設定
+
+        Returns:
+            LLMClient: 使い回されるLLMクライアント
+        """
+        hedge = llm_config.hedge
+        hedge_key = _backend_key(hedge) if hedge.enabled else ""
+        fallbacks_key = ",".join(_backend_key(backend) for backend in llm_config.fallbacks)
+        key = (_backend_key(llm_config), hedge_key, fallbacks_key)
+        with self._lock:
+            if key not in self._clients:
+                logger.info("Creating pooled LLM client: %s hedge=%s fallbacks=%s", *key)
+                self._clients[key] = create_llm_client(llm_config)
+            return self._clients[key]
+
+
+def _backend_key(backend) -> str:
+    """クライアントを区別するキー（provider/model と、指定があれば接続先・思考の設定）"""
+    key = f"{backend.provider.lower()}/{backend.model}"
+    if backend.base_url:
+        key += f"@{backend.base_url}"
+    if backend.thinking_budget is not None or backend.reasoning_effort is not None:
+        key += f"(thinking_budget={backend.thinking_budget}, reasoning_effort={backend.reasoning_effort})"
+    return key
+
+
+def run_job(job: dict[str, Any], pool: ClientPool) -> dict[str, Any]:
+    """
+    1件の生成ジョブを実行する
+
+    Args:
+        job: ジョブ内容（generate コマンドのオプションに対応）
+            config, count, seed, provider, model, format, stream, thinking_budget, reasoning_effort, base_url, choice_only,
+            repair, output, generate_excel_path, sheet_name, workers, preflight, fail_fast_k, dedup, samples_per_profile,
+            sampling_method, shard, append
+        pool: LLMクライアントのプール
+
+    Returns:
+        dict: 実行結果（出力パス、件数、エラー件数、コストレポート）
+    """
+    from lib.generator import PersonaGenerator
+    from lib.validation import ERROR_COLUMNS
+
+    config_name = job.get("config", "v1_nurse")
+    config = ConfigLoader.load("configs/" + config_name)
+    apply_job_overrides(config, job)
+
+    # シャード指定・追記はローカル実行（generate コマンド）と同じ扱いにする
+    count = int(job.get("count", 10))
+    shard_index, shard_count = parse_shard(job["shard"]) if job.get("shard") else (1, 1)
+    row_range = shard_range(count, shard_index, shard_count)
+    append = bool(job.get("append", False))
+    output = resolve_output_path(config, job.get("output") or config_name, append, shard_index, shard_count)
+    if not can_write(output):
+        raise ValueError(f"{output} を閉じてください")
+
+    generator = PersonaGenerator(
+        config,
+        pool.get(config.llm),
+        workers=int(job.get("workers", 1)),
+        preflight=bool(job.get("preflight", True)),
+        fail_fast_k=int(job.get("fail_fast_k", 5)),
+    )
+    if job.get("generate_excel_path"):
+        personas = generator.generate_batch_from_excel(
+            file_path=job["generate_excel_path"],
+            sheet_name=job.get("sheet_name", "Sheet1"),
+            n=len(row_range),
+            skip_rows=row_range.start,
+            start_id=row_range.start + 1,
+        )
+    else:
+        personas = generator.generate_batch(n=count, seed=job.get("seed"), row_range=row_range)
+
+    writer = OutputWriter(config)
+    output_path = writer.write(personas, output, settings=config.to_json(), append=append)
+
+    return {
+        "ok": True,
+        "output": str(output_path),
+        "count": len(personas),
+        "errors": sum(1 for persona in personas if any(c in persona for c in ERROR_COLUMNS)),
+        "usage": generator.usage.format(),
+    }
+
+
+class _JobHandler(socketserver.StreamRequestHandler):
+    """1接続で1ジョブを受け付けるハンドラ"""
+
+    def handle(self) -> None:
+        line = self.rfile.readline()
+        try:
+            job = json.loads(line)
+            logger.info("Job received: %s", job)
+            result = run_job(job, self.server.pool)
+        except Exception as e:
+            logger.error("Job failed: %s", e)
+            result = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+
+        self.wfile.write(json.dumps(result, ensure_ascii=False).encode("utf-8") + b"\n")
+
+
+class GenerationServer(socketserver.ThreadingTCPServer):
+    """ジョブを並行して受け付けるローカルサーバー"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+        """
+        GenerationServerを初期化
+
+        Args:
+            host: 待ち受けアドレス（外部に公開しないため既定はループバック）
+            port: 待ち受けポート
+        """
+        super().__init__((host, port), _JobHandler)
+        self.pool = ClientPool()
+
+
+def parse_address(address: str) -> tuple[str, int]:
+    """
+    "host:port" または "port" 形式のアドレスをパースする
+
+    Args:
+        address: アドレス文字列
+
+    Returns:
+        tuple[str, int]: (ホスト, ポート)
+    """
+    host, _, port = address.rpartition(":")
+    return host or DEFAULT_HOST, int(port)
+
+
+def submit_job(job: dict[str, Any], address: str, timeout: float | None = None) -> dict[str, Any]:
+    """
+    常駐サーバーにジョブを送信して結果を待つ
+
+    Args:
+        job: ジョブ内容（run_job を参照）
+        address: サーバーのアドレス（"host:port"）
+        timeout: 応答待ちのタイムアウト秒数（Noneの場合は無制限）
+
+    Returns:
+        dict: サーバーからの実行結果
+    """
+    with socket.create_connection(parse_address(address), timeout=timeout) as sock:
+        sock.sendall(json.dumps(job, ensure_ascii=False).encode("utf-8") + b"\n")
+        with sock.makefile("rb") as response:
+            return json.loads(response.readline())
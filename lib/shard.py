@@ -0,0 +1,132 @@
+"""複数プロセス・複数マシンで生成を分担するためのシャード分割"""
+
+import re
+from pathlib import Path
+
+from lib.config import Config
+from lib.log import logger
+
+SHARD_PATTERN = re.compile(r"^\s*(\d+)\s*/\s*(\d+)\s*$")
+
+
+def parse_shard(spec: str) -> tuple[int, int]:
+    """
+    "i/N" 形式のシャード指定をパースする
+
+    Args:
+        spec: シャード指定（例: "2/4" = 4分割中の2番目、iは1始まり）
+
+    Returns:
+        tuple[int, int]: (シャード番号, シャード数)
+
+    Raises:
+        ValueError: 形式が不正な場合
+    """
+    match = SHARD_PATTERN.match(spec)
+    if not match:
+        raise ValueError(f"シャード指定は i/N 形式で指定してください: {spec}")
+
+    index, count = int(match.group(1)), int(match.group(2))
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"シャード番号は 1 から {count} の範囲で指定してください: {spec}")
+
+    return index, count
+
+
+def shard_range(total: int, index: int, count: int) -> range:
+    """
+    total行をcount個に分割したときの、index番目のシャードが担当する行範囲を返す
+
+    連続した行ブロックに分割するため、シャードをID順に並べればそのまま元の順序になる。
+    各シャードの行数の差は高々1行。
+
+    Args:
+        total: 全体の行数
+        index: シャード番号（1始まり）
+        count: シャード数
+
+    Returns:
+        range: 担当する行番号（0始まり）の範囲
+    """
+    start = total * (index - 1) // count
+    stop = total * index // count
+    return range(start, stop)
+
+
+def shard_output_path(output_path: str | Path, index: int, count: int) -> Path:
+    """
+    シャードごとの出力ファイルパスを返す
+
+    例: output/v1_dce.xlsx -> output/v1_dce.shard2of4.xlsx
+
+    Args:
+        output_path: 元の出力ファイルパス
+        index: シャード番号（1始まり）
+        count: シャード数
+
+    Returns:
+        Path: シャード用の出力ファイルパス
+    """
+    path = Path(output_path)
+    return path.with_name(f"{path.stem}.shard{index}of{count}{path.suffix}")
+
+
+def resolve_output_path(config: Config, output: str, append: bool, shard_index: int = 1, shard_count: int = 1) -> str:
+    """
+    出力ファイルパスを決定する
+
+    追記モードでは指定されたパスをそのまま使う。それ以外は output/<名前>.<形式> とし、
+    シャード実行ならシャード番号を付け、既存ファイルがあれば連番を付ける。
+    """
+    from lib.output import FORMAT_SUFFIXES, get_unique_filepath
+
+    if append:
+        return output
+
+    suffix = FORMAT_SUFFIXES.get(config.output.format, ".xlsx")
+    output_path = f"output/{output}{suffix}"
+    if shard_count > 1:
+        output_path = str(shard_output_path(output_path, shard_index, shard_count))
+    return get_unique_filepath(output_path)
+
+
+def merge_shards(shard_paths: list[str | Path], output_path: str | Path, config: Config) -> Path:
+    """
+    シャードごとの出力ファイルを1つのファイルに結合する
+
+    行はid順に並べ替え、同じidが複数のシャードに含まれる場合は先に見つかった行を残す。
+    実行設定は先頭のシャードから引き継ぐ。
+
+    Args:
+        shard_paths: シャードの出力ファイルパスのリスト
+        output_path: 結合後の出力ファイルパス
+        config: 設定オブジェクト（カラム順と出力形式に使用）
+
+    Returns:
+        Path: 出力されたファイルのパス
+    """
+    import pandas as pd
+
+    from lib.output import OutputWriter, read_output, read_output_settings
+
+    if not shard_paths:
+        raise ValueError("結合するファイルが指定されていません")
+
+    frames = []
+    for path in shard_paths:
+        df = read_output(path)
+        logger.info("Loaded shard: %s (%d records)", path, len(df))
+        frames.append(df)
+
+    merged = pd.concat(frames, ignore_index=True)
+
+    if "id" in merged.columns:
+        duplicated = merged["id"].duplicated()
+        if duplicated.any():
+            logger.warning("Dropping %d duplicated ids while merging shards", int(duplicated.sum()))
+            merged = merged[~duplicated]
+        merged = merged.sort_values("id", kind="stable")
+
+    settings = read_output_settings(shard_paths[0])
+    writer = OutputWriter(config)
+    return writer.write(merged.to_dict("records"), output_path, settings=settings)
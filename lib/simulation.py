@@ -0,0 +1,324 @@
+"""政策シナリオのシミュレーション（推定した選好を合成母集団に当てはめる）
+
+「給与＋3万と看護以外の業務の半分負担減を組み合わせたら、どれだけの看護師が選ぶか」のような問いに、
+LLMで生成し直さずに答える。estimate --save で保存した推定結果を、lib/population.py の合成母集団に当てはめ、
+現状の職場（ベースライン）とシナリオの職場の2択でシナリオを選ぶ確率（選択率）を求める。
+
+- 母集団はチャンクごとに読み、係数に効く共変量とセグメントのカラムの組み合わせごとの人数に集約する。
+  選択率の計算はこの組み合わせ（数千通り程度）に対して行うため、数千万行・数百シナリオでも数秒で終わる
+- シナリオは scenarios.yaml の grid（属性ごとの水準の直積）と scenarios（名前付きの組み合わせ）で書く
+- 混合ロジットの個人差（正規分布）は、ロジスティック関数と正規分布の積分の近似
+  E[σ(u)] ≈ σ(μ / sqrt(1 + πσ²/8)) で平均する。潜在クラスはクラス所属確率で重み付けする
+- 母集団にない共変量（LLMが生成した特性など）は推定に使った回答者の平均（標準化後の0）とする
+"""
+
+import itertools
+import math
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from lib.estimation import CovariateSpec, DesignColumn, encode_levels
+from lib.log import logger
+
+# 選択率の計算で一度に扱う要素数（組み合わせ × シナリオ）の目安
+BLOCK_ELEMENTS = 4_000_000
+
+# 母集団のカラムから作るセグメント
+DERIVED_SEGMENTS = {
+    "年代": lambda df: (df["年齢"] // 10 * 10).astype(str) + "代",
+}
+
+# 全体の行のセグメント名
+TOTAL = "全体"
+
+
+@dataclass
+class Scenario:
+    """1つの政策シナリオ（シナリオの職場の水準）"""
+
+    name: str
+    levels: dict[str, str]
+
+
+def load_scenarios(baseline: dict[str, str], scenarios: list[dict[str, Any]], grid: dict[str, list[str]]) -> list[Scenario]:
+    """
+    scenarios.yaml の内容をシナリオの一覧にする
+
+    Args:
+        baseline: 現状の職場の水準（属性 -> 水準）
+        scenarios: name と levels（ベースラインから変える水準）を持つ辞書のリスト
+        grid: 属性 -> 水準のリスト（直積のすべての組み合わせをシナリオにする）
+
+    Returns:
+        list[Scenario]: シナリオ（ベースラインと同じ組み合わせは除く）
+    """
+    result = [Scenario(raw["name"], {**baseline, **raw["levels"]}) for raw in scenarios]
+    names = {scenario.name for scenario in result}
+    attributes = list(grid)
+    for combination in itertools.product(*(grid[a] for a in attributes)):
+        levels = {**baseline, **dict(zip(attributes, combination, strict=True))}
+        changed = [f"{a}={levels[a]}" for a in attributes if levels[a] != baseline.get(a)]
+        name = " / ".join(changed)
+        if changed and name not in names:
+            result.append(Scenario(name, levels))
+            names.add(name)
+    return result
+
+
+class PolicyModel:
+    """保存した推定結果から、シナリオを選ぶ確率を求めるクラス"""
+
+    def __init__(
+        self,
+        kind: str,
+        params: dict[str, Any],
+        covariates: list[CovariateSpec],
+        design: list[DesignColumn],
+        coding: dict[str, dict[str, float]],
+    ):
+        """
+        PolicyModelを初期化
+
+        Args:
+            kind: pooled | mixed | latent_class
+            params: 推定したパラメータ（EstimationResult.extra["params"]）
+            covariates: 共変量の作り方
+            design: 説明変数の作り方
+            coding: 属性 -> {水準: 数値}
+        """
+        self.kind = kind
+        self.params = params
+        self.covariates = covariates
+        self.design = design
+        self.coding = coding
+
+    @classmethod
+    def from_file(cls, path: str | Path, model: str = "mixed") -> "PolicyModel":
+        """
+        estimate --save で保存した推定結果を読み込む
+
+        Args:
+            path: 推定結果のJSON
+            model: 使うモデル（pooled | mixed | latent_class）
+
+        Raises:
+            FileNotFoundError: ファイルが見つからない場合
+            ValueError: 指定したモデルが保存されていない場合
+        """
+        import json
+
+        path = Path(path)
+        if not path.exists():
+            raise FileNotFoundError(f"推定結果が見つかりません: {path}")
+        with open(path, encoding="utf-8") as f:
+            saved = json.load(f)
+        if model not in saved["models"]:
+            raise ValueError(f"{path} に {model} の推定結果がありません（{' | '.join(saved['models'])}）")
+
+        entry = saved["models"][model]
+        return cls(
+            kind=model,
+            params=entry["params"],
+            covariates=[CovariateSpec(**spec) for spec in entry["covariates"]],
+            design=[DesignColumn(**column) for column in saved["design"]],
+            coding=saved["coding"],
+        )
+
+    def scenario_matrix(self, baseline: dict[str, str], scenarios: list[Scenario]) -> np.ndarray:
+        """シナリオの職場とベースラインの職場の説明変数の差 (シナリオ, 説明変数)"""
+        base = encode_levels(baseline, self.design, self.coding)
+        return np.array([encode_levels(scenario.levels, self.design, self.coding) - base for scenario in scenarios])
+
+    def source_columns(self, column_map: dict[str, str]) -> list[str]:
+        """係数に効く共変量の、母集団でのカラム名"""
+        return list(dict.fromkeys(column_map.get(spec.column, spec.column) for spec in self.covariates))
+
+    def covariate_matrix(self, frame: pd.DataFrame, column_map: dict[str, str]) -> np.ndarray:
+        """
+        母集団の行を、推定時と同じ標準化をした共変量の配列 (行, 共変量) にする
+
+        Args:
+            frame: 母集団の行
+            column_map: 推定に使ったカラム -> 母集団のカラム
+
+        Returns:
+            np.ndarray: 共変量（母集団にないカラム・欠損は0 = 推定に使った回答者の平均）
+        """
+        Z = np.zeros((len(frame), len(self.covariates)))
+        for m, spec in enumerate(self.covariates):
+            column = column_map.get(spec.column, spec.column)
+            if column not in frame.columns:
+                continue
+            if spec.category is None:
+                values = pd.to_numeric(frame[column], errors="coerce").to_numpy(dtype=float)
+            else:
+                values = (frame[column].astype(str) == spec.category).to_numpy(dtype=float)
+            Z[:, m] = np.nan_to_num((values - spec.mean) / spec.scale)
+        return Z
+
+    def uptake(self, Z: np.ndarray, D: np.ndarray) -> np.ndarray:
+        """
+        ベースラインとの2択でシナリオを選ぶ確率を求める
+
+        Args:
+            Z: (行, 共変量) の共変量
+            D: (シナリオ, 説明変数) のシナリオとベースラインの説明変数の差
+
+        Returns:
+            np.ndarray: (行, シナリオ) の選択率
+        """
+        if self.kind == "latent_class":
+            betas = np.asarray(self.params["betas"])
+            gamma = np.asarray(self.params["membership"])
+            Z1 = np.concatenate([np.ones((len(Z), 1)), Z], axis=1)
+            utility = np.concatenate([np.zeros((len(Z), 1)), Z1 @ gamma.T], axis=1)
+            shares = np.exp(utility - np.logaddexp.reduce(utility, axis=1, keepdims=True))
+            return shares @ _sigmoid(betas @ D.T)
+
+        mean = np.asarray(self.params["mean"])
+        shift = np.asarray(self.params["shift"]).reshape(len(mean), -1)
+        B = mean + Z[:, : shift.shape[1]] @ shift.T if shift.shape[1] else np.broadcast_to(mean, (len(Z), len(mean)))
+        sd = np.array([self.params["sd"].get(column.name, 0.0) for column in self.design])
+        variance = ((D * sd) ** 2).sum(axis=1)
+        return _sigmoid((B @ D.T) / np.sqrt(1 + math.pi * variance / 8))
+
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    """ロジスティック関数（桁あふれしない形）"""
+    return 0.5 * (1 + np.tanh(x / 2))
+
+
+def iter_population_file(path: str | Path, columns: list[str], batch_size: int = 1_000_000) -> Iterator[pd.DataFrame]:
+    """
+    population コマンドで書き出した母集団（Parquet）から、必要なカラムだけをチャンクごとに読む
+
+    Args:
+        path: 母集団のParquetファイル
+        columns: 読むカラム（ファイルにないカラムは無視する）
+        batch_size: 1チャンクの行数
+
+    Yields:
+        pd.DataFrame: 母集団のチャンク
+    """
+    import pyarrow.parquet as pq
+
+    parquet = pq.ParquetFile(path)
+    available = [c for c in columns if c in parquet.schema_arrow.names]
+    for batch in parquet.iter_batches(batch_size=batch_size, columns=available):
+        yield batch.to_pandas()
+
+
+def count_profiles(chunks: Iterable[pd.DataFrame], columns: list[str]) -> pd.DataFrame:
+    """
+    母集団を、指定したカラムの組み合わせごとの人数に集約する
+
+    Args:
+        chunks: 母集団のチャンク
+        columns: 集約に使うカラム（DERIVED_SEGMENTS のセグメントはチャンクごとに作る）
+
+    Returns:
+        pd.DataFrame: 組み合わせのカラムと人数（n）
+    """
+    counts: pd.Series | None = None
+    rows = 0
+    for chunk in chunks:
+        for name, derive in DERIVED_SEGMENTS.items():
+            if name in columns and name not in chunk.columns:
+                chunk[name] = derive(chunk)
+        present = [c for c in columns if c in chunk.columns]
+        chunk_counts = chunk.groupby(present, dropna=False, observed=True).size() if present else pd.Series([len(chunk)])
+        counts = chunk_counts if counts is None else counts.add(chunk_counts, fill_value=0)
+        rows += len(chunk)
+        logger.debug("Counted %d rows (%d profiles)", rows, len(counts))
+
+    if counts is None:
+        raise ValueError("母集団に行がありません")
+    logger.info("Population: %d rows, %d profiles", rows, len(counts))
+    profiles = counts.rename("n").reset_index()
+    return profiles.drop(columns=[c for c in profiles.columns if c not in (*columns, "n")])
+
+
+def simulate(
+    model: PolicyModel,
+    baseline: dict[str, str],
+    scenarios: list[Scenario],
+    profiles: pd.DataFrame,
+    column_map: dict[str, str] | None = None,
+    segments: list[str] | None = None,
+) -> pd.DataFrame:
+    """
+    シナリオごとの選択率を、全体とセグメント別に求める
+
+    Args:
+        model: 推定結果
+        baseline: 現状の職場の水準
+        scenarios: シナリオ
+        profiles: count_profiles で集約した母集団
+        column_map: 推定に使ったカラム -> 母集団のカラム
+        segments: 内訳を求めるセグメントのカラム
+
+    Returns:
+        pd.DataFrame: scenario, segment, group, n, share の表（segment が「全体」の行が全体の選択率）
+    """
+    column_map = column_map or {}
+    segments = [s for s in segments or [] if s in profiles.columns]
+    D = model.scenario_matrix(baseline, scenarios)
+    Z = model.covariate_matrix(profiles, column_map)
+
+    block = max(1, BLOCK_ELEMENTS // max(len(scenarios), 1))
+    P = np.concatenate([model.uptake(Z[lo : lo + block], D) for lo in range(0, len(Z), block)])
+    weights = profiles["n"].to_numpy(dtype=float)
+    weighted = pd.DataFrame(P * weights[:, None], columns=[s.name for s in scenarios])
+
+    tables = [_share_table(weighted.sum().to_frame().T, pd.Series([weights.sum()]), TOTAL, pd.Index([TOTAL]))]
+    for segment in segments:
+        keys = profiles[segment].astype(str)
+        tables.append(_share_table(weighted.groupby(keys).sum(), pd.Series(weights).groupby(keys).sum(), segment, None))
+    return pd.concat(tables, ignore_index=True)
+
+
+def _share_table(sums: pd.DataFrame, counts: pd.Series, segment: str, index: pd.Index | None) -> pd.DataFrame:
+    """グループ × シナリオの選択率の合計を、scenario, segment, group, n, share の縦長の表にする"""
+    if index is not None:
+        sums.index = index
+        counts.index = index
+    shares = sums.div(counts, axis=0)
+    table = shares.stack().rename("share").reset_index()
+    table.columns = ["group", "scenario", "share"]
+    table["segment"] = segment
+    table["n"] = table["group"].map(counts).astype("int64")
+    return table[["scenario", "segment", "group", "n", "share"]]
+
+
+def format_summary(table: pd.DataFrame, top: int = 20) -> list[str]:
+    """
+    シミュレーション結果をレポートの行にする
+
+    Args:
+        table: simulate の結果
+        top: 表示するシナリオの数（全体の選択率の高い順）
+
+    Returns:
+        list[str]: 表示用の行
+    """
+    total = table[table["segment"] == TOTAL].sort_values("share", ascending=False)
+    lines = [f"=== シナリオ別の選択率（母集団 {int(total['n'].iloc[0]):,}人、{len(total)}シナリオ） ==="]
+    lines += [f"  #{rank:<3} {row.share:>6.1%}  {row.scenario}" for rank, row in enumerate(total.head(top).itertuples(), 1)]
+    if len(total) > top:
+        lines.append(f"  ... 他 {len(total) - top}シナリオ")
+
+    # セグメント別は上位のシナリオだけを順位の列で並べる
+    best = {name: f"#{rank}" for rank, name in enumerate(total["scenario"].head(3), 1)}
+    for segment, rows in table[table["segment"] != TOTAL].groupby("segment", sort=False):
+        rows = rows[rows["scenario"].isin(best)]
+        pivot = rows.pivot(index="group", columns="scenario", values="share")[list(best)].rename(columns=best)
+        pivot.index.name = segment
+        pivot.columns.name = None
+        lines.append(f"\n--- {segment}別（上位{len(best)}シナリオ） ---")
+        lines += pivot.map(lambda v: f"{v:.1%}").to_string().splitlines()
+    return lines
@@ -0,0 +1,393 @@
+"""理由文のテーマ分類（文字n-gramの TF-IDF とミニバッチ k-means で ChoiceN.reason をまとめる）
+
+合成した看護師が A / B を選んだ理由（ChoiceN.reason）を何千件も目で読む代わりに、理由文をテーマに分け、
+テーマごとのキーワードと、選んだ選択肢・属性の水準ごとのテーマの割合を求める。
+ネットワークや外部のモデルは使わない。
+
+- 日本語は単語に分けずに、正規化した文字列の文字n-gram（既定は2〜3文字）を特徴量にする。
+  n-gramはハッシュで n_features 個の次元に振り分けるため、語彙を持たず、メモリは理由文の件数によらない
+- TF-IDF（tf は 1 + log、行はL2正規化）は batch_size 件ずつ作り、全件の行列は作らない。
+  文書頻度は最初に1回だけ全件を読んで数える
+- テーマはコサイン類似度の球面 k-means を、ミニバッチの逐次更新（中心ごとの学習率 1 / それまでの件数）で求める
+- キーワードは、テーマの中心で重みの大きい次元を、そのテーマの理由文に現れるn-gramに戻したもの
+"""
+
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from lib.diversity import normalize, shingle_hashes
+from lib.log import logger
+
+# テーマに分けなかった理由文（空の理由文）のテーマ番号
+NO_THEME = -1
+
+# 全体の行のセグメント名
+TOTAL = "全体"
+CHOICE = "選択"
+
+
+@dataclass
+class ThemeResult:
+    """理由文のテーマ分類の結果"""
+
+    labels: np.ndarray  # 理由文ごとのテーマ番号（空の理由文は NO_THEME）
+    similarity: np.ndarray  # 理由文とテーマの中心のコサイン類似度
+    keywords: list[list[str]]  # テーマごとのキーワード（重みの大きい順）
+    examples: list[list[str]]  # テーマごとの、中心に近い理由文
+
+
+def reason_records(df: pd.DataFrame, choice_sets: list[dict[str, Any]]) -> pd.DataFrame:
+    """
+    DCE回答を、理由文1件 = 1行の表にする
+
+    Args:
+        df: 生成結果（ChoiceN.choice / ChoiceN.reason を持つ）
+        choice_sets: 選択肢
+
+    Returns:
+        pd.DataFrame: id, task, option（選んだ選択肢、選択肢にない回答は欠損）, reason と、
+            選んだ選択肢の属性の水準のカラム
+    """
+    from lib.estimation import parse_choices
+
+    options = {task: choices for choice_set in choice_sets for task, choices in choice_set.items()}
+    tasks = [task for task in options if f"{task}.reason" in df.columns]
+    if not tasks:
+        raise ValueError("理由文のカラム（ChoiceN.reason）が出力にありません")
+    attributes = list(next(iter(options[tasks[0]].values())))
+    y, mask = parse_choices(df, tasks, choice_sets)
+    ids = df["id"].to_numpy() if "id" in df.columns else np.arange(1, len(df) + 1)
+
+    frames = []
+    for t, task in enumerate(tasks):
+        names = list(options[task])
+        chosen = [names[j] if valid else None for j, valid in zip(y[:, t], mask[:, t] > 0, strict=True)]
+        frame = pd.DataFrame({"id": ids, "task": task, "option": chosen, "reason": df[f"{task}.reason"].to_numpy()})
+        for attribute in attributes:
+            frame[attribute] = [options[task][option][attribute] if option else None for option in chosen]
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+class HashedTfidf:
+    """文字n-gramをハッシュで次元に振り分ける TF-IDF（語彙を持たない）"""
+
+    def __init__(self, ngrams: tuple[int, ...] = (2, 3), n_features: int = 2**18):
+        """
+        HashedTfidfを初期化
+
+        Args:
+            ngrams: n-gramの文字数
+            n_features: 次元数
+        """
+        self.ngrams = tuple(ngrams)
+        self.n_features = n_features
+        self.idf: np.ndarray | None = None
+
+    def counts(self, texts: list[str]):
+        """正規化した文字列を、n-gramの出現回数の疎行列 (文字列, n_features) にする"""
+        import scipy.sparse as sp
+
+        rows, cols = [], []
+        for n in self.ngrams:
+            hashes, owner = shingle_hashes(texts, n)
+            rows.append(owner)
+            cols.append((hashes % np.uint64(self.n_features)).astype(np.int64))
+        rows, cols = np.concatenate(rows), np.concatenate(cols)
+        data = np.ones(len(rows), dtype=np.float32)
+        return sp.csr_matrix((data, (rows, cols)), shape=(len(texts), self.n_features))
+
+    def fit(self, texts: list[str], batch_size: int = 8192) -> "HashedTfidf":
+        """文書頻度を batch_size 件ずつ数え、IDF（平滑化あり）を求める"""
+        frequency = np.zeros(self.n_features, dtype=np.int64)
+        for lo in range(0, len(texts), batch_size):
+            counts = self.counts(texts[lo : lo + batch_size])
+            frequency += np.bincount(counts.indices, minlength=self.n_features)
+        self.idf = (np.log((1 + len(texts)) / (1 + frequency)) + 1).astype(np.float32)
+        return self
+
+    def transform(self, texts: list[str]):
+        """正規化した文字列を、行をL2正規化した TF-IDF の疎行列にする"""
+        if self.idf is None:
+            raise ValueError("fit してから transform してください")
+        X = self.counts(texts)
+        X.data = (1 + np.log(X.data)) * self.idf[X.indices]
+        norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=1)).ravel())
+        X.data /= np.repeat(np.where(norms > 0, norms, 1), np.diff(X.indptr)).astype(np.float32)
+        return X
+
+
+def _init_centers(X, k: int, rng: np.random.Generator, n_init: int = 3, iterations: int = 10) -> np.ndarray:
+    """
+    標本で k-means++ の初期値から k-means を数回繰り返し、類似度の合計が最も大きい中心を初期の中心にする
+
+    Args:
+        X: 標本の TF-IDF（行はL2正規化済み）
+        k: テーマ数
+        rng: 乱数生成器
+        n_init: 試す初期値の数
+        iterations: 初期値ごとの k-means の反復回数
+
+    Returns:
+        np.ndarray: (k, n_features) の中心
+    """
+    rows = np.flatnonzero(np.diff(X.indptr))
+    if len(rows) < k:
+        raise ValueError(f"テーマ数（{k}）より理由文が少なすぎます（{len(rows)}件）")
+    X = X[rows]
+
+    best, best_score = None, -np.inf
+    for _ in range(n_init):
+        chosen = [rng.integers(len(rows))]
+        distance = np.maximum(1 - (X @ X[chosen[0]].T).toarray().ravel(), 0)
+        for _ in range(1, k):
+            weights = distance**2
+            candidate = rng.choice(len(rows), p=weights / weights.sum()) if weights.sum() > 0 else rng.integers(len(rows))
+            chosen.append(candidate)
+            distance = np.minimum(distance, np.maximum(1 - (X @ X[candidate].T).toarray().ravel(), 0))
+
+        centers = X[chosen].toarray()
+        for _ in range(iterations):
+            labels = np.asarray((X @ centers.T).argmax(axis=1)).ravel()
+            for theme in np.unique(labels):
+                centers[theme] = np.asarray(X[labels == theme].sum(axis=0)).ravel()
+            centers /= np.maximum(np.linalg.norm(centers, axis=1, keepdims=True), 1e-12)
+        score = float(np.asarray(X @ centers.T).max(axis=1).sum())
+        if score > best_score:
+            best, best_score = centers, score
+    return best
+
+
+def fit_themes(
+    texts: list[str],
+    vectorizer: HashedTfidf,
+    k: int = 12,
+    batch_size: int = 8192,
+    epochs: int = 3,
+    seed: int = 42,
+) -> np.ndarray:
+    """
+    球面ミニバッチ k-means でテーマの中心を求める
+
+    Args:
+        texts: 正規化した文字列（空の文字列は使わない）
+        vectorizer: fit 済みの HashedTfidf
+        k: テーマ数
+        batch_size: 1ミニバッチの件数
+        epochs: 全件を読む回数
+        seed: 乱数シード
+
+    Returns:
+        np.ndarray: (k, n_features) の中心（L2正規化済み）
+    """
+    import scipy.sparse as sp
+
+    rng = np.random.default_rng(seed)
+    order = np.flatnonzero([bool(t) for t in texts])
+    sample = rng.choice(order, size=min(len(order), max(batch_size, 20 * k)), replace=False)
+    centers = _init_centers(vectorizer.transform([texts[i] for i in sample]), k, rng)
+    seen = np.zeros(k)
+
+    for epoch in range(epochs):
+        rng.shuffle(order)
+        moved = 0
+        for lo in range(0, len(order), batch_size):
+            X = vectorizer.transform([texts[i] for i in order[lo : lo + batch_size]])
+            labels = np.asarray((X @ centers.T).argmax(axis=1)).ravel()
+            sizes = np.bincount(labels, minlength=k)
+            sums = (
+                sp.csr_matrix((np.ones(len(labels)), (labels, np.arange(len(labels)))), shape=(k, len(labels))) @ X
+            ).toarray()
+            seen += sizes
+            updated = sizes > 0
+            # 中心ごとの学習率 1 / それまでに割り当てた件数で、割り当てた件の平均に近づける
+            centers[updated] += (sums[updated] - sizes[updated, None] * centers[updated]) / seen[updated, None]
+            centers /= np.maximum(np.linalg.norm(centers, axis=1, keepdims=True), 1e-12)
+            moved += int(sizes.sum())
+        logger.info("Theme clustering epoch %d/%d: %d texts", epoch + 1, epochs, moved)
+    return centers.astype(np.float32)
+
+
+def assign_themes(
+    texts: list[str], vectorizer: HashedTfidf, centers: np.ndarray, batch_size: int = 8192
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    理由文を最も近いテーマに割り当てる
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: テーマ番号（空の文字列は NO_THEME）と、中心とのコサイン類似度
+    """
+    labels = np.full(len(texts), NO_THEME, dtype=np.int64)
+    similarity = np.zeros(len(texts), dtype=np.float32)
+    for lo in range(0, len(texts), batch_size):
+        X = vectorizer.transform(texts[lo : lo + batch_size])
+        scores = np.asarray(X @ centers.T)
+        empty = np.diff(X.indptr) == 0
+        block = slice(lo, lo + len(scores))
+        labels[block] = np.where(empty, NO_THEME, scores.argmax(axis=1))
+        similarity[block] = scores.max(axis=1)
+    return labels, similarity
+
+
+def theme_keywords(
+    texts: list[str],
+    labels: np.ndarray,
+    vectorizer: HashedTfidf,
+    centers: np.ndarray,
+    top: int = 8,
+    sample: int = 2000,
+    seed: int = 42,
+) -> list[list[str]]:
+    """
+    テーマの中心で重みの大きい次元を、そのテーマの理由文に現れるn-gramに戻してキーワードにする
+
+    Args:
+        texts: 正規化した文字列
+        labels: テーマ番号
+        vectorizer: テーマ分類に使った HashedTfidf
+        centers: テーマの中心
+        top: テーマごとのキーワードの数
+        sample: n-gramに戻すために読む、テーマごとの理由文の数
+
+    Returns:
+        list[list[str]]: テーマごとのキーワード（テーマに特有の順、ほかのキーワードと重なるn-gramは除く）
+    """
+    rng = np.random.default_rng(seed)
+    sizes = np.bincount(labels[labels != NO_THEME], minlength=len(centers))
+    # どのテーマにも多い n-gram（助詞・文末など）ではなく、そのテーマに特有の n-gram を選ぶ
+    mean = (sizes[:, None] * centers).sum(axis=0) / max(sizes.sum(), 1)
+    keywords = []
+    for theme, center in enumerate(centers):
+        dimensions = np.argsort(center - mean)[::-1][: top * 5]
+        members = np.flatnonzero(labels == theme)
+        members = rng.choice(members, size=min(len(members), sample), replace=False)
+
+        # 次元ごとに、その次元に振り分けられたn-gramの出現回数を数える
+        found: dict[int, Counter] = {int(d): Counter() for d in dimensions}
+        for i in members:
+            for n in vectorizer.ngrams:
+                hashes, _ = shingle_hashes([texts[i]], n)
+                for position, dimension in enumerate((hashes % np.uint64(vectorizer.n_features)).tolist()):
+                    if dimension in found:
+                        found[dimension][texts[i][position : position + n]] += 1
+
+        chosen: list[str] = []
+        for dimension in dimensions:
+            if not found[int(dimension)]:
+                continue
+            word = found[int(dimension)].most_common(1)[0][0]
+            if not any(_overlaps(word, other) for other in chosen):
+                chosen.append(word)
+            if len(chosen) == top:
+                break
+        keywords.append(chosen)
+    return keywords
+
+
+def _overlaps(word: str, other: str) -> bool:
+    """2つのキーワードが2文字以上の部分文字列を共有するか（「学び続」と「び続け」など）"""
+    return any(word[i : i + 2] in other for i in range(len(word) - 1))
+
+
+def cluster_reasons(
+    reasons: list[Any],
+    k: int = 12,
+    ngrams: tuple[int, ...] = (2, 3),
+    n_features: int = 2**18,
+    batch_size: int = 8192,
+    epochs: int = 3,
+    keywords: int = 8,
+    seed: int = 42,
+) -> ThemeResult:
+    """
+    理由文をテーマに分ける
+
+    Args:
+        reasons: 理由文（欠損・空の理由文はテーマに分けない）
+        k: テーマ数
+        ngrams: n-gramの文字数
+        n_features: ハッシュの次元数
+        batch_size: 1ミニバッチの件数
+        epochs: k-means で全件を読む回数
+        keywords: テーマごとのキーワードの数
+        seed: 乱数シード
+
+    Returns:
+        ThemeResult: テーマ分類の結果
+    """
+    texts = [normalize(reason) for reason in reasons]
+    vectorizer = HashedTfidf(ngrams, n_features).fit(texts, batch_size)
+    centers = fit_themes(texts, vectorizer, k=k, batch_size=batch_size, epochs=epochs, seed=seed)
+    labels, similarity = assign_themes(texts, vectorizer, centers, batch_size)
+
+    examples = []
+    for theme in range(k):
+        members = np.flatnonzero(labels == theme)
+        nearest = members[np.argsort(similarity[members])[::-1]]
+        examples.append(list(dict.fromkeys(str(reasons[i]) for i in nearest[:20]))[:3])
+    return ThemeResult(
+        labels=labels,
+        similarity=similarity,
+        keywords=theme_keywords(texts, labels, vectorizer, centers, top=keywords, seed=seed),
+        examples=examples,
+    )
+
+
+def theme_shares(records: pd.DataFrame, result: ThemeResult, attributes: list[str]) -> pd.DataFrame:
+    """
+    テーマの割合を、全体・選んだ選択肢・選んだ選択肢の属性の水準ごとに求める
+
+    Args:
+        records: reason_records の結果
+        result: テーマ分類の結果
+        attributes: 内訳を求める属性
+
+    Returns:
+        pd.DataFrame: segment, group, theme, keywords, n, share の表（share はグループ内の割合）
+    """
+    frame = records.assign(theme=result.labels)
+    frame = frame[frame["theme"] != NO_THEME]
+    frame[TOTAL] = TOTAL
+    frame[CHOICE] = frame["option"]
+
+    tables = []
+    for segment in [TOTAL, CHOICE, *attributes]:
+        counts = frame.groupby([segment, "theme"]).size().rename("n").reset_index()
+        counts["share"] = counts["n"] / counts.groupby(segment)["n"].transform("sum")
+        tables.append(counts.rename(columns={segment: "group"}).assign(segment=segment))
+
+    table = pd.concat(tables, ignore_index=True)
+    table["keywords"] = table["theme"].map(lambda theme: "、".join(result.keywords[theme]))
+    table["theme"] = table["theme"] + 1
+    return table[["segment", "group", "theme", "keywords", "n", "share"]]
+
+
+def format_report(table: pd.DataFrame, result: ThemeResult) -> list[str]:
+    """
+    テーマ分類の結果をレポートの行にする
+
+    Args:
+        table: theme_shares の結果
+        result: テーマ分類の結果
+
+    Returns:
+        list[str]: 表示用の行
+    """
+    total = table[table["segment"] == TOTAL].set_index("theme")
+    lines = [f"=== 理由文のテーマ（{int(total['n'].sum()):,}件、{len(result.keywords)}テーマ） ==="]
+    for theme, keywords in enumerate(result.keywords, start=1):
+        share = total["share"].get(theme, 0.0)
+        lines.append(f"\n[テーマ{theme}] {share:.1%}  {'、'.join(keywords)}")
+        lines += [f"    例: {example[:80]}" for example in result.examples[theme - 1]]
+
+    for segment, rows in table[table["segment"] != TOTAL].groupby("segment", sort=False):
+        pivot = rows.pivot(index="group", columns="theme", values="share").fillna(0.0)
+        pivot.index.name = segment
+        pivot.columns = [f"T{theme}" for theme in pivot.columns]
+        lines.append(f"\n--- {segment}別のテーマの割合 ---")
+        lines += pivot.map(lambda v: f"{v:.0%}").to_string().splitlines()
+    return lines
@@ -0,0 +1,138 @@
+"""実測した出力トークン数に基づく max_tokens の自動調整
+
+設定の max_tokens は1リクエストごとにTPM（1分あたりのトークン数）の枠を予約するため、
+実際の出力より大きすぎると、同じクォータ内で並列に送れるリクエスト数が減る。
+
+TokenBudget は設定名・プロバイダー・モデルごとに出力トークン数（思考トークンを含む）を記録し、
+高いパーセンタイルに余裕を持たせた値を max_tokens として提案する。
+出力が上限で打ち切られた場合だけ、上限を引き上げて再試行する。
+"""
+
+import json
+import math
+import threading
+from pathlib import Path
+
+from lib.config import AdaptiveTokensConfig
+from lib.log import logger
+from lib.usage import output_tokens
+
+# 統計の保存先（実行をまたいで引き継ぐ）
+DEFAULT_STATS_PATH = Path("logs/token_stats.json")
+
+# キーごとに保持する観測値の数（古いものから捨てる）
+WINDOW_SIZE = 500
+
+
+class TokenBudget:
+    """出力トークン数の統計から max_tokens を決めるクラス"""
+
+    def __init__(
+        self,
+        key: str,
+        settings: AdaptiveTokensConfig,
+        default_max_tokens: int,
+        stats_path: str | Path = DEFAULT_STATS_PATH,
+    ):
+        """
+        TokenBudgetを初期化
+
+        Args:
+            key: 統計のキー（設定名・プロバイダー・モデル）
+            settings: 自動調整の設定
+            default_max_tokens: 観測値が少ないうちに使う max_tokens（設定ファイルの値）
+            stats_path: 統計の保存先
+        """
+        self.key = key
+        self.settings = settings
+        self.default_max_tokens = default_max_tokens
+        self.stats_path = Path(stats_path)
+        self._lock = threading.Lock()
+        self._observations: list[int] = self._load().get(key, [])
+
+    @property
+    def ceiling(self) -> int:
+        """引き上げの上限"""
+        return max(self.settings.ceiling, self.default_max_tokens)
+
+    def suggest(self) -> int:
+        """
+        次のリクエストに使う max_tokens を返す
+
+        Returns:
+            int: 観測値のパーセンタイル x (1 + margin)。観測値が少ないうちは設定ファイルの値
+        """
+        with self._lock:
+            observations = sorted(self._observations)
+
+        if len(observations) < self.settings.min_samples:
+            return self.default_max_tokens
+
+        # 最近傍順位法でパーセンタイルを求める
+        rank = math.ceil(self.settings.percentile / 100 * len(observations))
+        value = observations[min(max(rank, 1), len(observations)) - 1]
+        suggested = math.ceil(value * (1 + self.settings.margin))
+        return min(max(suggested, self.settings.floor), self.ceiling)
+
+    def escalate(self, max_tokens: int) -> int | None:
+        """
+        出力が打ち切られたときの、再試行用の max_tokens を返す
+
+        Args:
+            max_tokens: 打ち切られたリクエストの max_tokens
+
+        Returns:
+            int | None: 引き上げた max_tokens（すでに上限に達している場合はNone）
+        """
+        if max_tokens >= self.ceiling:
+            return None
+        return min(max_tokens * 2, self.ceiling)
+
+    def record(self, usage: dict) -> None:
+        """
+        成功したレスポンスの出力トークン数を記録
+
+        Args:
+            usage: LLMResponse.usage
+        """
+        tokens = output_tokens(usage)
+        if tokens <= 0:
+            return
+        with self._lock:
+            self._observations.append(tokens)
+            del self._observations[:-WINDOW_SIZE]
+
+    def record_truncated(self, max_tokens: int) -> None:
+        """
+        打ち切られたレスポンスを記録（実際の出力は max_tokens 以上なので、max_tokens を観測値とする）
+
+        Args:
+            max_tokens: 打ち切られたリクエストの max_tokens
+        """
+        with self._lock:
+            self._observations.append(max_tokens)
+            del self._observations[:-WINDOW_SIZE]
+
+    def save(self) -> None:
+        """統計をファイルに保存（他のキーの統計は保持する）"""
+        with self._lock:
+            observations = list(self._observations)
+
+        stats = self._load()
+        stats[self.key] = observations
+        self.stats_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.stats_path, "w", encoding="utf-8") as f:
+            json.dump(stats, f, ensure_ascii=False, indent=2)
+
+        logger.info("Saved token stats: %s (n=%d, next max_tokens=%d)", self.key, len(observations), self.suggest())
+
+    def _load(self) -> dict[str, list[int]]:
+        """保存済みの統計を読み込む"""
+        if not self.stats_path.exists():
+            return {}
+        try:
+            with open(self.stats_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning("Failed to load token stats: %s (%s)", self.stats_path, e)
+            return {}
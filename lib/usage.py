@@ -0,0 +1,144 @@
+"""リクエスト数・トークン数・概算コストの集計"""
+
+import threading
+from dataclasses import dataclass
+
+# 100万トークンあたりの料金（USD）: (入力, 出力)
+# モデル名の前方一致で引く（長いものから順に照合する）
+PRICING: dict[str, tuple[float, float]] = {
+    "gpt-5.2-pro": (21.0, 168.0),
+    "gpt-5.2": (1.75, 14.0),
+    "gpt-5-mini": (0.25, 2.0),
+    "gpt-5-nano": (0.05, 0.4),
+    "gpt-4.1": (2.0, 8.0),
+    "gpt-4o-mini": (0.15, 0.6),
+    "claude-opus-4-5": (2.50, 12.50),
+    "claude-sonnet-4-5": (1.50, 7.50),
+    "gemini-2.5-pro": (1.25, 5.0),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-1.5-flash": (0.10, 0.40),
+}
+
+
+def output_tokens(usage: dict) -> int:
+    """
+    usageから出力トークン数（思考トークンを含む）を求める
+
+    Geminiの completion_tokens には思考トークンが含まれないため、total - prompt で求める。
+
+    Args:
+        usage: LLMResponse.usage
+
+    Returns:
+        int: 出力トークン数
+    """
+    total = usage.get("total_tokens") or 0
+    prompt = usage.get("prompt_tokens") or 0
+    if total > prompt:
+        return total - prompt
+    return usage.get("completion_tokens") or 0
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float | None:
+    """
+    トークン数から概算コスト（USD）を求める
+
+    Args:
+        model: モデル名
+        prompt_tokens: 入力トークン数
+        completion_tokens: 出力トークン数
+
+    Returns:
+        float | None: 概算コスト（料金表にないモデルはNone）
+    """
+    # Geminiのモデル名には models/ が付く
+    name = model.lower().removeprefix("models/")
+    for prefix in sorted(PRICING, key=len, reverse=True):
+        if name.startswith(prefix):
+            input_price, output_price = PRICING[prefix]
+            return (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+    return None
+
+
+@dataclass
+class UsageEntry:
+    """種別・モデルごとの集計"""
+
+    kind: str
+    model: str
+    requests: int = 0
+    adopted: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    thinking_tokens: int = 0  # completion_tokens の内数（プロバイダーが内訳を返す場合のみ）
+
+    @property
+    def cost(self) -> float | None:
+        """概算コスト（USD）"""
+        return estimate_cost(self.model, self.prompt_tokens, self.completion_tokens)
+
+
+class UsageReport:
+    """
+    リクエストの使用量を種別（primary / hedge）・モデルごとに集計するクラス
+
+    スレッドセーフなので、パイプラインのI/Oワーカーやヘッジ用スレッドから直接記録してよい。
+    """
+
+    def __init__(self):
+        self._entries: dict[tuple[str, str], UsageEntry] = {}
+        self._lock = threading.Lock()
+
+    def add(self, kind: str, model: str, usage: dict, adopted: bool = True) -> None:
+        """
+        1リクエスト分の使用量を記録
+
+        Args:
+            kind: リクエストの種別（primary: 通常のリクエスト、hedge: ヘッジで送った複製、repair: 欠けたフィールドの補完）
+            model: モデル名
+            usage: LLMResponse.usage（打ち切られたリクエストでは空のこともある）
+            adopted: レスポンスが採用されたか
+        """
+        prompt = usage.get("prompt_tokens") or 0
+        # 思考トークンも出力として課金されるため含める
+        completion = output_tokens(usage)
+        thinking = usage.get("thinking_tokens") or 0
+
+        with self._lock:
+            entry = self._entries.setdefault((kind, model), UsageEntry(kind, model))
+            entry.requests += 1
+            entry.adopted += int(adopted)
+            entry.prompt_tokens += prompt
+            entry.completion_tokens += completion
+            entry.thinking_tokens += thinking
+
+    def entries(self) -> list[UsageEntry]:
+        """集計結果を種別・モデル順に返す"""
+        with self._lock:
+            return [self._entries[key] for key in sorted(self._entries)]
+
+    def format(self) -> list[str]:
+        """
+        コストレポートを表示用の行に整形する
+
+        Returns:
+            list[str]: 表示する行（記録がなければ空）
+        """
+        entries = self.entries()
+        if not entries:
+            return []
+
+        lines = [
+            f"{'種別':<8}{'モデル':<28}{'リクエスト':>8}{'採用':>6}{'入力':>10}{'出力':>10}{'うち思考':>10}{'概算コスト':>12}"
+        ]
+        total_cost = 0.0
+        for e in entries:
+            cost = e.cost
+            total_cost += cost or 0.0
+            cost_str = f"${cost:.4f}" if cost is not None else "-"
+            lines.append(
+                f"{e.kind:<8}{e.model:<28}{e.requests:>8}{e.adopted:>6}"
+                f"{e.prompt_tokens:>10}{e.completion_tokens:>10}{e.thinking_tokens:>10}{cost_str:>12}"
+            )
+        lines.append(f"合計概算コスト: ${total_cost:.4f}（料金表にないモデルは含まない）")
+        return lines
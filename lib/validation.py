@@ -0,0 +1,225 @@
+"""生成結果の整合性チェック（宣言的なルールを全行に対して配列演算で評価する）
+
+プロンプトに書いた構成ルール（経験年数 + 21〜22 が年齢、子どもがいなければ「下の子ども」はなし など）に
+反するペルソナを、Excelを目で見て探す代わりに、設定ディレクトリの rules.yaml に書いたルールで一括して検出する。
+
+- ルールは pandas の DataFrame.eval の式で書く（カラム名はバッククォートで囲む）。全行を1回で評価するため、
+  1万行でも数秒かからない
+- when を書いたルールは、when が成り立つ行だけを検査する
+- each を書いたルールは、式の {column} を各カラムに置き換えて1つずつのルールにする
+- numeric に挙げたカラムは数値に変換してから評価する（数値でない値は欠損になり、比較は不成立になる）
+- 生成エラー・パースエラーの行も違反として扱い、作り直しの対象にする
+"""
+
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+import pandas as pd
+
+from lib.log import logger
+
+if TYPE_CHECKING:
+    from lib.generator import PersonaGenerator
+
+# 生成エラー・パースエラーの行を表す違反名
+GENERATION_ERROR = "生成エラー"
+ERROR_COLUMNS = ("_error", "_parse_error")
+
+
+@dataclass
+class Rule:
+    """1つの整合性ルール"""
+
+    name: str
+    expr: str  # 成り立つべき条件（DataFrame.eval の式）
+    when: str | None = None  # この条件が成り立つ行だけを検査する
+
+
+def load_rules(raw_rules: list[dict[str, Any]]) -> list[Rule]:
+    """
+    rules.yaml の rules をルールの一覧にする
+
+    Args:
+        raw_rules: name, expr, when, each を持つ辞書のリスト
+
+    Returns:
+        list[Rule]: each を展開したルール
+    """
+    rules = []
+    for raw in raw_rules:
+        columns = raw.get("each")
+        if not columns:
+            rules.append(Rule(name=raw["name"], expr=raw["expr"], when=raw.get("when")))
+            continue
+        for column in columns:
+            rules.append(
+                Rule(
+                    name=f"{raw['name']}（{column}）",
+                    expr=raw["expr"].replace("{column}", column),
+                    when=raw["when"].replace("{column}", column) if raw.get("when") else None,
+                )
+            )
+    return rules
+
+
+def evaluate_rules(
+    df: pd.DataFrame, rules: list[Rule], numeric: list[str] | None = None, warn_missing: bool = True
+) -> pd.DataFrame:
+    """
+    全行に対してルールを評価する
+
+    Args:
+        df: 生成結果
+        rules: ルール
+        numeric: 数値に変換してから評価するカラム
+        warn_missing: 出力にないカラムを使うルールを評価しなかったときに警告するか
+
+    Returns:
+        pd.DataFrame: 行ごと・ルールごとの違反（Trueが違反）。インデックスは df と同じ
+            出力にないカラムを使うルールは警告して評価しない
+    """
+    frame = df.copy()
+    for column in numeric or []:
+        if column in frame.columns:
+            frame[column] = pd.to_numeric(frame[column], errors="coerce")
+
+    violations = pd.DataFrame(index=df.index)
+    errors = [c for c in ERROR_COLUMNS if c in df.columns]
+    if errors:
+        violations[GENERATION_ERROR] = df[errors].notna().any(axis=1)
+
+    for rule in rules:
+        try:
+            ok = _eval(frame, rule.expr)
+            applies = _eval(frame, rule.when) if rule.when else True
+        except pd.errors.UndefinedVariableError as e:
+            if warn_missing:
+                logger.warning("Skipping rule %s: %s", rule.name, e)
+            continue
+        violations[rule.name] = applies & ~ok
+
+    return violations
+
+
+def _eval(frame: pd.DataFrame, expr: str) -> pd.Series:
+    """式を全行に対して評価し、真偽値の Series を返す（欠損は不成立）"""
+    result = frame.eval(expr, engine="python")
+    if not isinstance(result, pd.Series):
+        result = pd.Series(result, index=frame.index)
+    return result.fillna(False).astype(bool)
+
+
+def violation_names(violations: pd.DataFrame) -> pd.Series:
+    """
+    行ごとに違反したルール名を「、」でつないだ文字列にする
+
+    Args:
+        violations: evaluate_rules の結果
+
+    Returns:
+        pd.Series: 違反したルール名（違反がなければ空文字列）
+    """
+    if violations.empty or not len(violations.columns):
+        return pd.Series("", index=violations.index)
+    return violations.apply(lambda row: "、".join(row.index[row]), axis=1)
+
+
+def summarize(violations: pd.DataFrame) -> list[str]:
+    """
+    ルールごとの違反件数をレポートの行にする
+
+    Args:
+        violations: evaluate_rules の結果
+
+    Returns:
+        list[str]: 表示用の行（違反のあるルールだけ、件数の多い順）
+    """
+    total = len(violations)
+    counts = violations.sum().sort_values(ascending=False)
+    lines = [f"{name}: {int(count):,}件（{count / total:.1%}）" for name, count in counts.items() if count]
+    failed = int(violations.any(axis=1).sum())
+    lines.append(f"違反のある行: {failed:,} / {total:,}件（{failed / total:.1%}）" if total else "行がありません")
+    return lines
+
+
+def base_rows_for_ids(
+    ids: list[int],
+    seed: int,
+    method: str,
+    n: int,
+    generate_excel_path: str | None = None,
+    sheet_name: str | int = "Sheet1",
+) -> list[tuple[int, dict[str, Any]]]:
+    """
+    作り直すIDの基本属性を、生成時と同じ方法で求める（IDは全体の行番号 + 1）
+
+    Args:
+        ids: ペルソナID
+        seed: 生成時の乱数シード
+        method: 生成時のサンプリング方式
+        n: 生成時の人数（sequential / stratified はこの人数で全行をサンプリングし直す）
+        generate_excel_path: 生成時に基本属性を読み込んだファイル（指定すればサンプリングしない）
+        sheet_name: 入力Excelのシート名
+
+    Returns:
+        list[tuple[int, dict]]: (ペルソナID, 基本属性) のリスト
+    """
+    from lib.sampling import generate_per_id_nurse_data, load_nurse_data_from_excel, sample_nurse_data
+
+    if generate_excel_path:
+        base_data = load_nurse_data_from_excel(generate_excel_path, sheet_name=sheet_name)
+    elif method == "per_id":
+        return [
+            (i, row.to_dict()) for i, (_, row) in zip(ids, generate_per_id_nurse_data(ids, seed=seed).iterrows(), strict=True)
+        ]
+    else:
+        base_data = sample_nurse_data(n=n, seed=seed, method=method)
+
+    if max(ids) > len(base_data):
+        raise ValueError(f"ID {max(ids)} の基本属性がありません（{len(base_data)}行）。生成時の人数を -n で指定してください")
+    return [(i, base_data.iloc[i - 1].to_dict()) for i in ids]
+
+
+def regenerate_failed(
+    generator: "PersonaGenerator",
+    df: pd.DataFrame,
+    violations: pd.DataFrame,
+    base_rows: dict[int, dict[str, Any]],
+    rules: list[Rule],
+    numeric: list[str] | None = None,
+    max_rounds: int = 2,
+    on_progress: Callable[[int, int, dict], None] | None = None,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    違反した行だけを作り直し、行を差し替えて再び検査する（違反がなくなるか max_rounds 回まで）
+
+    Args:
+        generator: ペルソナ生成器
+        df: 生成結果（id カラムが一意であること）
+        violations: df に対する evaluate_rules の結果
+        base_rows: ペルソナID -> 基本属性（違反した行の分があればよい）
+        rules: ルール
+        numeric: 数値に変換してから評価するカラム
+        max_rounds: 作り直す最大回数
+        on_progress: 進捗コールバック (current, total, persona) -> None
+
+    Returns:
+        tuple[pd.DataFrame, pd.DataFrame]: 差し替え後の生成結果と、その検査結果（行は元の順）
+    """
+    if df["id"].duplicated().any():
+        raise ValueError("id が重複しているため、行を差し替えられません")
+    order = df["id"].tolist()
+
+    for round_index in range(1, max_rounds + 1):
+        failed = df.loc[violations.any(axis=1).to_numpy(), "id"].astype(int).tolist()
+        if not failed:
+            break
+        logger.info("Regenerating %d rows (round %d/%d)", len(failed), round_index, max_rounds)
+
+        personas = generator.regenerate(((i, base_rows[i]) for i in failed), on_progress=on_progress)
+        df = pd.concat([df[~df["id"].isin(failed)], pd.DataFrame(personas)], ignore_index=True)
+        df = df.set_index("id").loc[order].reset_index()
+        violations = evaluate_rules(df, rules, numeric)
+
+    return df, violations
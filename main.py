@@ -3,15 +3,26 @@
 import json
 from enum import Enum
 from pathlib import Path
-from typing import Annotated, Optional
+from typing import TYPE_CHECKING, Annotated, Optional
 
 import typer
 from dotenv import load_dotenv
 
-from lib.config import ConfigLoader, create_llm_client
-from lib.generator import PersonaGenerator
+from lib.config import Config, ConfigLoader, LLMConfig, create_llm_client
 from lib.log import logger
-from lib.output import OutputWriter, can_write
+from lib.shard import parse_shard, resolve_output_path, shard_range
+
+# pandas などを読み込む重いモジュールは、list や --dry-run を速くするため使う直前に読み込む
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    import numpy as np
+    import pandas as pd
+
+    from lib.diversity import DuplicateReport
+    from lib.estimation import ChoiceData, EstimationResult
+    from lib.generator import PersonaGenerator
+    from lib.validation import Rule
 
 load_dotenv()
 
@@ -21,36 +32,170 @@ app = typer.Typer(help="DCE用の看護師ペルソナを生成するツール",
 class Provider(str, Enum):
     openai = "openai"
     anthropic = "anthropic"
+    gemini = "gemini"
+
+
+class ReasoningEffort(str, Enum):
+    minimal = "minimal"
+    low = "low"
+    medium = "medium"
+    high = "high"
+
+
+class SamplingMethod(str, Enum):
+    sequential = "sequential"
+    stratified = "stratified"
+    per_id = "per_id"
+
+
+class EstimationModel(str, Enum):
+    pooled = "pooled"
+    mixed = "mixed"
+    latent_class = "latent_class"
+    all = "all"
+
 
+class OutputFormat(str, Enum):
+    xlsx = "xlsx"
+    csv = "csv"
+    parquet = "parquet"
+    arrow = "arrow"
 
-def print_progress(current: int, total: int, persona: dict):
-    """進捗を表示するコールバック"""
+
+def print_progress(current: int, total: int, persona: dict, label: str = ""):
+    """進捗を表示するコールバック（label は連結パイプラインの段の名前）"""
     name = persona.get("診療科", "生成中")
     error = persona.get("_error", "")
     status = f"[ERROR: {error}]" if error else ""
-    typer.echo(f"  [{current}/{total}] id={persona.get('id', '?')} {name} {status}")
+    prefix = f"[{label}] " if label else ""
+    typer.echo(f"  {prefix}[{current}/{total}] id={persona.get('id', '?')} {name} {status}")
+
+
+def print_field(persona_id: int, key: str, value) -> None:
+    """ストリーミングで届いたフィールドを表示するコールバック"""
+    typer.echo(f"    id={persona_id} {key}: {value}")
+
+
+def print_usage(lines: list[str]) -> None:
+    """コストレポートを表示する"""
+    if not lines:
+        return
+    typer.echo("\n=== コストレポート ===")
+    for line in lines:
+        typer.echo(line)
 
 
-def get_unique_filepath(filepath: str) -> str:
-    """既存ファイルと重複しないファイルパスを返す
+def apply_overrides(
+    config: Config,
+    provider: Provider | None = None,
+    model: str | None = None,
+    output_format: OutputFormat | None = None,
+    stream: bool = False,
+    thinking_budget: int | None = None,
+    reasoning_effort: ReasoningEffort | None = None,
+    base_url: str | None = None,
+    choice_only: bool = False,
+    repair: bool = False,
+    dedup: bool = False,
+    samples_per_profile: int | None = None,
+    sampling_method: SamplingMethod | None = None,
+) -> None:
+    """コマンドライン引数で設定を上書きする"""
+    _apply_llm_overrides(config.llm, provider, model, stream, thinking_budget, reasoning_effort, base_url)
+    if output_format:
+        config.output.format = output_format.value
+    if choice_only:
+        config.choice_scoring.enabled = True
+    if repair:
+        config.repair.enabled = True
+    if dedup:
+        config.sampling.dedup = True
+    if samples_per_profile:
+        config.sampling.samples_per_profile = samples_per_profile
+    if sampling_method:
+        config.sampling.method = sampling_method.value
+
+
+def _apply_llm_overrides(
+    llm: LLMConfig,
+    provider: Provider | None,
+    model: str | None,
+    stream: bool,
+    thinking_budget: int | None,
+    reasoning_effort: ReasoningEffort | None,
+    base_url: str | None,
+) -> None:
+    """コマンドライン引数でLLM設定を上書きする"""
+    if provider:
+        llm.provider = provider.value
+    if model:
+        llm.model = model
+    if stream:
+        llm.stream = True
+    if thinking_budget is not None:
+        llm.thinking_budget = thinking_budget
+    if reasoning_effort:
+        llm.reasoning_effort = reasoning_effort.value
+    if base_url:
+        llm.base_url = base_url
 
-    ファイルが存在しない場合はそのまま返す。
-    存在する場合は result(1).xlsx, result(2).xlsx のように連番を付ける。
+
+def run_batch(
+    generator: "PersonaGenerator",
+    count: int,
+    seed: int | None,
+    row_range: range,
+    generate_excel_path: str | None = None,
+    sheet_name: str = "Sheet1",
+) -> list[dict]:
+    """
+    サンプリングまたはExcel入力からペルソナを生成する（row_rangeはシャードの担当範囲）
+
+    プリフライトやフェイルファストで中断した場合は、何も出力せずに終了する。
     """
-    path = Path(filepath)
-    if not path.exists():
-        return filepath
+    from lib.preflight import BatchAbortedError, PreflightError
+
+    try:
+        if generate_excel_path:
+            # シャードの担当範囲だけを読み込む（IDは全体の行番号から振る）
+            return generator.generate_batch_from_excel(
+                file_path=generate_excel_path,
+                sheet_name=sheet_name,
+                n=len(row_range),
+                skip_rows=row_range.start,
+                start_id=row_range.start + 1,
+                on_progress=print_progress,
+            )
+
+        return generator.generate_batch(
+            n=count,
+            seed=seed,
+            on_progress=print_progress,
+            row_range=row_range,
+        )
+    except (PreflightError, BatchAbortedError) as e:
+        typer.echo(f"エラー: {e}", err=True)
+        raise typer.Exit(1) from None
+
+
+def submit_to_server(job: dict, address: str) -> None:
+    """常駐サーバーにジョブを送信して結果を表示する"""
+    from lib.server import submit_job
 
-    stem = path.stem
-    suffix = path.suffix
-    parent = path.parent
+    typer.echo(f"サーバー {address} にジョブを送信中... (config={job['config']}, n={job['count']})")
+    try:
+        result = submit_job(job, address)
+    except OSError as e:
+        typer.echo(f"エラー: サーバーに接続できません: {e}", err=True)
+        raise typer.Exit(1) from None
+
+    if not result.get("ok"):
+        typer.echo(f"エラー: {result.get('error')}", err=True)
+        raise typer.Exit(1)
 
-    counter = 1
-    while True:
-        new_path = parent / f"{stem}({counter}){suffix}"
-        if not new_path.exists():
-            return str(new_path)
-        counter += 1
+    typer.echo(f"生成完了: {result['count']}件（エラー {result['errors']}件）")
+    print_usage(result.get("usage", []))
+    typer.echo(f"出力: {result['output']}")
 
 
 @app.command()
@@ -61,11 +206,41 @@ def generate(
     seed: Annotated[Optional[int], typer.Option("-s", "--seed", help="乱数シード")] = None,
     provider: Annotated[Optional[Provider], typer.Option(help="LLMプロバイダー")] = None,
     model: Annotated[Optional[str], typer.Option(help="モデル名")] = None,
+    output_format: Annotated[Optional[OutputFormat], typer.Option("--format", help="出力形式")] = None,
+    stream: Annotated[bool, typer.Option("--stream", help="ストリーミングで受信し、形式外れを早期に打ち切る")] = False,
     append: Annotated[bool, typer.Option(help="既存ファイルに追記")] = False,
     dry_run: Annotated[bool, typer.Option("--dry-run", help="設定確認のみ")] = False,
     generate_excel_path: Annotated[
         str, typer.Option("--generate-excel-path", help="Excelファイルパス（指定されるとgenerateしない）")
     ] = None,
+    sheet_name: Annotated[str, typer.Option("--sheet-name", help="Excelのシート名")] = "Sheet1",
+    workers: Annotated[int, typer.Option("-w", "--workers", help="同時リクエスト数（2以上で並列パイプライン）")] = 1,
+    shard: Annotated[
+        Optional[str], typer.Option("--shard", help="i/N 形式で指定すると、全体をN分割したi番目だけを生成")
+    ] = None,
+    server: Annotated[Optional[str], typer.Option("--server", help="常駐サーバー（host:port）にジョブを送信して実行")] = None,
+    thinking_budget: Annotated[
+        Optional[int], typer.Option("--thinking-budget", help="思考トークンの予算（0で思考なし）")
+    ] = None,
+    reasoning_effort: Annotated[
+        Optional[ReasoningEffort], typer.Option("--reasoning-effort", help="思考の度合い（予算の代わりに指定）")
+    ] = None,
+    base_url: Annotated[
+        Optional[str], typer.Option("--base-url", help="OpenAI互換のAPIサーバーのURL（ローカルのスタブなど）")
+    ] = None,
+    choice_only: Annotated[
+        bool, typer.Option("--choice-only", help="理由を生成せず、選択タスクごとに A を選ぶ確率だけを求める")
+    ] = False,
+    repair: Annotated[bool, typer.Option("--repair", help="欠けた・不正なフィールドだけを追加のリクエストで補う")] = False,
+    dedup: Annotated[bool, typer.Option("--dedup", help="同じ基本属性の行はプロファイルごとにまとめて生成する")] = False,
+    samples_per_profile: Annotated[
+        Optional[int], typer.Option("--samples-per-profile", help="--dedup 時、プロファイルごとに生成する件数")
+    ] = None,
+    sampling_method: Annotated[
+        Optional[SamplingMethod], typer.Option("--sampling-method", help="基本属性のサンプリング方式")
+    ] = None,
+    preflight: Annotated[bool, typer.Option(help="バッチの前に1件だけ生成して設定を確かめる")] = True,
+    fail_fast_k: Annotated[int, typer.Option("--fail-fast-k", help="最初のK件が同じエラーで失敗したら中断する（0で無効）")] = 5,
 ):
     """ペルソナを生成する"""
     """
@@ -83,6 +258,36 @@ def generate(
     gemini-2.0-flash        Input:$0.10   Output:$0.40
     gemini-1.5-flash        Input:$0.10   Output:$0.40
     """
+    # 常駐サーバーに送信する場合は、クライアントの作成も生成もサーバー側で行う
+    if server and not dry_run:
+        job = {
+            "config": config_name,
+            "count": count,
+            "seed": seed,
+            "provider": provider.value if provider else None,
+            "model": model,
+            "format": output_format.value if output_format else None,
+            "stream": stream,
+            "thinking_budget": thinking_budget,
+            "reasoning_effort": reasoning_effort.value if reasoning_effort else None,
+            "base_url": base_url,
+            "choice_only": choice_only,
+            "repair": repair,
+            "output": output,
+            "generate_excel_path": generate_excel_path,
+            "sheet_name": sheet_name,
+            "workers": workers,
+            "dedup": dedup,
+            "samples_per_profile": samples_per_profile,
+            "sampling_method": sampling_method.value if sampling_method else None,
+            "preflight": preflight,
+            "fail_fast_k": fail_fast_k,
+            "shard": shard,
+            "append": append,
+        }
+        submit_to_server(job, server)
+        return
+
     # 設定読み込み
     try:
         config = ConfigLoader.load("configs/" + config_name)
@@ -92,10 +297,29 @@ def generate(
         raise typer.Exit(1) from None
 
     # コマンドライン引数で上書き
-    if provider:
-        config.llm.provider = provider.value
-    if model:
-        config.llm.model = model
+    apply_overrides(
+        config,
+        provider=provider,
+        model=model,
+        output_format=output_format,
+        stream=stream,
+        thinking_budget=thinking_budget,
+        reasoning_effort=reasoning_effort,
+        base_url=base_url,
+        choice_only=choice_only,
+        repair=repair,
+        dedup=dedup,
+        samples_per_profile=samples_per_profile,
+        sampling_method=sampling_method,
+    )
+
+    # シャード指定
+    try:
+        shard_index, shard_count = parse_shard(shard) if shard else (1, 1)
+    except ValueError as e:
+        typer.echo(f"エラー: {e}", err=True)
+        raise typer.Exit(1) from None
+    row_range = shard_range(count, shard_index, shard_count)
 
     # ドライランモード
     if dry_run:
@@ -105,17 +329,28 @@ def generate(
         typer.echo(f"LLM Provider: {config.llm.provider}")
         typer.echo(f"LLM Model: {config.llm.model}")
         typer.echo(f"Temperature: {config.llm.temperature}")
+        typer.echo(f"Stream: {config.llm.stream}")
+        typer.echo(f"Base URL: {config.llm.base_url or '-'}")
+        typer.echo(f"Choice Only: {config.choice_scoring.enabled}")
+        typer.echo(f"Repair: {config.repair.enabled} (max attempts={config.repair.max_attempts})")
+        typer.echo(f"Thinking: budget={config.llm.thinking_budget} reasoning_effort={config.llm.reasoning_effort}")
+        typer.echo(f"Preflight: {preflight} (fail-fast k={fail_fast_k})")
+        typer.echo(f"Sampling Method: {config.sampling.method}")
+        typer.echo(f"Dedup: {config.sampling.dedup} (samples per profile={config.sampling.samples_per_profile})")
         typer.echo(f"Count: {count}")
+        typer.echo(f"Shard: {shard_index}/{shard_count} (rows {row_range.start + 1}-{row_range.stop})")
         typer.echo(f"Seed: {seed or config.sampling.seed}")
         typer.echo(f"Output: {output}")
+        typer.echo(f"Output Format: {config.output.format}")
         typer.echo(f"Append: {append}")
         typer.echo(f"Output Columns: {len(config.output.columns)} columns")
         raise typer.Exit(0)
 
-    # 出力ファイルパスの決定（追記モードでない場合、既存ファイルがあれば連番を付ける）
-    output_name = output or config_name
-    if not append:
-        output = get_unique_filepath(f"output/{output_name}.xlsx")
+    from lib.generator import PersonaGenerator
+    from lib.output import OutputWriter, can_write
+
+    # 出力ファイルパスの決定
+    output = resolve_output_path(config, output or config_name, append, shard_index, shard_count)
 
     # 出力ファイルの書き込みチェック
     if not can_write(output):
@@ -131,21 +366,12 @@ def generate(
         raise typer.Exit(1) from None
 
     # ペルソナ生成
-    typer.echo(f"ペルソナを生成中... (n={count}, provider={config.llm.provider})")
-    generator = PersonaGenerator(config, llm_client)
+    typer.echo(f"ペルソナを生成中... (n={len(row_range)}, provider={config.llm.provider}, workers={workers})")
+    generator = PersonaGenerator(
+        config, llm_client, workers=workers, on_field=print_field, preflight=preflight, fail_fast_k=fail_fast_k
+    )
 
-    if generate_excel_path:
-        personas = generator.generate_batch_from_excel(
-            file_path=generate_excel_path,
-            sheet_name="Sheet1",
-            n=count,
-        )
-    else:
-        personas = generator.generate_batch(
-            n=count,
-            seed=seed,
-            on_progress=print_progress,
-        )
+    personas = run_batch(generator, count, seed, row_range, generate_excel_path, sheet_name)
 
     # 結果を表示
     typer.echo(f"\n生成完了: {len(personas)}件")
@@ -153,6 +379,7 @@ def generate(
         typer.echo(json.dumps(persona, ensure_ascii=False, indent=2))
     if len(personas) > 3:
         typer.echo(f"... 他 {len(personas) - 3}件")
+    print_usage(generator.usage.format())
 
     # 出力
     settings = config.to_json()
@@ -161,6 +388,730 @@ def generate(
     typer.echo(f"\n出力: {output_path}")
 
 
+@app.command()
+def merge(
+    shard_files: Annotated[list[str], typer.Argument(help="結合するシャードの出力ファイル")],
+    output: Annotated[str, typer.Option("-o", "--output", help="出力ファイルパス")],
+    config_name: Annotated[str, typer.Option("-c", "--config", help="設定ディレクトリ")] = "v1_nurse",
+):
+    """シャードごとの出力ファイルをid順に1つのファイルへ結合する"""
+    from lib.output import can_write
+    from lib.shard import merge_shards
+
+    try:
+        config = ConfigLoader.load("configs/" + config_name)
+    except FileNotFoundError as e:
+        typer.echo(f"エラー: {e}", err=True)
+        raise typer.Exit(1) from None
+
+    if not can_write(output):
+        typer.echo(f"エラー: {output} を閉じてください", err=True)
+        raise typer.Exit(1)
+
+    output_path = merge_shards(shard_files, output, config)
+    typer.echo(f"出力: {output_path}")
+
+
+@app.command()
+def population(
+    count: Annotated[int, typer.Option("-n", "--count", help="母集団の総数")] = 10_000_000,
+    output: Annotated[str, typer.Option("-o", "--output", help="出力ファイルパス（.parquet）")] = "output/population.parquet",
+    seed: Annotated[int, typer.Option("-s", "--seed", help="乱数シード")] = 42,
+    chunk_size: Annotated[int, typer.Option("--chunk-size", help="1チャンクの行数（メモリ使用量の目安）")] = 1_000_000,
+    workers: Annotated[int, typer.Option("-w", "--workers", help="生成に使うプロセス数")] = 1,
+):
+    """事後層化用の合成母集団をチャンクごとに生成してParquetへ書き出す"""
+    from lib.output import can_write
+    from lib.population import write_population_parquet
+
+    if count <= 0 or chunk_size <= 0:
+        typer.echo("エラー: -n と --chunk-size は1以上を指定してください", err=True)
+        raise typer.Exit(1)
+    if not can_write(output):
+        typer.echo(f"エラー: {output} を閉じてください", err=True)
+        raise typer.Exit(1)
+
+    def on_progress(written: int, total: int) -> None:
+        typer.echo(f"[{written:,}/{total:,}] written")
+
+    output_path = write_population_parquet(
+        output, n=count, seed=seed, chunk_size=chunk_size, workers=workers, on_progress=on_progress
+    )
+    typer.echo(f"出力: {output_path}")
+
+
+@app.command()
+def weights(
+    path: Annotated[str, typer.Argument(help="重みを付ける出力ファイル")],
+    output: Annotated[Optional[str], typer.Option("-o", "--output", help="出力ファイルパス（.csv / .xlsx / .parquet）")] = None,
+):
+    """生成結果に、性別・年代・都道府県の目標比率に合わせるレイキング重み（重み カラム）を付ける"""
+    from lib.output import can_write, get_unique_filepath, read_output
+    from lib.sampling import rake_to_targets
+
+    try:
+        df = read_output(path)
+        frame, row_weights = rake_to_targets(df)
+    except (FileNotFoundError, ValueError) as e:
+        typer.echo(f"エラー: {e}", err=True)
+        raise typer.Exit(1) from None
+
+    source = Path(path)
+    suffix = source.suffix if source.suffix.lower() in (".xlsx", ".parquet", ".csv") else ".parquet"
+    output = output or get_unique_filepath(str(source.with_name(f"{source.stem}.weighted{suffix}")))
+    if not can_write(output):
+        typer.echo(f"エラー: {output} を閉じてください", err=True)
+        raise typer.Exit(1)
+
+    print_margins(frame, row_weights)
+    df["重み"] = row_weights
+    write_table(df, output)
+    typer.echo(f"\n出力: {output}")
+
+
+def print_margins(frame: "pd.DataFrame", row_weights: "np.ndarray") -> None:
+    """重み付け前後の性別・年代の構成比と、有効サンプルサイズを表示する"""
+    import pandas as pd
+
+    from lib.sampling import target_margins
+
+    targets = target_margins()
+    n_eff = row_weights.sum() ** 2 / (row_weights**2).sum()
+    typer.echo(
+        f"=== レイキング: {len(frame):,}件（有効サンプルサイズ {n_eff:,.1f}、重み {row_weights.min():.2f}〜{row_weights.max():.2f}） ==="
+    )
+    for column in ("性別", "年代"):
+        if column not in frame.columns:
+            continue
+        raw = frame[column].value_counts(normalize=True)
+        weighted = pd.Series(row_weights, index=frame.index).groupby(frame[column]).sum() / row_weights.sum()
+        typer.echo(f"{column}: カテゴリ  元の比率 → 重み付き（目標）")
+        for category, target in targets[column].items():
+            typer.echo(f"  {category}  {raw.get(category, 0):.1%} → {weighted.get(category, 0):.1%}（{target:.1%}）")
+
+
+@app.command()
+def validate(
+    path: Annotated[str, typer.Argument(help="検査する出力ファイル")],
+    config_name: Annotated[str, typer.Option("-c", "--config", help="設定ディレクトリ")] = "v1_nurse",
+    output: Annotated[Optional[str], typer.Option("-o", "--output", help="違反を記録した結果の出力ファイルパス")] = None,
+    regenerate: Annotated[bool, typer.Option("--regenerate", help="違反した行だけを作り直す")] = False,
+    max_rounds: Annotated[Optional[int], typer.Option("--max-rounds", help="作り直す最大回数")] = None,
+    count: Annotated[Optional[int], typer.Option("-n", "--count", help="生成時の人数（既定: 最大のid）")] = None,
+    seed: Annotated[Optional[int], typer.Option("-s", "--seed", help="生成時の乱数シード")] = None,
+    sampling_method: Annotated[
+        Optional[SamplingMethod], typer.Option("--sampling-method", help="生成時のサンプリング方式")
+    ] = None,
+    generate_excel_path: Annotated[
+        Optional[str], typer.Option("--generate-excel-path", help="生成時に基本属性を読み込んだファイル")
+    ] = None,
+    sheet_name: Annotated[str, typer.Option("--sheet-name", help="Excelのシート名")] = "Sheet1",
+    workers: Annotated[int, typer.Option("-w", "--workers", help="同時リクエスト数（作り直し時）")] = 1,
+):
+    """出力ファイルを rules.yaml のルールで検査し、違反した行だけを作り直す"""
+    from lib.output import OutputWriter, can_write, read_output
+    from lib.validation import evaluate_rules, load_rules, summarize, violation_names
+
+    try:
+        config = ConfigLoader.load("configs/" + config_name)
+    except FileNotFoundError as e:
+        typer.echo(f"エラー: {e}", err=True)
+        raise typer.Exit(1) from None
+    if not config.validation.rules:
+        typer.echo(f"エラー: {config_name} に整合性ルールがありません（validation.rules_file）", err=True)
+        raise typer.Exit(1)
+
+    rules = load_rules(config.validation.rules)
+    df = read_output(path).drop(columns=["_violations"], errors="ignore")
+    violations = evaluate_rules(df, rules, config.validation.numeric)
+    typer.echo(f"=== 整合性チェック: {path}（{len(rules)}ルール） ===")
+    for line in summarize(violations):
+        typer.echo(line)
+
+    if regenerate and violations.any(axis=1).any():
+        apply_overrides(config, sampling_method=sampling_method)
+        df, violations = regenerate_violations(
+            config, df, violations, rules, max_rounds, count, seed, generate_excel_path, sheet_name, workers
+        )
+        typer.echo("\n=== 作り直し後 ===")
+        for line in summarize(violations):
+            typer.echo(line)
+        output = output or str(Path(path).with_suffix(".validated" + Path(path).suffix))
+
+    if output:
+        if not can_write(output):
+            typer.echo(f"エラー: {output} を閉じてください", err=True)
+            raise typer.Exit(1)
+        df["_violations"] = violation_names(violations).replace("", None)
+        output_path = OutputWriter(config).write(df.to_dict("records"), output, settings=config.to_json())
+        typer.echo(f"\n出力: {output_path}")
+
+
+def regenerate_violations(
+    config: Config,
+    df: "pd.DataFrame",
+    violations: "pd.DataFrame",
+    rules: "list[Rule]",
+    max_rounds: int | None,
+    count: int | None,
+    seed: int | None,
+    generate_excel_path: str | None,
+    sheet_name: str,
+    workers: int,
+) -> "tuple[pd.DataFrame, pd.DataFrame]":
+    """違反した行の基本属性を生成時と同じ方法で求め、その行だけを作り直す"""
+    from lib.generator import PersonaGenerator
+    from lib.validation import base_rows_for_ids, regenerate_failed
+
+    failed = df.loc[violations.any(axis=1).to_numpy(), "id"].astype(int).tolist()
+    try:
+        base_rows = base_rows_for_ids(
+            failed,
+            seed=seed if seed is not None else config.sampling.seed,
+            method=config.sampling.method,
+            n=count or int(df["id"].max()),
+            generate_excel_path=generate_excel_path,
+            sheet_name=sheet_name,
+        )
+        llm_client = create_llm_client(config.llm)
+    except ValueError as e:
+        typer.echo(f"エラー: {e}", err=True)
+        raise typer.Exit(1) from None
+
+    typer.echo(f"\n違反した {len(failed)}件を作り直し中... (provider={config.llm.provider}, workers={workers})")
+    generator = PersonaGenerator(config, llm_client, workers=workers)
+    df, violations = regenerate_failed(
+        generator,
+        df,
+        violations,
+        dict(base_rows),
+        rules,
+        config.validation.numeric,
+        max_rounds=max_rounds or config.validation.max_rounds,
+        on_progress=print_progress,
+    )
+    print_usage(generator.usage.format())
+    return df, violations
+
+
+@app.command()
+def diversity(
+    path: Annotated[str, typer.Argument(help="検査する出力ファイル")],
+    config_name: Annotated[str, typer.Option("-c", "--config", help="設定ディレクトリ")] = "v1_nurse",
+    threshold: Annotated[
+        Optional[float], typer.Option("--threshold", help="重複とする Jaccard 係数の下限（既定: diversity.threshold）")
+    ] = None,
+    output: Annotated[Optional[str], typer.Option("-o", "--output", help="重複を記録した結果の出力ファイルパス")] = None,
+    regenerate: Annotated[bool, typer.Option("--regenerate", help="近似重複の行を多様性の指示を付けて作り直す")] = False,
+    count: Annotated[Optional[int], typer.Option("-n", "--count", help="生成時の人数（既定: 最大のid）")] = None,
+    seed: Annotated[Optional[int], typer.Option("-s", "--seed", help="生成時の乱数シード")] = None,
+    sampling_method: Annotated[
+        Optional[SamplingMethod], typer.Option("--sampling-method", help="生成時のサンプリング方式")
+    ] = None,
+    generate_excel_path: Annotated[
+        Optional[str], typer.Option("--generate-excel-path", help="生成時に基本属性を読み込んだファイル")
+    ] = None,
+    sheet_name: Annotated[str, typer.Option("--sheet-name", help="Excelのシート名")] = "Sheet1",
+    workers: Annotated[int, typer.Option("-w", "--workers", help="同時リクエスト数（作り直し時）")] = 1,
+):
+    """出力ファイルから、ほぼ同じペルソナ・理由文を MinHash/LSH で検出し、重複した行だけを作り直す"""
+    from lib.output import OutputWriter, can_write, read_output
+
+    try:
+        config = ConfigLoader.load("configs/" + config_name)
+    except FileNotFoundError as e:
+        typer.echo(f"エラー: {e}", err=True)
+        raise typer.Exit(1) from None
+    if threshold is not None:
+        config.diversity.threshold = threshold
+
+    df = read_output(path).drop(columns=["_near_duplicate"], errors="ignore")
+    typer.echo(f"=== 近似重複: {path}（threshold={config.diversity.threshold}） ===")
+    report = run_diversity_audit(config, df)
+
+    if regenerate and report.flagged.any():
+        apply_overrides(config, sampling_method=sampling_method)
+        df = regenerate_duplicates(config, df, report, count, seed, generate_excel_path, sheet_name, workers)
+        typer.echo("\n=== 作り直し後 ===")
+        report = run_diversity_audit(config, df)
+        output = output or str(Path(path).with_suffix(".diverse" + Path(path).suffix))
+
+    if output:
+        from lib.diversity import duplicate_labels
+
+        if not can_write(output):
+            typer.echo(f"エラー: {output} を閉じてください", err=True)
+            raise typer.Exit(1)
+        df["_near_duplicate"] = duplicate_labels(df, report).replace("", None)
+        output_path = OutputWriter(config).write(df.to_dict("records"), output, settings=config.to_json())
+        typer.echo(f"\n出力: {output_path}")
+
+
+def run_diversity_audit(config: Config, df: "pd.DataFrame") -> "DuplicateReport":
+    """diversity の設定で近似重複を検出し、件数を表示する"""
+    from lib.diversity import audit, summarize
+
+    settings = config.diversity
+    fixed = {"id", *config.sampling.attributes}
+    columns = settings.columns or [c for c in config.output.columns if c not in fixed]
+    try:
+        report = audit(
+            df,
+            columns,
+            settings.text_columns,
+            threshold=settings.threshold,
+            ngram=settings.ngram,
+            num_perm=settings.num_perm,
+            bands=settings.bands,
+        )
+    except ValueError as e:
+        typer.echo(f"エラー: {e}", err=True)
+        raise typer.Exit(1) from None
+    for line in summarize(report):
+        typer.echo(line)
+    return report
+
+
+def regenerate_duplicates(
+    config: Config,
+    df: "pd.DataFrame",
+    report: "DuplicateReport",
+    count: int | None,
+    seed: int | None,
+    generate_excel_path: str | None,
+    sheet_name: str,
+    workers: int,
+) -> "pd.DataFrame":
+    """近似重複の行の基本属性を生成時と同じ方法で求め、代表の内容を避ける指示を付けて作り直す"""
+    import pandas as pd
+
+    from lib.diversity import diversity_hints
+    from lib.generator import PersonaGenerator
+    from lib.validation import base_rows_for_ids
+
+    if df["id"].duplicated().any():
+        typer.echo("エラー: id が重複しているため、行を差し替えられません", err=True)
+        raise typer.Exit(1)
+    hints = diversity_hints(df, report)
+    try:
+        base_rows = base_rows_for_ids(
+            sorted(hints),
+            seed=seed if seed is not None else config.sampling.seed,
+            method=config.sampling.method,
+            n=count or int(df["id"].max()),
+            generate_excel_path=generate_excel_path,
+            sheet_name=sheet_name,
+        )
+        llm_client = create_llm_client(config.llm)
+    except ValueError as e:
+        typer.echo(f"エラー: {e}", err=True)
+        raise typer.Exit(1) from None
+
+    typer.echo(f"\n近似重複の {len(hints)}件を作り直し中... (provider={config.llm.provider}, workers={workers})")
+    generator = PersonaGenerator(config, llm_client, workers=workers)
+    generator.prompt_hints = hints
+    personas = generator.regenerate(base_rows, on_progress=print_progress)
+    print_usage(generator.usage.format())
+
+    order = df["id"].tolist()
+    df = pd.concat([df[~df["id"].isin(hints)], pd.DataFrame(personas)], ignore_index=True)
+    return df.set_index("id").loc[order].reset_index()
+
+
+@app.command()
+def chain(
+    path: Annotated[str, typer.Argument(help="連結パイプラインの定義（YAML）")] = "pipelines/nurse_dce.yaml",
+    count: Annotated[int, typer.Option("-n", "--count", help="1段目で生成する人数")] = 10,
+    output: Annotated[Optional[str], typer.Option("-o", "--output", help="出力ファイル名（既定: パイプライン名）")] = None,
+    seed: Annotated[Optional[int], typer.Option("-s", "--seed", help="乱数シード")] = None,
+    generate_excel_path: Annotated[
+        Optional[str], typer.Option("--generate-excel-path", help="1段目の基本属性を読み込むファイル")
+    ] = None,
+    sheet_name: Annotated[str, typer.Option("--sheet-name", help="Excelのシート名")] = "Sheet1",
+    fail_fast_k: Annotated[int, typer.Option("--fail-fast-k", help="最初のK件が同じエラーで失敗したら中断する（0で無効）")] = 5,
+    dry_run: Annotated[bool, typer.Option("--dry-run", help="設定確認のみ")] = False,
+):
+    """設定を段としてつなぎ、生成したペルソナをそのまま次の段（DCE回答など）に流す"""
+    from lib.chain import ChainedPipeline, load_chain
+    from lib.config import apply_job_overrides
+    from lib.preflight import BatchAbortedError
+
+    try:
+        pipeline_config = load_chain(path)
+        configs = [ConfigLoader.load("configs/" + stage.config) for stage in pipeline_config.stages]
+    except (FileNotFoundError, ValueError) as e:
+        typer.echo(f"エラー: {e}", err=True)
+        raise typer.Exit(1) from None
+    for config, stage in zip(configs, pipeline_config.stages, strict=True):
+        apply_job_overrides(config, stage.overrides)
+    # 省略時は、2回に分けて実行したときにExcelに書かれるカラム（前段の output.columns）を渡す
+    input_columns = [None] + [
+        stage.input_columns or configs[i].output.columns for i, stage in enumerate(pipeline_config.stages[1:])
+    ]
+
+    if dry_run:
+        typer.echo("=== Dry Run Mode ===")
+        typer.echo(f"Pipeline: {pipeline_config.name}")
+        typer.echo(f"Description: {pipeline_config.description}")
+        for i, (config, stage) in enumerate(zip(configs, pipeline_config.stages, strict=True)):
+            typer.echo(f"Stage {i + 1}: {config.name} ({config.llm.provider}/{config.llm.model}, workers={stage.workers})")
+        typer.echo(f"Count: {count}")
+        typer.echo(f"Intermediate Format: {pipeline_config.intermediate_format}")
+        raise typer.Exit(0)
+
+    from lib.generator import PersonaGenerator
+
+    try:
+        generators = [
+            PersonaGenerator(config, create_llm_client(config.llm), workers=stage.workers, fail_fast_k=fail_fast_k)
+            for config, stage in zip(configs, pipeline_config.stages, strict=True)
+        ]
+    except ValueError as e:
+        typer.echo(f"エラー: {e}", err=True)
+        raise typer.Exit(1) from None
+
+    rows, total = chain_base_rows(generators[0], count, seed, generate_excel_path, sheet_name)
+    names = [stage.config for stage in pipeline_config.stages]
+    typer.echo(f"連結パイプラインで生成中... (n={total if total is not None else '?'}, stages={' → '.join(names)})")
+
+    def on_progress(stage: int, current: int, stage_total: int, persona: dict) -> None:
+        print_progress(current, stage_total, persona, label=names[stage])
+
+    pipeline = ChainedPipeline(generators, [stage.workers for stage in pipeline_config.stages], input_columns)
+    try:
+        results = pipeline.run(rows, total=total, on_progress=on_progress)
+    except BatchAbortedError as e:
+        typer.echo(f"エラー: {e}", err=True)
+        raise typer.Exit(1) from None
+
+    write_chain_outputs(pipeline_config.intermediate_format, output or pipeline_config.name, configs, names, results)
+    for name, generator in zip(names, generators, strict=True):
+        typer.echo(f"\n[{name}]")
+        print_usage(generator.usage.format())
+
+
+def chain_base_rows(
+    generator: "PersonaGenerator", count: int, seed: int | None, generate_excel_path: str | None, sheet_name: str
+) -> tuple:
+    """連結パイプラインの1段目に流す (ペルソナID, 基本属性) の行と、その総数を返す"""
+    if generate_excel_path:
+        from lib.sampling import count_nurse_data_rows, iter_nurse_data_from_excel
+
+        total = count_nurse_data_rows(generate_excel_path, sheet_name=sheet_name)
+        total = count if total is None else min(count, total)
+        rows = iter_nurse_data_from_excel(generate_excel_path, sheet_name=sheet_name, n=count)
+        return enumerate(rows, start=1), total
+
+    base_data = generator.sample_base_data(count, seed=seed)
+    return enumerate((row.to_dict() for _, row in base_data.iterrows()), start=1), len(base_data)
+
+
+def write_chain_outputs(
+    intermediate_format: str, output: str, configs: list[Config], names: list[str], results: list[list[dict]]
+) -> None:
+    """途中の段の結果は列指向の形式で、最後の段の結果はその設定の形式で出力する"""
+    from lib.output import FORMAT_SUFFIXES, OutputWriter, get_unique_filepath
+
+    typer.echo("")
+    for i, (config, name, personas) in enumerate(zip(configs, names, results, strict=True)):
+        errors = sum(1 for persona in personas if "_error" in persona or "_parse_error" in persona)
+        if i < len(configs) - 1:
+            path = get_unique_filepath(f"output/{output}.{Path(name).name}{FORMAT_SUFFIXES[intermediate_format]}")
+        else:
+            path = resolve_output_path(config, output, append=False)
+        output_path = OutputWriter(config).write(personas, path, settings=config.to_json())
+        typer.echo(f"[{name}] 生成完了: {len(personas)}件（エラー {errors}件） 出力: {output_path}")
+
+
+@app.command()
+def estimate(
+    path: Annotated[str, typer.Argument(help="DCE回答の出力ファイル")],
+    config_name: Annotated[str, typer.Option("-c", "--config", help="設定ディレクトリ")] = "v1_dce",
+    personas: Annotated[
+        Optional[str], typer.Option("--personas", help="共変量を持つペルソナの出力ファイル（id で結合）")
+    ] = None,
+    model: Annotated[EstimationModel, typer.Option("-m", "--model", help="推定するモデル")] = EstimationModel.all,
+    draws: Annotated[Optional[int], typer.Option("--draws", help="混合ロジットの1人あたりのドロー数")] = None,
+    classes: Annotated[Optional[int], typer.Option("--classes", help="潜在クラスロジットのクラス数")] = None,
+    workers: Annotated[int, typer.Option("-w", "--workers", help="対数尤度の計算に使うプロセス数")] = 1,
+    seed: Annotated[int, typer.Option("-s", "--seed", help="Halton 列のシフト・潜在クラスの初期値の乱数シード")] = 42,
+    output: Annotated[
+        Optional[str], typer.Option("-o", "--output", help="推定値の表の出力ファイルパス（.csv / .xlsx）")
+    ] = None,
+    save: Annotated[Optional[str], typer.Option("--save", help="simulate で使う推定結果の保存先（.json）")] = None,
+):
+    """DCE回答から、混合ロジット・潜在クラスロジットで選好の異質性を推定する"""
+    from lib.estimation import build_choice_data, format_result, save_estimates
+    from lib.output import read_output
+
+    try:
+        config = ConfigLoader.load("configs/" + config_name)
+        data = build_choice_data(
+            read_output(path),
+            config.choice_sets,
+            covariates=config.estimation.covariates,
+            coding=config.estimation.coding,
+            reference=config.estimation.reference,
+            personas=read_output(personas) if personas else None,
+        )
+    except (FileNotFoundError, ValueError) as e:
+        typer.echo(f"エラー: {e}", err=True)
+        raise typer.Exit(1) from None
+    if draws:
+        config.estimation.n_draws = draws
+    if classes:
+        config.estimation.n_classes = classes
+
+    typer.echo(f"推定中... (回答者={data.n_respondents:,}人, 説明変数={len(data.attributes)}, 共変量={len(data.covariates)})")
+    results = run_estimation(data, config, model, workers, seed)
+    for result in results:
+        typer.echo("")
+        for line in format_result(result):
+            typer.echo(line)
+
+    if output:
+        import pandas as pd
+
+        write_table(pd.concat([result.to_frame() for result in results], ignore_index=True), output)
+        typer.echo(f"\n出力: {output}")
+    if save:
+        typer.echo(f"推定結果: {save_estimates(save, data, results)}")
+
+
+def run_estimation(
+    data: "ChoiceData", config: Config, model: EstimationModel, workers: int, seed: int
+) -> "list[EstimationResult]":
+    """プールの推定値を初期値にして、指定したモデルを推定する"""
+    from lib.estimation import fit_latent_class, fit_mixed_logit, fit_pooled_logit
+
+    settings = config.estimation
+    pooled = fit_pooled_logit(data, workers=workers, max_iter=settings.max_iter)
+    results = [pooled] if model in (EstimationModel.pooled, EstimationModel.all) else []
+    if model in (EstimationModel.mixed, EstimationModel.all):
+        results.append(
+            fit_mixed_logit(
+                data,
+                n_draws=settings.n_draws,
+                random=settings.random,
+                workers=workers,
+                seed=seed,
+                max_iter=settings.max_iter,
+                start=pooled.estimates,
+            )
+        )
+    if model in (EstimationModel.latent_class, EstimationModel.all):
+        results.append(
+            fit_latent_class(
+                data,
+                n_classes=settings.n_classes,
+                workers=workers,
+                seed=seed,
+                max_iter=settings.max_iter,
+                start=pooled.estimates,
+            )
+        )
+    return results
+
+
+def write_table(table: "pd.DataFrame", output: str) -> None:
+    """集計表を拡張子に応じて .xlsx / .parquet / .csv で書き出す"""
+    suffix = Path(output).suffix.lower()
+    if suffix == ".xlsx":
+        table.to_excel(output, index=False)
+    elif suffix == ".parquet":
+        table.to_parquet(output, index=False)
+    else:
+        table.to_csv(output, index=False, encoding="utf-8-sig")
+
+
+@app.command()
+def simulate(
+    path: Annotated[str, typer.Argument(help="estimate --save で保存した推定結果（.json）")],
+    config_name: Annotated[str, typer.Option("-c", "--config", help="設定ディレクトリ")] = "v1_dce",
+    population_path: Annotated[
+        Optional[str], typer.Option("--population", help="population コマンドで書き出した母集団（.parquet）")
+    ] = None,
+    count: Annotated[int, typer.Option("-n", "--count", help="--population がない場合に生成する母集団の総数")] = 1_000_000,
+    seed: Annotated[int, typer.Option("-s", "--seed", help="母集団を生成する乱数シード")] = 42,
+    model: Annotated[Optional[str], typer.Option("-m", "--model", help="使う推定結果: pooled | mixed | latent_class")] = None,
+    workers: Annotated[int, typer.Option("-w", "--workers", help="母集団の生成に使うプロセス数")] = 1,
+    top: Annotated[int, typer.Option("--top", help="表示するシナリオの数")] = 20,
+    output: Annotated[
+        Optional[str], typer.Option("-o", "--output", help="選択率の表の出力ファイルパス（.csv / .xlsx / .parquet）")
+    ] = None,
+):
+    """推定した選好を合成母集団に当てはめ、政策シナリオごとの選択率を全体・セグメント別に求める"""
+    from lib.simulation import PolicyModel, count_profiles, format_summary, load_scenarios
+    from lib.simulation import simulate as run_simulation
+
+    try:
+        config = ConfigLoader.load("configs/" + config_name)
+        settings = config.simulation
+        policy = PolicyModel.from_file(path, model or settings.model)
+        scenarios = load_scenarios(settings.baseline, settings.scenarios, settings.grid)
+    except (FileNotFoundError, ValueError) as e:
+        typer.echo(f"エラー: {e}", err=True)
+        raise typer.Exit(1) from None
+    if not scenarios:
+        typer.echo("エラー: シナリオがありません（simulation.scenarios_file を確認してください）", err=True)
+        raise typer.Exit(1)
+
+    columns = list(dict.fromkeys([*policy.source_columns(settings.population_columns), *settings.segments]))
+    chunks = simulation_chunks(population_path, columns, count, seed, workers)
+    typer.echo(f"母集団を集計中... (シナリオ={len(scenarios):,}, モデル={policy.kind})")
+    table = run_simulation(
+        policy,
+        settings.baseline,
+        scenarios,
+        count_profiles(chunks, columns),
+        column_map=settings.population_columns,
+        segments=settings.segments,
+    )
+    for line in format_summary(table, top=top):
+        typer.echo(line)
+
+    if output:
+        write_table(table, output)
+        typer.echo(f"\n出力: {output}")
+
+
+def simulation_chunks(
+    population_path: str | None, columns: list[str], count: int, seed: int, workers: int
+) -> "Iterable[pd.DataFrame]":
+    """母集団のチャンクを、ファイルがあれば必要なカラムだけ読み、なければ生成する"""
+    if population_path:
+        from lib.simulation import iter_population_file
+
+        if not Path(population_path).exists():
+            typer.echo(f"エラー: 母集団が見つかりません: {population_path}", err=True)
+            raise typer.Exit(1)
+        return iter_population_file(population_path, [*columns, "年齢"])
+
+    from lib.population import iter_population_chunks
+
+    return iter_population_chunks(count, seed=seed, workers=workers)
+
+
+@app.command()
+def themes(
+    path: Annotated[str, typer.Argument(help="DCE回答の出力ファイル")],
+    config_name: Annotated[str, typer.Option("-c", "--config", help="設定ディレクトリ")] = "v1_dce",
+    n_themes: Annotated[Optional[int], typer.Option("-k", "--themes", help="テーマ数（既定: themes.n_themes）")] = None,
+    seed: Annotated[int, typer.Option("-s", "--seed", help="k-means の初期値・ミニバッチの乱数シード")] = 42,
+    output: Annotated[
+        Optional[str], typer.Option("-o", "--output", help="テーマの割合の表の出力ファイルパス（.csv / .xlsx / .parquet）")
+    ] = None,
+    assignments: Annotated[
+        Optional[str], typer.Option("--assignments", help="理由文ごとのテーマの出力ファイルパス（.csv / .xlsx / .parquet）")
+    ] = None,
+):
+    """ChoiceN.reason を文字n-gramの TF-IDF とミニバッチ k-means でテーマに分け、選択・属性の水準ごとの割合を求める"""
+    from lib.output import read_output
+    from lib.themes import cluster_reasons, format_report, reason_records, theme_shares
+
+    try:
+        config = ConfigLoader.load("configs/" + config_name)
+        records = reason_records(read_output(path), config.choice_sets)
+    except (FileNotFoundError, ValueError) as e:
+        typer.echo(f"エラー: {e}", err=True)
+        raise typer.Exit(1) from None
+
+    settings = config.themes
+    attributes = [c for c in records.columns if c not in ("id", "task", "option", "reason")]
+    typer.echo(f"テーマ分類中... (理由文={len(records):,}件, テーマ={n_themes or settings.n_themes})")
+    try:
+        result = cluster_reasons(
+            records["reason"].tolist(),
+            k=n_themes or settings.n_themes,
+            ngrams=tuple(settings.ngrams),
+            n_features=settings.n_features,
+            batch_size=settings.batch_size,
+            epochs=settings.epochs,
+            keywords=settings.keywords,
+            seed=seed,
+        )
+    except ValueError as e:
+        typer.echo(f"エラー: {e}", err=True)
+        raise typer.Exit(1) from None
+
+    table = theme_shares(records, result, attributes)
+    for line in format_report(table, result):
+        typer.echo(line)
+
+    if output:
+        write_table(table, output)
+        typer.echo(f"\n出力: {output}")
+    if assignments:
+        write_table(records.assign(theme=result.labels + 1, similarity=result.similarity), assignments)
+        typer.echo(f"理由文ごとのテーマ: {assignments}")
+
+
+@app.command("prompt-report")
+def prompt_report(
+    config_name: Annotated[str, typer.Option("-c", "--config", help="設定ディレクトリ")] = "v1_nurse",
+    count: Annotated[int, typer.Option("-n", "--count", help="合計トークン数の見積もりに使う人数")] = 1000,
+    encoding: Annotated[str, typer.Option("--encoding", help="tiktoken のエンコーディング")] = "o200k_base",
+    generate_excel_path: Annotated[
+        Optional[str],
+        typer.Option("--generate-excel-path", help="基本属性のファイル（1行目を例に使う。v1_dce では v1_nurse の出力）"),
+    ] = None,
+    sheet_name: Annotated[str, typer.Option("--sheet-name", help="Excelのシート名")] = "Sheet1",
+):
+    """基本属性・選択肢の埋め込み形式ごとに、ユーザープロンプトのトークン数を比較する"""
+    from lib.prompt_format import count_tokens, format_report
+    from lib.sampling import iter_nurse_data_from_excel, sample_nurse_row
+
+    try:
+        config = ConfigLoader.load("configs/" + config_name)
+        # 生成時に --generate-excel-path で読み込むファイルがあれば、その1行目を基本属性の例にする
+        if generate_excel_path:
+            profile = next(iter_nurse_data_from_excel(generate_excel_path, sheet_name=sheet_name, n=1), None)
+            if profile is None:
+                raise ValueError(f"{generate_excel_path} にデータ行がありません")
+        else:
+            profile = sample_nurse_row(config.sampling.seed, 1)
+    except (FileNotFoundError, ValueError) as e:
+        typer.echo(f"エラー: {e}", err=True)
+        raise typer.Exit(1) from None
+
+    rows = format_report(config.user_prompt, config.choice_sets, profile, encoding=encoding)
+    # 選択肢を埋め込まないテンプレートでは、選択肢の形式は json の行だけになる
+    choice_format = config.prompt.choice_format if "{choice_sets}" in config.user_prompt else "json"
+    current = next(
+        r for r in rows if (r["profile_format"], r["choice_format"]) == (config.prompt.profile_format, choice_format)
+    )
+    system_tokens, exact = count_tokens(config.system_prompt, encoding)
+    method = f"tiktoken {encoding}" if exact else "概算（tiktoken 未インストール）"
+
+    source = generate_excel_path or "サンプリングした基本属性"
+    typer.echo(f"ユーザープロンプト1人分のトークン数（{method}、基本属性 {len(profile)} 項目: {source}、* は現在の設定）")
+    typer.echo(f"{'基本属性':<8}{'選択肢':<10}{'文字数':>8}{'トークン':>8}{'削減率':>8}{f'{count:,}人分':>14}")
+    for row in rows:
+        mark = "*" if row is current else " "
+        saving = round(1 - row["tokens"] / current["tokens"], 2) + 0.0
+        typer.echo(
+            f"{mark}{row['profile_format']:<10}{row['choice_format']:<12}{row['chars']:>10,}{row['tokens']:>10,}"
+            f"{saving:>10.0%}{row['tokens'] * count:>16,}"
+        )
+    typer.echo(f"システムプロンプト: {system_tokens:,} トークン（形式によらず共通）")
+
+
+@app.command()
+def serve(
+    host: Annotated[str, typer.Option(help="待ち受けアドレス")] = "127.0.0.1",
+    port: Annotated[int, typer.Option(help="待ち受けポート")] = 8765,
+):
+    """LLMクライアントを使い回す常駐サーバーを起動する（generate --server から利用）"""
+    from lib.server import GenerationServer
+
+    with GenerationServer(host, port) as server:
+        typer.echo(f"サーバーを起動しました: {host}:{port}（Ctrl+Cで終了）")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            typer.echo("サーバーを終了します")
+
+
 @app.command("list")
 def list_configs():
     """利用可能な設定一覧を表示"""